@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+from array import array
+from operator import itemgetter
+
+from .group import InvalidResultsException
+from .utils import JoustException, GoalScore, TwoPoints, WINNERS
+
+
+class CompactMatchTable(object):
+    """A table with the same interface as MatchTable that stores everything in arrays.
+
+    Team identifiers are mapped to dense ints (their position in group), fixtures and results are stored in arrays
+    indexed by a fixture id. Instead of a points dictionary the table counts wins, draws and losses for each team,
+    points are computed from these counts (win * wins + draw * draws + lose * losses). Thus win, draw and lose can be
+    ints or TwoPoints.
+
+    Only the winner and the scores (see MatchResult.scores) of a result are stored, not the result object itself.
+    This makes the table useful for very large leagues, for small tables MatchTable is more flexible.
+
+    Args:
+        group: A list of unique team identifiers.
+        matches_tuples: An iterable of pairs (team_one, team_two), the fixtures of the table.
+        win: The amount of points awarded if a team wins.
+        draw: The amount of points awarded to both teams on a draw.
+        lose: The amount of points awarded to the loser team.
+        cmp_class: The MatchResult class used to parse strings, defaults to GoalScore.
+
+    Attributes:
+        team_ids: List of all team identifiers, the int of a team is its position in this list.
+        team_index: Dictionary mapping team identifiers to ints.
+        fixture_one: Array of ints, the first team of each fixture.
+        fixture_two: Array of ints, the second team of each fixture.
+        results: Array of winner codes (see utils.WINNERS) for each fixture, -1 if no result is set.
+        score_one: Array of ints, the score of the first team of each fixture (if results[i] != -1).
+        score_two: Array of ints, the score of the second team of each fixture (if results[i] != -1).
+        wins: Array of ints, the number of wins of each team.
+        draws: Array of ints, the number of draws of each team.
+        losses: Array of ints, the number of losses of each team.
+    """
+
+    def __init__(self, group, matches_tuples, win, draw, lose, cmp_class=None):
+        if cmp_class is None:
+            cmp_class = GoalScore
+        self.cmp_class = cmp_class
+        self.win, self.draw, self.lose = win, draw, lose
+        self.group = group
+        self.team_ids = list(group)
+        self.team_index = {team: i for i, team in enumerate(self.team_ids)}
+        n = len(self.team_ids)
+        self.fixture_one = array('l')
+        self.fixture_two = array('l')
+        self.fixture_index = dict()
+        self.results = array('b')
+        self.score_one = array('q')
+        self.score_two = array('q')
+        self.wins = array('l', bytes(n * array('l').itemsize))
+        self.draws = array('l', self.wins)
+        self.losses = array('l', self.wins)
+        for first, second in matches_tuples:
+            self.add_match(first, second)
+
+    def _team(self, team):
+        try:
+            return self.team_index[team]
+        except KeyError:
+            raise JoustException('Invalid team name "%s"' % str(team))
+
+    def _fixture(self, team_one, team_two):
+        i, j = self._team(team_one), self._team(team_two)
+        fixture = self.fixture_index.get(i * len(self.team_ids) + j)
+        if fixture is None:
+            raise JoustException('Invalid match: "%s vs %s"' % (str(team_one), str(team_two)))
+        return fixture
+
+    def add_match(self, team_one, team_two):
+        """Adds a fixture (without a result) if it doesn't exist yet.
+
+        Args:
+            team_one: Identifier of the first team.
+            team_two: Identifier of the second team.
+
+        Returns:
+            The fixture id.
+
+        Raises:
+            JoustException: If a team doesn't exist.
+        """
+        i, j = self._team(team_one), self._team(team_two)
+        key = i * len(self.team_ids) + j
+        fixture = self.fixture_index.get(key)
+        if fixture is None:
+            fixture = len(self.results)
+            self.fixture_index[key] = fixture
+            self.fixture_one.append(i)
+            self.fixture_two.append(j)
+            self.results.append(-1)
+            self.score_one.append(0)
+            self.score_two.append(0)
+        return fixture
+
+    def _count(self, i, j, code, by):
+        if code == 0:
+            self.draws[i] += by
+            self.draws[j] += by
+        elif code == 1:
+            self.wins[i] += by
+            self.losses[j] += by
+        else:
+            self.losses[i] += by
+            self.wins[j] += by
+
+    def _set_result(self, fixture, code, first, second):
+        i, j = self.fixture_one[fixture], self.fixture_two[fixture]
+        old = self.results[fixture]
+        if old >= 0:
+            self._count(i, j, old, -1)
+        if code >= 0:
+            self._count(i, j, code, 1)
+        self.results[fixture] = code
+        self.score_one[fixture] = first
+        self.score_two[fixture] = second
+
+    def set_match(self, team_one, team_two, entry):
+        """Sets the result of a match, the counts of both teams are updated.
+
+        Args:
+            team_one: Identifier of the first team s.t. (team_one, team_two) is a valid fixture.
+            team_two: Identifier of the second team s.t. (team_one, team_two) is a valid fixture.
+            entry: The entry implementing MatchComparator or None to remove a result.
+
+        Raises:
+            JoustException: If teams are invalid.
+        """
+        fixture = self._fixture(team_one, team_two)
+        if entry is None:
+            self._set_result(fixture, -1, 0, 0)
+            return
+        scores = entry.scores()
+        if scores is None:
+            scores = 0, 0
+        self._set_result(fixture, WINNERS.index(entry.winner()), scores[0], scores[1])
+
+    def set_match_from_string(self, team_one, team_two, s):
+        """Parses s with the parse method of cmp_class and sets the result, see set_match.
+
+        Raises:
+            JoustException: If teams are invalid or if there is a syntax error in s.
+        """
+        entry = self.cmp_class.parse(s)
+        self.set_match(team_one, team_two, entry)
+
+    def set_matches_from_column(self, pairs, column):
+        """Sets many results from a column returned by the parse_many method of cmp_class, either all or none.
+
+        The results are copied from the arrays of the column, no result objects are created.
+
+        Args:
+            pairs: An iterable of tuples (team_one, team_two), the i-th pair gets the result of row i of the column.
+            column: A ResultColumn as returned by parse_many, must have the same length as pairs.
+
+        Raises:
+            InvalidResultsException: If a row of the column is invalid or if a pair is invalid, no result is applied.
+        """
+        errors = [(i, JoustException('Invalid result in row %d' % i)) for i in column.invalid]
+        fixtures = array('l')
+        for i, pair in enumerate(pairs):
+            fixture = -1
+            try:
+                team_one, team_two = pair
+                fixture = self._fixture(team_one, team_two)
+            except (TypeError, ValueError):
+                errors.append((i, JoustException('Invalid row "%s"' % str(pair))))
+            except JoustException as e:
+                errors.append((i, e))
+            fixtures.append(fixture)
+        if len(fixtures) != len(column):
+            errors.append((min(len(fixtures), len(column)), JoustException(
+                'Got %d pairs but %d results' % (len(fixtures), len(column)))))
+        if errors:
+            errors.sort(key=itemgetter(0))
+            raise InvalidResultsException(errors)
+        for fixture, code, first, second in zip(fixtures, column.winners(), column.first, column.second):
+            self._set_result(fixture, code, first, second)
+
+    def get_scores(self, team_one, team_two):
+        """Returns the stored scores (first, second) of a match or None if no result is set.
+
+        Raises:
+            JoustException: If teams are invalid.
+        """
+        fixture = self._fixture(team_one, team_two)
+        if self.results[fixture] < 0:
+            return None
+        return self.score_one[fixture], self.score_two[fixture]
+
+    def compute_ranking(self):
+        """Recomputes the win, draw and loss counts from the stored results.
+        """
+        n = len(self.team_ids)
+        self.wins = array('l', bytes(n * self.wins.itemsize))
+        self.draws = array('l', self.wins)
+        self.losses = array('l', self.wins)
+        for i, j, code in zip(self.fixture_one, self.fixture_two, self.results):
+            if code >= 0:
+                self._count(i, j, code, 1)
+
+    def point_values(self):
+        """Returns a list containing the points of each team (in the order of team_ids)."""
+        win, draw, lose = self.win, self.draw, self.lose
+        return [win * w + draw * d + lose * l for w, d, l in zip(self.wins, self.draws, self.losses)]
+
+    @property
+    def points(self):
+        """A dictionary mapping each team identifier to its points, computed on each access."""
+        return dict(zip(self.team_ids, self.point_values()))
+
+    def sort_ranking(self):
+        """Sorts the teams according to their points, see Table.sort_ranking.
+
+        Returns:
+            A list of tuples (team_identifier, team_points) sorted according to team_points (highest points first).
+        """
+        ranking = list(zip(self.team_ids, self.point_values()))
+        ranking.sort(key=itemgetter(1, 0), reverse=True)
+        return ranking
+
+    def compute_ranks(self):
+        """Sorts the teams and divides them into ranks, see Table.compute_ranks.
+
+        Returns:
+            A list of tuples (points, [team1, ..., teamK]).
+        """
+        ranks = []
+        for value, r in itertools.groupby(self.sort_ranking(), key=itemgetter(1)):
+            ranks.append((value, [e[0] for e in r]))
+        return ranks
+
+
+class CompactThreePointsTable(CompactMatchTable):
+    """The compact version of ThreePointsTable.
+    """
+    def __init__(self, group, matches_tuples, win=3, draw=1, lose=0, cmp_class=None):
+        super().__init__(group, matches_tuples, win, draw, lose, cmp_class=cmp_class)
+
+
+class CompactTwoPointsTable(CompactMatchTable):
+    """The compact version of TwoPointsTable.
+    """
+    def __init__(self, group, matches_tuples, win=None, draw=None, lose=None, cmp_class=None):
+        if win is None:
+            win = TwoPoints(2, 0)
+        if draw is None:
+            draw = TwoPoints(1, 1)
+        if lose is None:
+            lose = TwoPoints(0, 2)
+        super().__init__(group, matches_tuples, win, draw, lose, cmp_class=cmp_class)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Assigning the matches of all groups to courts and time slots.
+
+Time is divided into slots of equal length, a match occupies a court for one or more consecutive slots. The schedule is
+computed with list scheduling: whenever a court is free the waiting match with the highest priority that may start is
+assigned to it. The priority of a match is the remaining length of its group (the sum of the lengths of its remaining
+rounds), so long groups start early. Afterwards the priorities of groups finishing last are changed at random (local
+search) as long as this doesn't increase the makespan.
+"""
+
+import heapq
+import math
+import random
+
+from .utils import JoustException
+
+
+class CourtSchedule(object):
+    """The result of schedule_courts.
+
+    Attributes:
+        assignments: A list of tuples (group, round, match, slot, court), sorted by slot and court. group, round and
+            match are the indices in the rounds given to schedule_courts, slot is the first slot of the match.
+        makespan: The number of slots required to play all matches.
+        lower_bound: A lower bound for the makespan of any valid schedule.
+    """
+    def __init__(self, assignments, makespan, lower_bound):
+        self.assignments = assignments
+        self.makespan = makespan
+        self.lower_bound = lower_bound
+
+    def __len__(self):
+        return len(self.assignments)
+
+
+def _durations(rounds, duration):
+    # returns a list with the duration of the matches of each group
+    if isinstance(duration, int):
+        return [duration] * len(rounds)
+    if len(duration) != len(rounds):
+        raise JoustException('Got %d durations for %d groups' % (len(duration), len(rounds)))
+    return list(duration)
+
+
+class _Jobs(object):
+    # all matches with their precedence constraints, shared by all runs of the list scheduler
+
+    def __init__(self, rounds, durations, rest, round_barrier):
+        self.group, self.round, self.match, self.teams, self.duration = [], [], [], [], []
+        # the jobs of each round of each group
+        self.round_jobs = []
+        # for each job the previous job of each of its teams (or -1)
+        self.previous = []
+        last_job = dict()
+        for g, group_rounds in enumerate(rounds):
+            if durations[g] <= 0:
+                raise JoustException('Durations must be positive')
+            jobs_of_group = []
+            for r, matches in enumerate(group_rounds):
+                jobs = []
+                for m, (team_one, team_two) in enumerate(matches):
+                    job = len(self.group)
+                    self.group.append(g)
+                    self.round.append(r)
+                    self.match.append(m)
+                    self.teams.append((team_one, team_two))
+                    self.duration.append(durations[g])
+                    self.previous.append((last_job.get(team_one, -1), last_job.get(team_two, -1)))
+                    last_job[team_one] = last_job[team_two] = job
+                    jobs.append(job)
+                jobs_of_group.append(jobs)
+            self.round_jobs.append(jobs_of_group)
+        self.rest = rest
+        self.round_barrier = round_barrier
+        # remaining length of each group from each round on (a lower bound if each round is played at once)
+        self.tail = []
+        for g, group_rounds in enumerate(self.round_jobs):
+            tail = [0] * (len(group_rounds) + 1)
+            for r in range(len(group_rounds) - 1, -1, -1):
+                tail[r] = tail[r + 1] + (durations[g] if group_rounds[r] else 0)
+            self.tail.append(tail)
+        self.next_jobs = [[] for _ in self.group]
+        for job, previous in enumerate(self.previous):
+            for p in set(previous):
+                if p >= 0:
+                    self.next_jobs[p].append(job)
+
+    def __len__(self):
+        return len(self.group)
+
+    def lower_bound(self, num_courts):
+        if not self.group:
+            return 0
+        bound = math.ceil(sum(self.duration) / num_courts)
+        team_load = dict()
+        for job, teams in enumerate(self.teams):
+            for team in teams:
+                team_load[team] = team_load.get(team, -self.rest) + self.duration[job] + self.rest
+        bound = max(bound, max(team_load.values()))
+        if self.round_barrier:
+            bound = max(bound, max(tail[0] for tail in self.tail))
+        return bound
+
+    def schedule(self, num_courts, boost):
+        # list scheduling, returns (start times, courts, makespan)
+        n = len(self.group)
+        start = [-1] * n
+        court_of = [-1] * n
+        ready = [0] * n
+        missing = [sum(1 for p in set(previous) if p >= 0) for previous in self.previous]
+        round_missing = [[len(jobs) for jobs in group_rounds] for group_rounds in self.round_jobs]
+        round_end = [[0] * len(group_rounds) for group_rounds in self.round_jobs]
+        # waiting: jobs whose predecessors have all been scheduled
+        waiting = []
+        if self.round_barrier:
+            for g in range(len(self.round_jobs)):
+                self._open_round(g, 0, 0, ready, waiting)
+        else:
+            waiting = [job for job, m in enumerate(missing) if m == 0]
+        courts = [(0, c) for c in range(num_courts)]
+        heapq.heapify(courts)
+        priority = [(-(boost[g] + self.tail[g][r]), g, r, m)
+                    for g, r, m in zip(self.group, self.round, self.match)]
+        team_ready = dict()
+        scheduled = 0
+        makespan = 0
+        time = 0
+        while scheduled < n:
+            free = []
+            while courts and courts[0][0] <= time:
+                free.append(heapq.heappop(courts)[1])
+            free.sort()
+            if free:
+                candidates = [job for job in waiting if ready[job] <= time]
+                candidates.sort(key=priority.__getitem__)
+                busy = set()
+                for job in candidates:
+                    if not free:
+                        break
+                    team_one, team_two = self.teams[job]
+                    if team_one in busy or team_two in busy:
+                        continue
+                    if team_ready.get(team_one, 0) > time or team_ready.get(team_two, 0) > time:
+                        continue
+                    busy.add(team_one)
+                    busy.add(team_two)
+                    court = free.pop(0)
+                    end = time + self.duration[job]
+                    start[job], court_of[job] = time, court
+                    heapq.heappush(courts, (end, court))
+                    team_ready[team_one] = team_ready[team_two] = end + self.rest
+                    makespan = max(makespan, end)
+                    scheduled += 1
+                    self._release(job, end, missing, ready, round_missing, round_end, waiting)
+                waiting = [job for job in waiting if start[job] < 0]
+            for court in free:
+                heapq.heappush(courts, (time, court))
+            # the next time something can change: a court gets free or a waiting job gets ready
+            events = [courts[0][0]] if courts[0][0] > time else []
+            for job in waiting:
+                team_one, team_two = self.teams[job]
+                t = max(ready[job], team_ready.get(team_one, 0), team_ready.get(team_two, 0))
+                if t > time:
+                    events.append(t)
+            if not events:
+                if scheduled < n and not waiting:
+                    raise JoustException('Invalid schedule: no match can be played')
+                events.append(time + 1)
+            time = min(events)
+        return start, court_of, makespan
+
+    def _open_round(self, g, r, time, ready, waiting):
+        # the jobs of the first non empty round >= r of group g may start at time
+        group_rounds = self.round_jobs[g]
+        while r < len(group_rounds) and not group_rounds[r]:
+            r += 1
+        if r < len(group_rounds):
+            for job in group_rounds[r]:
+                ready[job] = time
+                waiting.append(job)
+
+    def _release(self, job, end, missing, ready, round_missing, round_end, waiting):
+        g, r = self.group[job], self.round[job]
+        if self.round_barrier:
+            round_missing[g][r] -= 1
+            round_end[g][r] = max(round_end[g][r], end)
+            if round_missing[g][r] == 0:
+                self._open_round(g, r + 1, round_end[g][r], ready, waiting)
+        else:
+            for next_job in self.next_jobs[job]:
+                missing[next_job] -= 1
+                ready[next_job] = max(ready[next_job], end)
+                if missing[next_job] == 0:
+                    waiting.append(next_job)
+
+
+def schedule_courts(rounds, num_courts, duration=1, rest=0, round_barrier=True, iterations=100, seed=None):
+    """Assigns each match of all groups a time slot and a court.
+
+    The schedule satisfies the following constraints: A court is used by at most one match at a time, a team plays at
+    most one match at a time and has rest free slots between two matches, and the rounds of each group are played in
+    order. If round_barrier is True a round of a group starts only when all matches of the previous round are finished,
+    otherwise only the matches of each team are played in the order of the rounds.
+
+    A first schedule is computed with list scheduling, then the priorities of the groups are changed randomly (local
+    search) for the given number of iterations. The search stops early if the makespan reaches a lower bound.
+
+    Args:
+        rounds: For each group a list of rounds, each round a list of pairs (team_one, team_two), for example the
+            rounds attribute of a GroupPhase. A team must not be part of more than one group.
+        num_courts: The number of available courts.
+        duration: The number of slots a match takes, either an int or a list with the duration for each group.
+        rest: The number of slots a team must not play after a match.
+        round_barrier: See above.
+        iterations: The number of local search steps.
+        seed: The seed of the random generator used by the local search.
+
+    Returns:
+        A CourtSchedule.
+
+    Raises:
+        JoustException: If num_courts, a duration or rest is invalid.
+    """
+    if num_courts <= 0:
+        raise JoustException('At least one court is required')
+    if rest < 0:
+        raise JoustException('rest must not be negative')
+    jobs = _Jobs(rounds, _durations(rounds, duration), rest, round_barrier)
+    lower_bound = jobs.lower_bound(num_courts)
+    boost = [0] * len(rounds)
+    best = jobs.schedule(num_courts, boost)
+    rnd = random.Random(seed)
+    step = max(jobs.duration) if len(jobs) else 1
+    for _ in range(iterations):
+        if best[2] <= lower_bound or not rounds:
+            break
+        start, _, makespan = best
+        # groups with a match ending at the makespan are critical
+        critical = sorted({jobs.group[job] for job in range(len(jobs)) if start[job] + jobs.duration[job] == makespan})
+        candidate = list(boost)
+        candidate[rnd.choice(critical)] += step * rnd.randint(1, 3)
+        other = rnd.randrange(len(rounds))
+        candidate[other] -= step * rnd.randint(0, 1)
+        result = jobs.schedule(num_courts, candidate)
+        if result[2] <= makespan:
+            best, boost = result, candidate
+    start, court_of, makespan = best
+    assignments = [(jobs.group[job], jobs.round[job], jobs.match[job], start[job], court_of[job])
+                   for job in range(len(jobs))]
+    assignments.sort(key=lambda a: (a[3], a[4]))
+    return CourtSchedule(assignments, makespan, lower_bound)
@@ -17,7 +17,7 @@
 
 from .tournament import GroupPhase, KOPhase, Tournament, TournamentPhase
 from .group import ThreePointsTable
-from .utils import next_power_of_two
+from .ko import seeded_leaves
 
 
 class RRTournament(Tournament):
@@ -37,10 +37,19 @@ class RRAndKO(Tournament):
         self.ko_phase = None
         self.ko_phase_key = None
 
-    # def make_ko(self):
-    #     num_teams = 2 * len(self.group_phase.groups)
-    #     num_ko_teams = next_power_of_two(num_teams)
-    #     num_byes = num_ko_teams - num_teams
-    #     common = min(num_teams, )
-    #     i, j = 0, 0
-    #     pass
+    def make_ko(self):
+        """Creates the KO phase from the group phase and adds it to the tournament.
+
+        The two best teams of each group qualify, the group winners are seeded first (in the order of the groups),
+        then the runners-up. The bracket is filled with byes for the best teams if the number of qualified teams is
+        not a power of two.
+
+        Returns:
+            The new KOPhase.
+        """
+        rankings = [table.sort_ranking() for table in self.group_phase.tables]
+        qualified = [ranking[0][0] for ranking in rankings if ranking]
+        qualified.extend(ranking[1][0] for ranking in rankings if len(ranking) > 1)
+        self.ko_phase = KOPhase(seeded_leaves(qualified))
+        self.ko_phase_key = self.add_phase(TournamentPhase(self.ko_phase))
+        return self.ko_phase
@@ -14,11 +14,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import itertools
 import random
+from array import array
 from operator import itemgetter
 
-from .utils import TwoPoints, JoustException, GoalScore
+from .utils import TwoPoints, JoustException, GoalScore, MatchResult, WINNERS
+
+
+class InvalidResultsException(JoustException):
+    """Raised by the bulk methods (for example MatchTable.set_matches) if at least one row is invalid.
+
+    Attributes:
+        errors: A list of tuples (row_index, exception) for each invalid row, row_index is the position of the row in
+            the input.
+    """
+    def __init__(self, errors):
+        super().__init__('%d invalid result(s), first error in row %d: %s' % (len(errors), errors[0][0], errors[0][1]))
+        self.errors = errors
 
 
 def get_group_num(group_size, num_participants, additional_group=True):
@@ -76,7 +90,21 @@ def group_sizes(group_size, num_participants, additional_group=True):
         yield rest
 
 
-def groups_by_size(group_size, participants, shuffle=False, additional_group=True):
+def _snake(participants, sizes):
+    # deals the participants to the groups in serpentine order: 1, ..., n, n, ..., 1, 1, ..., n and so on
+    result = [[] for _ in sizes]
+    order = [i for i, size in enumerate(sizes) if size > 0]
+    participants = iter(participants)
+    forward = True
+    while order:
+        for i in (order if forward else reversed(order)):
+            result[i].append(next(participants))
+        order = [i for i in order if len(result[i]) < sizes[i]]
+        forward = not forward
+    return result
+
+
+def groups_by_size(group_size, participants, shuffle=False, additional_group=True, seeding=None):
     """Create a distribution of the participants into groups given the group size.
 
     The participants are divided into groups, the number of groups and group size depends on group_sizes which
@@ -90,6 +118,9 @@ def groups_by_size(group_size, participants, shuffle=False, additional_group=Tru
             list is used. That is if the input is [1, 2, 3, 4] and groups of size 2 are created the default distribution
             is [[1, 2], [3, 4]]. If shuffle is true the order is random.
         additional_group: True if an additional group should be created for remaining teams.
+        seeding: A function that returns the participants ordered by strength (strongest first), for example the
+            seeding method of a rating (see the rating module). The ordered participants are dealt to the groups in
+            serpentine order so that all groups are equally strong. If given shuffle is ignored.
 
     Returns:
         A list of list of identifiers. The participants are divided into groups and each list in the result describes
@@ -98,6 +129,8 @@ def groups_by_size(group_size, participants, shuffle=False, additional_group=Tru
     if group_size <= 0:
         return []
     num_participants = len(participants)
+    if seeding is not None:
+        return _snake(seeding(participants), list(group_sizes(group_size, num_participants, additional_group)))
     if shuffle:
         # don't use shuffle to avoid changing the input
         participants = random.sample(participants, num_participants)
@@ -113,7 +146,7 @@ def groups_by_size(group_size, participants, shuffle=False, additional_group=Tru
     return result
 
 
-def groups_by_number(num_groups, participants, shuffle=False):
+def groups_by_number(num_groups, participants, shuffle=False, seeding=None):
     """Create a distribution of the participants into groups given the group size.
 
     participants can be a list of anything that can be used in dictionaries and compared with == and !=, like strings
@@ -126,6 +159,7 @@ def groups_by_number(num_groups, participants, shuffle=False):
         shuffle: If true the participants is shuffled before distributing into groups, otherwise the order from the
             list is used. That is if the input is [1, 2, 3, 4] and groups of size 2 are created the default distribution
             is [[1, 2], [3, 4]]. If shuffle is true the order is random.
+        seeding: A function that returns the participants ordered by strength, see groups_by_size.
 
     Returns:
          A list of list of identifiers. The participants are divided into groups and each list in the result describes
@@ -138,7 +172,8 @@ def groups_by_number(num_groups, participants, shuffle=False):
         group_size,
         participants,
         shuffle=shuffle,
-        additional_group=False)
+        additional_group=False,
+        seeding=seeding)
 
 
 # TODO document that round_robin is gone
@@ -186,6 +221,25 @@ def all_matches_bidirect(teams):
         yield team_a, team_b
         yield team_b, team_a
 
+def size_only_scheduler(scheduler):
+    """Marks a scheduler whose schedule depends on nothing but the number of teams.
+
+    The schedules of such schedulers are cached by GroupPhase (see schedule_template). round_robin_circle and
+    berger_table are marked, the function can be used as a decorator for other schedulers.
+
+    Returns:
+        The scheduler itself.
+    """
+    scheduler.size_only = True
+    return scheduler
+
+
+def is_size_only_scheduler(scheduler):
+    """Returns True if scheduler has been marked with size_only_scheduler."""
+    return getattr(scheduler, 'size_only', False)
+
+
+@size_only_scheduler
 def round_robin_circle(teams):
     """Returns an iterator over possible rounds (each player plays once against each other player).
 
@@ -237,6 +291,79 @@ def round_robin_circle(teams):
         next = _rotate_round_robin(top, bottom)
 
 
+def _circle_positions(teams):
+    """Returns the list of positions used by the circle method.
+
+    The list has even length, positions are filled with the teams and None for a bye (if the number of teams is odd).
+    In round k the team at position 0 is fixed, all other teams have moved k positions to the right (cyclic, ignoring
+    position 0). Pairings are then formed from positions i and m - 1 - i (where m is the length).
+    """
+    n = len(teams)
+    if n % 2 != 0:
+        return list(teams[:n // 2]) + [None] + list(teams[n // 2:])
+    return list(teams)
+
+
+def round_robin_circle_round(teams, k):
+    """Returns round k (starting with 0) of round_robin_circle without computing the other rounds.
+
+    Args:
+        teams: A list of unique team identifiers.
+        k: The round number, 0 <= k < number of rounds.
+
+    Returns:
+        The list of matches in round k, exactly as the k-th list yielded by round_robin_circle.
+
+    Raises:
+        JoustException: If k is not a valid round number.
+    """
+    positions = _circle_positions(teams)
+    m = len(positions)
+    if len(teams) < 2 or not 0 <= k < m - 1:
+        raise JoustException('Invalid round %d' % k)
+    result = []
+    for i in range(m // 2):
+        team_one = positions[i] if i == 0 else positions[1 + (i - 1 - k) % (m - 1)]
+        team_two = positions[1 + (m - 2 - i - k) % (m - 1)]
+        if team_one is not None and team_two is not None:
+            result.append((team_one, team_two))
+    return result
+
+
+def round_robin_circle_fixtures(teams, team):
+    """Returns all matches of a team as scheduled by round_robin_circle without computing the other matches.
+
+    Args:
+        teams: A list of unique team identifiers.
+        team: The team identifier.
+
+    Returns:
+        A list of tuples (k, match) where match is the match of team in round k. Rounds in which the team has a bye
+        are skipped.
+
+    Raises:
+        JoustException: If team is not in teams.
+    """
+    positions = _circle_positions(teams)
+    if team not in positions:
+        raise JoustException('Invalid team name "%s"' % str(team))
+    q = positions.index(team)
+    m = len(positions)
+    half = m // 2
+    result = []
+    for k in range(m - 1):
+        p = 0 if q == 0 else 1 + (q - 1 + k) % (m - 1)
+        other = m - 1 - p
+        other_team = positions[0] if other == 0 else positions[1 + (other - 1 - k) % (m - 1)]
+        if other_team is None:
+            continue
+        if p < half:
+            result.append((k, (team, other_team)))
+        else:
+            result.append((k, (other_team, team)))
+    return result
+
+
 def _rotate_round_robin(top, bottom):
     """Performs the round robin rotation (circle) as proposed in
     https://en.wikipedia.org/wiki/Round-robin_tournament#Scheduling_algorithm
@@ -255,6 +382,7 @@ def _rotate_round_robin(top, bottom):
     return top_res, bottom_res
 
 
+@size_only_scheduler
 def berger_table(teams):
     """Returns an iterator over possible rounds (each player plays once against each other player).
 
@@ -300,13 +428,8 @@ def berger_table(teams):
     if n == 2:
         yield [(teams[0], teams[1])]
         return
-    if n % 2 != 0:
-        teams.append(None)
-        n += 1
-    init = []
-    for e1, e2 in zip(teams[:n//2], reversed(teams[n//2:])):
-        init.append(e1)
-        init.append(e2)
+    init = _berger_init(teams)
+    n = len(init)
     fixed = init[1]
     next = init[:]
     for _ in range(n-1):
@@ -320,6 +443,104 @@ def berger_table(teams):
         next = _rotate_berger(next, fixed)
 
 
+def _berger_init(teams):
+    """Returns the initial list of berger_table, consecutive entries form the matches of the first round.
+
+    A bye (None) is added for an odd number of teams, teams itself is not changed.
+    """
+    if len(teams) % 2 != 0:
+        teams = list(teams) + [None]
+    n = len(teams)
+    init = []
+    for e1, e2 in zip(teams[:n//2], reversed(teams[n//2:])):
+        init.append(e1)
+        init.append(e2)
+    return init
+
+
+def berger_table_round(teams, k):
+    """Returns round k (starting with 0) of berger_table without computing the other rounds.
+
+    In each round all entries of the list used by berger_table are shifted by n / 2 (modulo n - 1) where n is the
+    (even) number of entries, except for the fixed entry which swaps places in the first match. Thus the entry after k
+    rounds can be computed directly.
+
+    Args:
+        teams: A list of ints (team identifiers) or an int, see berger_table.
+        k: The round number, 0 <= k < number of rounds.
+
+    Returns:
+        The list of matches in round k, exactly as the k-th list yielded by berger_table.
+
+    Raises:
+        JoustException: If k is not a valid round number.
+    """
+    if type(teams) == int:
+        teams = list(range(1, teams + 1))
+    if len(teams) == 2 and k == 0:
+        return [(teams[0], teams[1])]
+    init = _berger_init(teams)
+    n = len(init)
+    if n < 4 or not 0 <= k < n - 1:
+        raise JoustException('Invalid round %d' % k)
+    shift = k * (n // 2)
+
+    def value(old):
+        return (old - 1 + shift) % (n - 1) + 1
+
+    fixed = init[1]
+    result = []
+    if fixed is not None:
+        if k % 2 == 0:
+            result.append((value(init[0]), fixed))
+        else:
+            result.append((fixed, value(init[0])))
+    for i in range(2, n, 2):
+        result.append((value(init[i]), value(init[i + 1])))
+    return result
+
+
+def berger_table_fixtures(teams, team):
+    """Returns all matches of a team as scheduled by berger_table without computing the other matches.
+
+    Args:
+        teams: A list of ints (team identifiers) or an int, see berger_table.
+        team: The team identifier.
+
+    Returns:
+        A list of tuples (k, match) where match is the match of team in round k. Rounds in which the team has a bye
+        are skipped.
+
+    Raises:
+        JoustException: If team is not in teams.
+    """
+    if type(teams) == int:
+        teams = list(range(1, teams + 1))
+    if team is None or team not in teams:
+        raise JoustException('Invalid team name "%s"' % str(team))
+    if len(teams) == 2:
+        return [(0, (teams[0], teams[1]))]
+    init = _berger_init(teams)
+    n = len(init)
+    fixed = init[1]
+    positions = {value: i for i, value in enumerate(init) if i != 1}
+    result = []
+    for k in range(n - 1):
+        shift = k * (n // 2)
+        if team == fixed:
+            other = (init[0] - 1 + shift) % (n - 1) + 1
+            result.append((k, (other, team) if k % 2 == 0 else (team, other)))
+            continue
+        i = positions[(team - 1 - shift) % (n - 1) + 1]
+        if i == 0:
+            if fixed is not None:
+                result.append((k, (team, fixed) if k % 2 == 0 else (fixed, team)))
+            continue
+        other = (init[i ^ 1] - 1 + shift) % (n - 1) + 1
+        result.append((k, (team, other) if i % 2 == 0 else (other, team)))
+    return result
+
+
 def _rotate_berger(l, fixed):
     result = []
     n = len(l)
@@ -346,6 +567,69 @@ def _rotate_berger(l, fixed):
     return result
 
 
+class ScheduleTemplate(object):
+    """A schedule (list of rounds) computed for the teams 0, ..., n - 1, stored as a flat array of indices.
+
+    Schedulers such as round_robin_circle and berger_table only depend on the number of teams, thus a template can be
+    computed once and then be applied to each group of the same size (see schedule_template).
+
+    Args:
+        rounds: An iterable of rounds, each round is a list of pairs of indices.
+
+    Attributes:
+        pairs: An array of ints, the index of team one and team two of each match (in this order).
+        round_ends: An array of ints, round i consists of the matches round_ends[i-1] (or 0) to round_ends[i] - 1.
+    """
+    def __init__(self, rounds):
+        self.pairs = array('l')
+        self.round_ends = array('l')
+        num_matches = 0
+        for r in rounds:
+            for first, second in r:
+                self.pairs.append(first)
+                self.pairs.append(second)
+                num_matches += 1
+            self.round_ends.append(num_matches)
+
+    def __len__(self):
+        return len(self.round_ends)
+
+    def apply(self, teams):
+        """Maps the template onto a list of teams.
+
+        Args:
+            teams: A list of unique team identifiers, must have the size the template was created for.
+
+        Returns:
+            A list of rounds, each round a list of tuples of team identifiers (like list(scheduler(teams))).
+        """
+        pairs = self.pairs
+        result = []
+        start = 0
+        for end in self.round_ends:
+            result.append([(teams[pairs[2 * i]], teams[pairs[2 * i + 1]]) for i in range(start, end)])
+            start = end
+        return result
+
+
+@functools.lru_cache(maxsize=128)
+def schedule_template(scheduler, n):
+    """Returns the (cached) ScheduleTemplate of scheduler for n teams.
+
+    The scheduler is called with the teams [1, ..., n] (berger_table requires this form), the result is stored with
+    indices 0, ..., n - 1. The most recently used templates are cached.
+
+    Args:
+        scheduler: A function that returns the rounds for a list of teams, for example round_robin_circle.
+        n: The number of teams.
+
+    Returns:
+        The ScheduleTemplate, it must not be changed.
+    """
+    rounds = scheduler(list(range(1, n + 1)))
+    return ScheduleTemplate([(first - 1, second - 1) for first, second in r] for r in rounds)
+
+
 class Table(object):
     """A class that connects teams to points and has methods to sort elements.
 
@@ -416,6 +700,20 @@ class Table(object):
             raise JoustException('Invalid team name "%s"' % str(team))
         self.points[team] += by
 
+    def decrease_points(self, team, by):
+        """Decrease the points for the specified team by the given value.
+
+        Args:
+            team: A team identifier.
+            by: Amount of points to decrease points by (short: self.points[team] -= by).
+
+        Raises:
+            JoustException: If the team doesn't exist in the points mapping.
+        """
+        if team not in self.points:
+            raise JoustException('Invalid team name "%s"' % str(team))
+        self.points[team] -= by
+
     def check_exists(self, *args):
         """Check if a team / a list of teams exist(s).
 
@@ -457,7 +755,8 @@ class Table(object):
 
         Returns:
             A list of tuples (points, [team1, ..., teamK]) where each entry describes all teams that achieved the
-            number of points. The ranks are sorted according to points, highest first.
+            number of points. The ranks are sorted according to points, highest first. Subclasses may divide teams
+            with the same points into several ranks (see MatchTable.compute_ranks).
         """
         ranking = self.sort_ranking()
         ranks = []
@@ -470,11 +769,12 @@ class MatchTable(Table):
     """A table that also stores a dictionary of matches.
 
     MatchTable introduces three important new methods: set_match_from_string that parses a score string of the form
-    "a:b" and adds the entry to the matches dictionary and then recomputes the whole ranking dictionary via the new
-    compute_ranking method. This way whenever the matches dict is changed (new result, update of a result) the whole
-    points are recomputed. This should be fine however. set_match does the same but without parsing the score from a
-    string. This is useful if matches should store not only scores (see GoalScore) but other types. The stored values
-    must implement MatchComparator. The win method is used to identify the winner.
+    "a:b" and adds the entry to the matches dictionary and then updates the points of both teams: The points of the
+    old result (if any) are removed and the points of the new result are added. compute_ranking recomputes the whole
+    points dictionary from the matches and can be used as a fallback or consistency check. set_match does the same
+    but without parsing the score from a string. This is useful if matches should store not only scores (see
+    GoalScore) but other types. The stored values must implement MatchComparator. The win method is used to identify the
+    winner.
 
     Args:
         group: A list of unique team identifiers.
@@ -488,17 +788,63 @@ class MatchTable(Table):
             An entry in matches could be of the following form: matches[("Team A", "Team B")] = (42, 24) meaning
             that Team A won with 42 to 24 (goals) againsgt team B. Team A will be awarded self.win points, Team B
             self.lose points (usually a decrease or neutral element).
+        criteria: A list of RankCriterion objects (for example GoalDifferenceCriterion) used in this order to rank teams
+            with the same points. Each change of a result is registered with all criteria, so sorting the ranking
+            doesn't iterate over the matches again (criteria that don't implement unregister_match are rebuilt from
+            all matches instead). With criteria compute_ranks puts teams into the same rank only if they're equal
+            according to all criteria.
+        head_to_head: If True compute_ranks ranks teams with the same points by a table of only their mutual matches
+            (see compute_ranks).
+        team_matches: Dictionary mapping each team to the set of its matches (keys in matches).
+        version: Incremented whenever a result changes.
+        team_versions: Dictionary mapping each team to the version of the last change of one of its results.
     """
     # TODO document cmp class, update the rest of the doc
-    def __init__(self, group, matches_tuples, win, draw, lose, cmp_class=None):
+    def __init__(self, group, matches_tuples, win, draw, lose, cmp_class=None, criteria=None, head_to_head=False):
         super().__init__(group)
         if cmp_class is None:
             cmp_class = GoalScore
+        if criteria is None:
+            criteria = []
         self.cmp_class = cmp_class
+        self.criteria = criteria
+        self.head_to_head = head_to_head
         self.win, self.draw, self.lose = win, draw, lose
         self.matches = dict()
+        self.team_matches = {team: set() for team in group}
+        self.version = 0
+        self.team_versions = {team: 0 for team in group}
+        # head to head rankings of tied teams by (teams, version of the teams)
+        self._head_to_head_cache = dict()
         for first, second in matches_tuples:
             self.matches[(first, second)] = None
+            self._index_match(first, second)
+
+    def _index_match(self, team_one, team_two):
+        self.team_matches[team_one].add((team_one, team_two))
+        self.team_matches[team_two].add((team_one, team_two))
+
+    def _touch(self, team_one, team_two):
+        # called when the result of a match changes
+        self.version += 1
+        self.team_versions[team_one] = self.team_versions[team_two] = self.version
+
+    def add_match(self, team_one, team_two):
+        """Adds a match (without a result) to the matches dictionary if it doesn't exist yet.
+
+        This way matches can be registered when they're known, for example after pairing a Swiss round.
+
+        Args:
+            team_one: Identifier of the first team.
+            team_two: Identifier of the second team.
+
+        Raises:
+            JoustException: If a team doesn't exist.
+        """
+        self.check_exists(team_one, team_two)
+        if (team_one, team_two) not in self.matches:
+            self.matches[(team_one, team_two)] = None
+            self._index_match(team_one, team_two)
 
     def _check_match_exists(self, *args):
         for t in args:
@@ -515,45 +861,103 @@ class MatchTable(Table):
             new_points[entry] = self.empty_value()
         # set self.points to new dict so we can use increase method
         self.points = new_points
+        # matches may have been changed directly
+        self.version += 1
+        self.team_versions = {team: self.version for team in self.points}
+        for criterion in self.criteria:
+            criterion.reset()
         for (team_one, team_two), entry in self.matches.items():
             if entry is None:
                 continue
-            cmp = entry.winner()
-            if cmp == 'draw':
-                # both get draw points
-                self.increase_points(team_one, self.draw)
-                self.increase_points(team_two, self.draw)
-            elif cmp == 'one':
-                # team one wins
-                self.increase_points(team_one, self.win)
-                self.increase_points(team_two, self.lose)
-            else:
-                # second team wins
-                assert cmp == 'two'
-                self.increase_points(team_one, self.lose)
-                self.increase_points(team_two, self.win)
+            points_one, points_two = self.match_points(entry.winner())
+            self.increase_points(team_one, points_one)
+            self.increase_points(team_two, points_two)
+            for criterion in self.criteria:
+                criterion.register_match(team_one, team_two, entry)
+
+    def _update_criteria(self, changes):
+        # registers the changes (team_one, team_two, old, new) with all criteria, criteria that can't remove results
+        # are rebuilt from the new results. If a criterion rejects a result all criteria are rebuilt from matches, so
+        # they remain consistent with the table
+        incremental = [criterion for criterion in self.criteria if criterion.can_unregister()]
+        rebuild = [criterion for criterion in self.criteria if not criterion.can_unregister()]
+        try:
+            for team_one, team_two, old, new in changes:
+                for criterion in incremental:
+                    if old is not None:
+                        criterion.unregister_match(team_one, team_two, old)
+                    if new is not None:
+                        criterion.register_match(team_one, team_two, new)
+            if rebuild:
+                matches = dict(self.matches)
+                matches.update(((team_one, team_two), new) for team_one, team_two, _, new in changes)
+                for criterion in rebuild:
+                    criterion.reset()
+                    for (team_one, team_two), entry in matches.items():
+                        if entry is not None:
+                            criterion.register_match(team_one, team_two, entry)
+        except JoustException:
+            self.compute_ranking()
+            raise
+
+    def match_points(self, cmp):
+        """Returns the points awarded to both teams given the winner of a match.
+
+        Args:
+            cmp: The winner as returned by MatchResult.winner, i.e. 'draw', 'one' or 'two'.
+
+        Returns:
+            A tuple (points_one, points_two) with the points for team one and team two.
+        """
+        if cmp == 'draw':
+            # both get draw points
+            return self.draw, self.draw
+        elif cmp == 'one':
+            # team one wins
+            return self.win, self.lose
+        else:
+            # second team wins
+            assert cmp == 'two'
+            return self.lose, self.win
 
     def set_match(self, team_one, team_two, entry):
         """The same as set_match_from_string but with explicit value (without parsing the score first). This way not
         only GoalScore objects can be used but everything implementing MatchComparator.
 
+        The points are not recomputed from scratch: The points of a previous result for this match (if any) are
+        subtracted and the points of the new result are added. compute_ranking can still be used to rebuild the whole
+        points dictionary.
+
         Args:
             team_one: Identifier of the first team s.t. (team_one, team_two) is a valid entry in the matches dict.
             team_two: Identifier of the second team s.t. (team_one, team_two) is a valid entry in the matches dict.
             entry. The entry to store for the match, must implement MatchComparator.
 
         Raises:
-            JoustException: If teams are invalid.
+            JoustException: If teams are invalid or if a criterion doesn't accept the entry.
         """
         self.check_exists(team_one, team_two)
         self._check_match_exists((team_one, team_two))
+        old = self.matches[(team_one, team_two)]
+        # compute everything that may raise before changing the table
+        new_points = None if entry is None else self.match_points(entry.winner())
+        if self.criteria:
+            self._update_criteria([(team_one, team_two, old, entry)])
+        if old is not None:
+            points_one, points_two = self.match_points(old.winner())
+            self.decrease_points(team_one, points_one)
+            self.decrease_points(team_two, points_two)
+        if new_points is not None:
+            points_one, points_two = new_points
+            self.increase_points(team_one, points_one)
+            self.increase_points(team_two, points_two)
         self.matches[(team_one, team_two)] = entry
-        self.compute_ranking()
+        self._touch(team_one, team_two)
 
     def set_match_from_string(self, team_one, team_two, s):
         """Updates the matches dictionary with a score of the form "a:b" where a and b are ints, recomputes points.
 
-        This method updates the matches dictionary and then uses compute_ranking to recompute the ranking.
+        This method updates the matches dictionary and then updates the points of both teams, see set_match.
 
         Args:
             team_one: Identifier of the first team s.t. (team_one, team_two) is a valid entry in the matches dict.
@@ -567,21 +971,261 @@ class MatchTable(Table):
         entry = self.cmp_class.parse(s)
         self.set_match(team_one, team_two, entry)
 
+    def prepare_match(self, team_one, team_two, entry):
+        """Validates a single result without changing the table.
+
+        Args:
+            team_one: Identifier of the first team s.t. (team_one, team_two) is a valid entry in the matches dict.
+            team_two: Identifier of the second team s.t. (team_one, team_two) is a valid entry in the matches dict.
+            entry: Either a string that is parsed with the parse method of cmp_class, an entry implementing MatchResult
+                or None.
+
+        Returns:
+            A tuple ((team_one, team_two), entry) where entry is the parsed entry.
+
+        Raises:
+            JoustException: If teams are invalid, if there is a syntax error in entry or if entry is not a MatchResult.
+        """
+        if isinstance(entry, str):
+            entry = self.cmp_class.parse(entry)
+        elif entry is not None and not isinstance(entry, MatchResult):
+            raise JoustException('Expected a MatchResult, got instance of %s' % type(entry).__name__)
+        self.check_exists(team_one, team_two)
+        self._check_match_exists((team_one, team_two))
+        return (team_one, team_two), entry
+
+    def apply_matches(self, updates):
+        """Applies a list of results that have already been validated with prepare_match.
+
+        The points are updated once for all results: The new points are computed on a copy of points that replaces the
+        old dictionary when all results have been processed. If a match appears more than once the last entry wins.
+
+        Args:
+            updates: A list of tuples ((team_one, team_two), entry) as returned by prepare_match.
+
+        Raises:
+            JoustException: If a criterion doesn't accept an entry, in this case the table remains unchanged.
+        """
+        new_matches = dict()
+        points = dict(self.points)
+        changes = []
+        for key, entry in updates:
+            team_one, team_two = key
+            old = new_matches[key] if key in new_matches else self.matches[key]
+            changes.append((team_one, team_two, old, entry))
+            if old is not None:
+                points_one, points_two = self.match_points(old.winner())
+                points[team_one] -= points_one
+                points[team_two] -= points_two
+            if entry is not None:
+                points_one, points_two = self.match_points(entry.winner())
+                points[team_one] += points_one
+                points[team_two] += points_two
+            new_matches[key] = entry
+        if self.criteria:
+            self._update_criteria(changes)
+        self.matches.update(new_matches)
+        self.points = points
+        for team_one, team_two in new_matches:
+            self._touch(team_one, team_two)
+
+    def set_matches(self, rows):
+        """Sets many results at once, either all results are applied or none.
+
+        All rows are validated first (see prepare_match), if any row is invalid an InvalidResultsException is raised
+        and the table remains unchanged. Otherwise all results are applied with apply_matches.
+
+        Args:
+            rows: An iterable of tuples (team_one, team_two, entry) where entry is either a score string or an entry
+                implementing MatchComparator.
+
+        Raises:
+            InvalidResultsException: If at least one row is invalid, its errors attribute contains all errors.
+        """
+        updates = []
+        errors = []
+        for i, row in enumerate(rows):
+            try:
+                team_one, team_two, entry = row
+                updates.append(self.prepare_match(team_one, team_two, entry))
+            except (TypeError, ValueError):
+                errors.append((i, JoustException('Invalid row "%s"' % str(row))))
+            except JoustException as e:
+                errors.append((i, e))
+        if errors:
+            raise InvalidResultsException(errors)
+        self.apply_matches(updates)
+
+    def set_matches_from_column(self, pairs, column):
+        """Sets many results from a column returned by the parse_many method of cmp_class, either all or none.
+
+        The points are computed from the winner codes of the column. Result objects are only created for the entries
+        stored in matches (once per pair, not for every row), criteria are updated with these objects.
+
+        Args:
+            pairs: An iterable of tuples (team_one, team_two), the i-th pair gets the result of row i of the column.
+            column: A ResultColumn as returned by parse_many, must have the same length as pairs.
+
+        Raises:
+            InvalidResultsException: If a row of the column is invalid or if a pair is invalid, no result is applied.
+            JoustException: If a criterion doesn't accept a result, no result is applied.
+        """
+        errors = [(i, JoustException('Invalid result in row %d' % i)) for i in column.invalid]
+        keys = []
+        for i, pair in enumerate(pairs):
+            key = None
+            try:
+                team_one, team_two = pair
+                key = (team_one, team_two)
+                self.check_exists(team_one, team_two)
+                self._check_match_exists(key)
+            except (TypeError, ValueError):
+                errors.append((i, JoustException('Invalid row "%s"' % str(pair))))
+            except JoustException as e:
+                errors.append((i, e))
+            keys.append(key)
+        if len(keys) != len(column):
+            errors.append((min(len(keys), len(column)), JoustException(
+                'Got %d pairs but %d results' % (len(keys), len(column)))))
+        if errors:
+            errors.sort(key=itemgetter(0))
+            raise InvalidResultsException(errors)
+        winners = column.winners()
+        new_matches = dict()
+        points = dict(self.points)
+        for i, key in enumerate(keys):
+            team_one, team_two = key
+            if key in new_matches:
+                old = WINNERS[winners[new_matches[key]]]
+            else:
+                old = self.matches[key]
+                old = None if old is None else old.winner()
+            if old is not None:
+                points_one, points_two = self.match_points(old)
+                points[team_one] -= points_one
+                points[team_two] -= points_two
+            points_one, points_two = self.match_points(WINNERS[winners[i]])
+            points[team_one] += points_one
+            points[team_two] += points_two
+            new_matches[key] = i
+        results = {key: column.result(i) for key, i in new_matches.items()}
+        if self.criteria:
+            self._update_criteria([(key[0], key[1], self.matches[key], result) for key, result in results.items()])
+        self.matches.update(results)
+        self.points = points
+        for team_one, team_two in results:
+            self._touch(team_one, team_two)
+
+    def ranking_keys(self):
+        """Returns the sort key of each team: The points followed by the negated keys of all criteria.
+
+        Criteria keys are smaller for better teams, so they're negated: A higher key means a better team.
+
+        Returns:
+            A dictionary mapping each team to a tuple (points, -criterion_key1, ..., -criterion_keyN).
+        """
+        keys = dict()
+        for team, points in self.points.items():
+            keys[team] = (points,) + tuple(-k for criterion in self.criteria for k in criterion.keys(team))
+        return keys
+
     def sort_ranking(self):
-        # TODO doc overwrite and test
-        f = getattr(self.cmp_class, 'sort_ranking', None)
-        if callable(f):
-            return f(self)
-        else:
+        """Sorts the ranking according to points and then according to the criteria (in this order).
+
+        The key of each team (see ranking_keys) is computed once from the incrementally updated criteria and all teams
+        are sorted in a single pass. Teams equal in all keys are sorted by their identifiers as in Table.sort_ranking.
+        If head_to_head is True the order is the one of compute_ranks.
+
+        Returns:
+            A list of tuples (team_identifier, team_points) sorted according to team_points (highest points first).
+        """
+        if self.head_to_head:
+            return [(team, points) for points, teams in self.compute_ranks() for team in teams]
+        if not self.criteria:
             return super().sort_ranking()
+        keys = self.ranking_keys()
+        ranking = list(self.points.items())
+        ranking.sort(key=lambda entry: (keys[entry[0]], entry[0]), reverse=True)
+        return ranking
 
     def compute_ranks(self):
-        # TODO doc overwrite and test
-        f = getattr(self.cmp_class, 'compute_ranks', None)
-        if callable(f):
-            return f(self)
-        else:
+        """Sorts the ranking (see sort_ranking) and divides it into ranks.
+
+        Without criteria (and head_to_head) the ranks are divided by points as in Table.compute_ranks. With criteria
+        teams are in the same rank only if they're equal according to points and all criteria, so in contrast to
+        Table.compute_ranks two consecutive ranks may have the same points.
+
+        If head_to_head is True teams with the same points are first ranked by a table of only the matches between them
+        (points and criteria of these matches). If some of them are still level the same is done for these teams, until
+        a set of teams is not separated any more. Only then the criteria of the whole table are used. The tables of the
+        mutual matches are built from team_matches and memoised by their teams and the versions of these teams, so after
+        a new result only tables of teams involved in this result are built again.
+
+        Returns:
+            A list of tuples (points, [team1, ..., teamK]), best rank first.
+        """
+        if self.head_to_head:
+            return self._head_to_head_ranks()
+        if not self.criteria:
             return super().compute_ranks()
+        keys = self.ranking_keys()
+        ranks = []
+        for key, r in itertools.groupby(self.sort_ranking(), key=lambda entry: keys[entry[0]]):
+            ranks.append((key[0], [ e[0] for e in r ]))
+        return ranks
+
+    def _head_to_head_ranks(self):
+        keys = self.ranking_keys()
+        old_cache, self._head_to_head_cache = self._head_to_head_cache, dict()
+        ranks = []
+        for points, r in itertools.groupby(super().sort_ranking(), key=itemgetter(1)):
+            teams = [e[0] for e in r]
+            tied = [teams] if len(teams) == 1 else self._resolve_tie(frozenset(teams), old_cache)
+            for subset in tied:
+                # teams not separated by their mutual matches are ranked by the criteria of the whole table
+                subset = sorted(subset, key=lambda team: (keys[team], team), reverse=True)
+                for _, rank in itertools.groupby(subset, key=keys.__getitem__):
+                    ranks.append((points, list(rank)))
+        return ranks
+
+    def _resolve_tie(self, teams, old_cache):
+        # returns a list of sets of teams, ordered by the table of their mutual matches (each set is still level)
+        cache_key = (teams, max(self.team_versions[team] for team in teams))
+        tied = self._head_to_head_cache.get(cache_key)
+        if tied is None:
+            tied = old_cache.get(cache_key)
+        if tied is None:
+            keys = self._head_to_head_keys(teams)
+            ordered = sorted(teams, key=keys.__getitem__, reverse=True)
+            tied = []
+            for _, subset in itertools.groupby(ordered, key=keys.__getitem__):
+                subset = frozenset(subset)
+                if 1 < len(subset) < len(teams):
+                    tied.extend(self._resolve_tie(subset, old_cache))
+                else:
+                    tied.append(subset)
+        self._head_to_head_cache[cache_key] = tied
+        return tied
+
+    def _head_to_head_keys(self, teams):
+        # the ranking keys of a table containing only the matches between the given teams
+        points = {team: self.empty_value() for team in teams}
+        criteria = [criterion.clone() for criterion in self.criteria]
+        for team in teams:
+            for team_one, team_two in self.team_matches[team]:
+                # each match is visited from its first team
+                if team_one != team or team_two not in teams:
+                    continue
+                entry = self.matches[(team_one, team_two)]
+                if entry is None:
+                    continue
+                points_one, points_two = self.match_points(entry.winner())
+                points[team_one] += points_one
+                points[team_two] += points_two
+                for criterion in criteria:
+                    criterion.register_match(team_one, team_two, entry)
+        return {team: (points[team],) + tuple(-k for criterion in criteria for k in criterion.keys(team))
+                for team in teams}
 
 
 class ThreePointsTable(MatchTable):
@@ -590,8 +1234,9 @@ class ThreePointsTable(MatchTable):
     For a win 3 points are awarded to the winner and 0 to the loser. On a draw both teams receive one point.
     These values can be overwritten.
     """
-    def __init__(self, group, matches_tuples, win=3, draw=1, lose=0, cmp_class=None):
-        super().__init__(group, matches_tuples, win, draw, lose, cmp_class=cmp_class)
+    def __init__(self, group, matches_tuples, win=3, draw=1, lose=0, cmp_class=None, criteria=None, head_to_head=False):
+        super().__init__(group, matches_tuples, win, draw, lose, cmp_class=cmp_class, criteria=criteria,
+                         head_to_head=head_to_head)
 
 
 class TwoPointsTable(MatchTable):
@@ -601,14 +1246,16 @@ class TwoPointsTable(MatchTable):
     The winner is awarded 2 plus points and 0 minus points, the loswer 0 plus points and 2 minus points. On a draw
     both teams receive one plus and one minus point. These values can be overwritten.
     """
-    def __init__(self, group, matches_tuples, win=None, draw=None, lose=None, cmp_class=None):
+    def __init__(self, group, matches_tuples, win=None, draw=None, lose=None, cmp_class=None, criteria=None,
+                 head_to_head=False):
         if win is None:
             win = TwoPoints(2, 0)
         if draw is None:
             draw = TwoPoints(1, 1)
         if lose is None:
             lose = TwoPoints(0, 2)
-        super().__init__(group, matches_tuples, win, draw, lose, cmp_class=cmp_class)
+        super().__init__(group, matches_tuples, win, draw, lose, cmp_class=cmp_class, criteria=criteria,
+                         head_to_head=head_to_head)
 
     def empty_value(self):
         return TwoPoints(0, 0)
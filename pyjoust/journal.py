@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An append-only journal of all changes to a tournament.
+
+Changes are described by events (a result, a tie breaker or a new phase). TournamentRecorder encodes each event, applies
+it to a tournament and passes the applied event together with its encoding to its record method, Journal writes them to
+disk.
+
+A journal directory contains checkpoints (snapshots, see the snapshot module) and journal segments. The name of a
+checkpoint contains the sequence number of the last event it includes, the name of a segment the sequence number of its
+first event. Each record in a segment consists of a header (payload length, sequence number and CRC-32) and the encoded
+event. On startup (Journal.open) the latest checkpoint is loaded and only the events after it are replayed. A record
+that was only partially written (for example on a power failure) is removed.
+"""
+
+import abc
+import collections
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+from . import snapshot
+from .utils import JoustException
+from .snapshot import _Writer, _Reader, _write_phase, _read_phase, _write_tie_breaker, _read_tie_breaker
+from .tournament import GroupPhase, KOPhase, DoubleEliminationPhase, TournamentPhase
+
+# event kinds
+RESULT, TIE_BREAKER, ADD_PHASE = range(1, 4)
+
+Event = collections.namedtuple('Event', ['kind', 'key', 'args'])
+Event.__doc__ = """A change to a tournament.
+
+Attributes:
+    kind: RESULT, TIE_BREAKER or ADD_PHASE.
+    key: The key of the phase in Tournament.rounds.
+    args: For RESULT the arguments of set_match of the phase: (team_one, team_two, result) for a GroupPhase,
+        (first_node_id, second_node_id, result) for a KOPhase and (match_id, result) for a DoubleEliminationPhase.
+        For TIE_BREAKER a tuple (breaker_key, tie_breaker) and for ADD_PHASE a tuple (phase,).
+"""
+
+_RECORD = struct.Struct('<IQI')
+_SEQ = struct.Struct('<Q')
+
+
+def encode_event(event):
+    """Encodes an event, team identifiers are stored in the event (no team table is required).
+
+    Raises:
+        JoustException: If the event contains something that can't be stored, see the snapshot module.
+    """
+    w = _Writer()
+    w.byte(event.kind)
+    w.value(event.key)
+    if event.kind == RESULT:
+        w.byte(len(event.args) - 1)
+        for arg in event.args[:-1]:
+            w.value(arg)
+        w.result(event.args[-1])
+    elif event.kind == TIE_BREAKER:
+        breaker_key, breaker = event.args
+        w.value(breaker_key)
+        _write_tie_breaker(w, breaker)
+    elif event.kind == ADD_PHASE:
+        teams = dict()
+        phase = _Writer(teams)
+        _write_phase(phase, event.args[0])
+        w.uint(len(teams))
+        for team in teams:
+            w.value(team)
+        w.buf += phase.buf
+    else:
+        raise JoustException('Invalid event kind %s' % str(event.kind))
+    return bytes(w.buf)
+
+
+def decode_event(data):
+    """Decodes an event encoded with encode_event.
+
+    Raises:
+        JoustException: If data is not a valid event.
+    """
+    r = _Reader(data)
+    kind = r.byte()
+    key = r.value()
+    if kind == RESULT:
+        args = [r.value() for _ in range(r.byte())]
+        args.append(r.result())
+    elif kind == TIE_BREAKER:
+        args = [r.value(), _read_tie_breaker(r)]
+    elif kind == ADD_PHASE:
+        r.teams = [r.value() for _ in range(r.uint())]
+        args = [_read_phase(r)]
+    else:
+        raise JoustException('Invalid event kind %d' % kind)
+    return Event(kind, key, tuple(args))
+
+
+def apply_event(tournament, event):
+    """Applies an event to a tournament.
+
+    Returns:
+        The value returned by the set_match method of the phase for RESULT events, None otherwise.
+
+    Raises:
+        JoustException: If the event can't be applied, for example if the phase doesn't exist.
+    """
+    if event.kind == ADD_PHASE:
+        if event.key in tournament.rounds:
+            raise JoustException('Phase "%s" already exists' % str(event.key))
+        tournament.add_phase(event.args[0], key=event.key)
+        return None
+    if event.key not in tournament.rounds:
+        raise JoustException('Invalid phase "%s"' % str(event.key))
+    phase = tournament.rounds[event.key]
+    if event.kind == TIE_BREAKER:
+        if not isinstance(phase, TournamentPhase):
+            raise JoustException('Phase "%s" has no tie breakers' % str(event.key))
+        breaker_key, breaker = event.args
+        phase.add_tie_breaker(breaker, key=breaker_key)
+        return None
+    if event.kind != RESULT:
+        raise JoustException('Invalid event kind %s' % str(event.kind))
+    if isinstance(phase, TournamentPhase):
+        phase = phase.phase
+    if isinstance(phase, GroupPhase):
+        team_one, team_two, result = event.args
+        return phase.set_match(team_one, team_two, result)
+    elif isinstance(phase, KOPhase):
+        first_node_id, second_node_id, result = event.args
+        return phase.tree.set_match(first_node_id, second_node_id, result)
+    elif isinstance(phase, DoubleEliminationPhase):
+        match_id, result = event.args
+        return phase.tree.set_match(match_id, result)
+    raise JoustException('Can not set results for phase of type %s' % type(phase).__name__)
+
+
+class TournamentRecorder(abc.ABC):
+    """Base class for everything that changes a tournament and keeps track of the changes (see Journal).
+
+    All changes must be done with the methods of the recorder: The event is encoded first (so an event that can't be
+    recorded doesn't change the tournament), then it is applied to the tournament and, if that succeeds, passed to
+    record.
+
+    Args:
+        tournament: The tournament to change.
+    """
+    def __init__(self, tournament):
+        self.tournament = tournament
+
+    @abc.abstractmethod
+    def record(self, event, payload):
+        """Called for each event after it has been applied to the tournament, payload is encode_event(event)."""
+        pass
+
+    def apply(self, event):
+        """Encodes an event, applies it to the tournament and records it, see apply_event.
+
+        Raises:
+            JoustException: If the event can't be encoded or applied, the tournament is unchanged in this case.
+        """
+        payload = encode_event(event)
+        result = apply_event(self.tournament, event)
+        self.record(event, payload)
+        return result
+
+    def set_match(self, key, *args):
+        """Sets the result of a match in a phase, args are the arguments of the set_match method of the phase.
+
+        For a GroupPhase these are (team_one, team_two, result), for a KOPhase (first_node_id, second_node_id, result)
+        and for a DoubleEliminationPhase (match_id, result).
+
+        Returns:
+            The value returned by the set_match method of the phase.
+        """
+        return self.apply(Event(RESULT, key, args))
+
+    def add_tie_breaker(self, key, value, breaker_key=None):
+        """Adds a tie breaker to the TournamentPhase key, see TournamentPhase.add_tie_breaker.
+
+        Returns:
+            The key of the tie breaker.
+        """
+        if breaker_key is None:
+            breaker_key = uuid.uuid4()
+        self.apply(Event(TIE_BREAKER, key, (breaker_key, value)))
+        return breaker_key
+
+    def add_phase(self, value, key=None):
+        """Adds a phase to the tournament, see Tournament.add_phase.
+
+        Returns:
+            The key of the phase.
+        """
+        if key is None:
+            key = uuid.uuid4()
+        self.apply(Event(ADD_PHASE, key, (value,)))
+        return key
+
+
+def _segment_name(seq):
+    return 'journal-%020d.log' % seq
+
+
+def _checkpoint_name(seq):
+    return 'checkpoint-%020d.snapshot' % seq
+
+
+def _list_files(directory, prefix, suffix):
+    # returns a sorted list of tuples (seq, path)
+    files = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            number = name[len(prefix):len(name) - len(suffix)]
+            if number.isdigit():
+                files.append((int(number), os.path.join(directory, name)))
+    files.sort()
+    return files
+
+
+def read_segment(path):
+    """Reads all complete records of a journal segment.
+
+    Returns:
+        A tuple (records, valid_length) where records is a list of tuples (seq, payload) and valid_length the length
+        of the file up to the first incomplete or corrupted record.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset + _RECORD.size <= len(data):
+        length, seq, crc = _RECORD.unpack_from(data, offset)
+        end = offset + _RECORD.size + length
+        if end > len(data):
+            break
+        payload = data[offset + _RECORD.size:end]
+        if zlib.crc32(payload, zlib.crc32(_SEQ.pack(seq))) != crc:
+            break
+        records.append((seq, payload))
+        offset = end
+    return records, offset
+
+
+def _sync_directory(directory):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_checkpoint(directory, tournament, seq):
+    path = os.path.join(directory, _checkpoint_name(seq))
+    tmp = path + '.tmp'
+    data = snapshot.dumps(tournament)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _sync_directory(directory)
+
+
+def _replay(directory, tournament, after, upto=None, repair=False):
+    # applies all events with after < seq <= upto, returns the last applied sequence number
+    seq = after
+    segments = _list_files(directory, 'journal-', '.log')
+    for i, (start, path) in enumerate(segments):
+        if upto is not None and start > upto:
+            break
+        if start > seq + 1:
+            raise JoustException('Journal is missing events %d to %d' % (seq + 1, start - 1))
+        records, valid_length = read_segment(path)
+        if valid_length != os.path.getsize(path):
+            if i != len(segments) - 1 or not repair:
+                raise JoustException('Journal segment "%s" is corrupted' % path)
+            # the last record was not completely written
+            with open(path, 'r+b') as f:
+                f.truncate(valid_length)
+                os.fsync(f.fileno())
+        for record_seq, payload in records:
+            if record_seq <= seq:
+                continue
+            if upto is not None and record_seq > upto:
+                break
+            if record_seq != seq + 1:
+                raise JoustException('Journal is missing events %d to %d' % (seq + 1, record_seq - 1))
+            apply_event(tournament, decode_event(payload))
+            seq = record_seq
+    return seq
+
+
+class Journal(TournamentRecorder):
+    """A TournamentRecorder that appends each event to a journal on disk.
+
+    Use create to start a new journal and open to continue an existing one.
+
+    Records are written to the operating system immediately, so a crash of the process doesn't lose any event. To
+    survive a crash of the operating system the file must be synced (fsync), which is expensive. sync_every and
+    sync_interval configure how often this happens, sync can be called at any time.
+
+    When the current segment reaches segment_size bytes a new segment is started. compact writes a new checkpoint in a
+    background thread and removes the segments and checkpoints that are no longer needed. The checkpoint is created from
+    the previous checkpoint and the journal, not from the tournament in use, so the tournament can be changed during
+    compaction.
+
+    Args:
+        directory: The journal directory.
+        tournament: The tournament (its state must correspond to the event with sequence number seq).
+        seq: The sequence number of the last event.
+        sync_every: Sync after this many records (1 means after every record), None to disable.
+        sync_interval: Sync when a record is written and the last sync is at least this many seconds ago, None to
+            disable.
+        segment_size: The size in bytes at which a new segment is started.
+        compact_every: Call compact automatically when this many events have been written since the last checkpoint,
+            None to disable.
+
+    Attributes:
+        seq: The sequence number of the last event.
+        checkpoint_seq: The sequence number of the latest checkpoint.
+        compaction_error: The exception raised by the last background compaction or None.
+        write_error: The OSError of a failed write or None. The event was applied to the tournament but not written,
+            so no further events are accepted, the tournament must be restored with open.
+    """
+    def __init__(self, directory, tournament, seq, sync_every=1, sync_interval=None, segment_size=16 * 1024 * 1024,
+                 compact_every=None):
+        super().__init__(tournament)
+        self.directory = directory
+        self.seq = seq
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.segment_size = segment_size
+        self.compact_every = compact_every
+        checkpoints = _list_files(directory, 'checkpoint-', '.snapshot')
+        self.checkpoint_seq = checkpoints[-1][0] if checkpoints else None
+        self.compaction_error = None
+        self.write_error = None
+        self._compaction = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._file = None
+        self._open_segment()
+
+    @classmethod
+    def create(cls, directory, tournament, **kwargs):
+        """Starts a new journal for a tournament, the tournament is stored as the initial checkpoint.
+
+        Args:
+            directory: The directory, it is created if it doesn't exist and must not contain a journal.
+            tournament: The tournament.
+            kwargs: Passed to the constructor (for example sync_every).
+
+        Raises:
+            JoustException: If the directory already contains a journal.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if _list_files(directory, 'checkpoint-', '.snapshot') or _list_files(directory, 'journal-', '.log'):
+            raise JoustException('Directory "%s" already contains a journal' % directory)
+        _write_checkpoint(directory, tournament, 0)
+        return cls(directory, tournament, 0, **kwargs)
+
+    @classmethod
+    def open(cls, directory, **kwargs):
+        """Restores the tournament from the latest checkpoint and the journal and continues the journal.
+
+        An incomplete record at the end of the journal is removed.
+
+        Args:
+            directory: The journal directory.
+            kwargs: Passed to the constructor (for example sync_every).
+
+        Raises:
+            JoustException: If there is no checkpoint or the journal is corrupted.
+        """
+        checkpoints = _list_files(directory, 'checkpoint-', '.snapshot')
+        if not checkpoints:
+            raise JoustException('No checkpoint in "%s"' % directory)
+        checkpoint_seq, path = checkpoints[-1]
+        tournament = snapshot.load(path)
+        seq = _replay(directory, tournament, checkpoint_seq, repair=True)
+        return cls(directory, tournament, seq, **kwargs)
+
+    def _open_segment(self):
+        self._segment_start = self.seq + 1
+        path = os.path.join(self.directory, _segment_name(self._segment_start))
+        self._file = open(path, 'ab', buffering=0)
+        _sync_directory(self.directory)
+
+    def _rotate(self):
+        self.sync()
+        self._file.close()
+        self._open_segment()
+
+    def apply(self, event):
+        if self.write_error is not None:
+            raise JoustException('Journal is inconsistent after a failed write, restore it with open')
+        return super().apply(event)
+
+    def record(self, event, payload):
+        """Appends an event to the journal, the event must already be applied to the tournament.
+
+        Raises:
+            OSError: If writing fails, see write_error.
+        """
+        if self.write_error is not None:
+            raise JoustException('Journal is inconsistent after a failed write, restore it with open')
+        seq = self.seq + 1
+        crc = zlib.crc32(payload, zlib.crc32(_SEQ.pack(seq)))
+        try:
+            self._file.write(_RECORD.pack(len(payload), seq, crc) + payload)
+        except OSError as e:
+            self.write_error = e
+            raise
+        self.seq = seq
+        self._unsynced += 1
+        if self._file.tell() >= self.segment_size:
+            self._rotate()
+        elif self.sync_every is not None and self._unsynced >= self.sync_every:
+            self.sync()
+        elif self.sync_interval is not None and time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        if self.compact_every is not None and self.seq - self.checkpoint_seq >= self.compact_every:
+            if self._compaction is None or not self._compaction.is_alive():
+                self.compact()
+
+    def sync(self):
+        """Syncs the current segment to disk."""
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self, wait=False):
+        """Writes a checkpoint for the current sequence number in a background thread.
+
+        Afterwards all older checkpoints and segments are removed. If a compaction is already running it is waited for
+        first.
+
+        Args:
+            wait: If True wait until the checkpoint has been written, exceptions are raised in this case.
+
+        Returns:
+            The thread writing the checkpoint.
+        """
+        if self._compaction is not None:
+            self._compaction.join()
+        if self._file.tell() > 0:
+            self._rotate()
+        else:
+            self.sync()
+        self.compaction_error = None
+        self._compaction = threading.Thread(target=self._compact, args=(self.seq, self._segment_start), daemon=True)
+        self._compaction.start()
+        if wait:
+            self._compaction.join()
+            if self.compaction_error is not None:
+                raise self.compaction_error
+        return self._compaction
+
+    def _compact(self, upto, segment_start):
+        try:
+            checkpoint_seq, path = _list_files(self.directory, 'checkpoint-', '.snapshot')[-1]
+            if checkpoint_seq < upto:
+                tournament = snapshot.load(path)
+                if _replay(self.directory, tournament, checkpoint_seq, upto) != upto:
+                    raise JoustException('Journal is missing events up to %d' % upto)
+                _write_checkpoint(self.directory, tournament, upto)
+                del tournament
+            self.checkpoint_seq = upto
+            for seq, path in _list_files(self.directory, 'checkpoint-', '.snapshot'):
+                if seq < upto:
+                    os.remove(path)
+            for start, path in _list_files(self.directory, 'journal-', '.log'):
+                if start < segment_start:
+                    os.remove(path)
+        except (JoustException, OSError) as e:
+            self.compaction_error = e
+
+    def close(self):
+        """Waits for a running compaction, syncs and closes the current segment."""
+        if self._compaction is not None:
+            self._compaction.join()
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -14,7 +14,69 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .utils import JoustException, is_power_of_two
+from array import array
+
+from .utils import JoustException, is_power_of_two, next_power_of_two
+
+
+def _row_range(num_teams, row):
+    """Returns the node ids of a row of a KO tree with num_teams leaves, in the order of KOTree.get_rows.
+
+    Row 0 are the leaves, the last row is the root. Row r contains num_teams / 2^r nodes, these are the nodes
+    2^d - 1, ..., 2^(d+1) - 2 (in decreasing order) where d is the depth of the row.
+    """
+    size = num_teams >> row
+    if row < 0 or size == 0:
+        raise JoustException('Invalid row %d' % row)
+    return range(2 * size - 2, size - 2, -1)
+
+
+def seed_order(n):
+    """Returns the standard bracket order of the seeds 1, ..., n.
+
+    Consecutive seeds in the result play against each other in the first round, seeds 1 and 2 can only meet in the
+    final (seeds 1 to 4 only in the semi-finals and so on). The order is computed by doubling: each seed s in the order
+    for n / 2 is replaced by s, n + 1 - s. This takes O(n) time.
+
+    Args:
+        n: The number of seeds, must be a power of two.
+
+    Returns:
+        A list of the seeds 1, ..., n.
+
+    Examples:
+        >>> seed_order(8)
+        [1, 8, 4, 5, 2, 7, 3, 6]
+    """
+    if not is_power_of_two(n):
+        raise JoustException('Number of seeds must be a power of two, got %d' % n)
+    order = [1]
+    size = 1
+    while size < n:
+        size *= 2
+        order = [seed for s in order for seed in (s, size + 1 - s)]
+    return order
+
+
+def seeded_leaves(ranking):
+    """Places a ranked list of teams of any length in a bracket, the result can be used to create a KOTree.
+
+    The bracket size is the next power of two, the missing teams are byes (None). Teams are placed according to
+    seed_order, thus the byes are the opponents of the best teams.
+
+    Args:
+        ranking: A list of team identifiers, the best team first.
+
+    Returns:
+        A list of team identifiers and None (for byes), its length is a power of two.
+
+    Raises:
+        JoustException: If ranking is empty.
+    """
+    k = len(ranking)
+    if k == 0:
+        raise JoustException("Can't create bracket without teams")
+    return [ranking[s - 1] if s <= k else None for s in seed_order(next_power_of_two(k))]
 
 
 class KOTreeNode(object):
@@ -31,6 +93,16 @@ class KOTreeNode(object):
 
 
 class KOTree(object):
+    """A KO bracket stored as a binary tree (node 0 is the final, the leaves are the teams).
+
+    Winners advance automatically: set_match moves the winner into the parent node, and teams playing against a bye
+    advance when the tree is created. Changing a result removes the results of all later matches the old winner
+    took part in.
+
+    Args:
+        teams: A list of team identifiers (None for a bye), its length must be a power of two. teams[0] plays against
+            teams[1], teams[2] against teams[3] and so on.
+    """
     def __init__(self, teams):
         is_ok = is_power_of_two(len(teams))
         if not is_ok:
@@ -44,14 +116,80 @@ class KOTree(object):
                 nodes[i] = KOTreeNode(team)
         self.nodes = nodes
         self.matches = dict()
+        # resolve byes
+        if self.num_teams > 1:
+            for first, second in self.get_matches(0):
+                if nodes[first].is_bye or nodes[second].is_bye:
+                    self._child_changed(first)
 
     def set_match(self, first_node_id, second_node_id, result):
+        """Sets the result of a match and moves the winner into the parent node.
+
+        Args:
+            first_node_id: The node of team one.
+            second_node_id: The node of team two, must be the sibling of first_node_id.
+            result: The result, must implement MatchComparator and must not be a draw.
+
+        Returns:
+            A list of all later matches (pairs of node ids as yielded by get_matches) whose teams changed, their
+            results have been removed.
+
+        Raises:
+            JoustException: If the nodes are not a valid match or if the result is a draw.
+        """
+        if first_node_id == second_node_id or KOTree.parent(first_node_id) != KOTree.parent(second_node_id):
+            raise JoustException('Invalid match: nodes %d and %d' % (first_node_id, second_node_id))
         first_node, second_node = self.nodes[first_node_id], self.nodes[second_node_id]
         if (first_node is None) or (second_node is None):
             raise JoustException('Invalid node id (no teams set yet)')
+        if first_node.is_bye or second_node.is_bye:
+            raise JoustException("Can't set result for a bye")
+        cmp = result.winner()
+        if cmp == 'draw':
+            raise JoustException('Result of a KO match must not be a draw')
+        self.matches.pop((second_node_id, first_node_id), None)
         first_node.result = result
         second_node.result = result
         self.matches[(first_node_id, second_node_id)] = result
+        winner = first_node if cmp == 'one' else second_node
+        return self._set_node(KOTree.parent(first_node_id), winner.team)
+
+    @classmethod
+    def seeded(cls, ranking):
+        """Creates a tree from a ranked list of teams of any length, see seeded_leaves."""
+        return cls(seeded_leaves(ranking))
+
+    def _set_node(self, node_id, team, is_bye=False):
+        # sets the team of a node (None and not is_bye means unknown), returns the changed matches
+        old = self.nodes[node_id]
+        if old is None:
+            if team is None and not is_bye:
+                return []
+        elif old.team == team and old.is_bye == is_bye:
+            return []
+        self.nodes[node_id] = None if (team is None and not is_bye) else KOTreeNode(team, is_bye)
+        return self._child_changed(node_id)
+
+    def _child_changed(self, node_id):
+        # the team of node_id changed: remove the result of its match and recompute the parent
+        if node_id == 0:
+            return []
+        sibling = node_id - 1 if node_id % 2 == 0 else node_id + 1
+        match = (max(node_id, sibling), min(node_id, sibling))
+        self.matches.pop(match, None)
+        self.matches.pop((match[1], match[0]), None)
+        node, other = self.nodes[node_id], self.nodes[sibling]
+        for n in (node, other):
+            if n is not None:
+                n.result = None
+        changed = [match]
+        parent = KOTree.parent(node_id)
+        if node is not None and other is not None and (node.is_bye or other.is_bye):
+            winner = other if node.is_bye else node
+            changed.extend(self._set_node(parent, winner.team, winner.is_bye))
+        else:
+            changed.extend(self._set_node(parent, None))
+        return changed
 
     def get_match_result(self, first_node_id, second_node_id):
         return self.matches.get((first_node_id, second_node_id), None)
@@ -71,14 +209,13 @@ class KOTree(object):
         return result
 
     def get_row(self, row_id):
-        # probably nicer ways, but should be fine
-        return self.get_rows()[row_id]
+        return list(_row_range(self.num_teams, row_id))
 
     @staticmethod
     def to_root(node_id):
         if node_id < 0:
             return []
-        result = None
+        result = []
         n = node_id
         while True:
             result.append(n)
@@ -107,3 +244,358 @@ class KOTree(object):
                 break
             yield row[i], row[i+1]
             i += 2
+
+
+class ArrayKOTree(object):
+    """A KO tree with the same layout as KOTree that stores its nodes in arrays (struct of arrays).
+
+    The nodes are stored as in a binary heap: node 0 is the root, the children of node i are 2i + 1 and 2i + 2. The
+    leaves are the last num_teams nodes, teams[0] is stored in the last node (as in KOTree). Winners advance
+    automatically as in KOTree. Instead of a node object
+    there is one entry in each of the arrays team, is_bye and result_id for each node. Rows are computed directly from
+    the node ids, so row, match, parent and path to root queries don't have to build the whole tree.
+
+    Args:
+        teams: A list of team identifiers (None for a bye), its length must be a power of two.
+
+    Attributes:
+        teams: The list of teams, team[i] is an index in this list.
+        team: Array of ints, the index of the team of each node or -1 if the node has no team (yet).
+        is_bye: Array of 0 / 1 values, 1 if the node is a bye.
+        result_id: Array of ints, the index in results of the match a node took part in or -1.
+        results: The list of results.
+    """
+
+    def __init__(self, teams):
+        if not is_power_of_two(len(teams)):
+            raise JoustException('KOTree most be initialized with a power of two pairings')
+        self.num_teams = len(teams)
+        self.num_rows = self.num_teams.bit_length()
+        self.teams = list(teams)
+        num_nodes = 2 * self.num_teams - 1
+        self.team = array('i', [-1]) * num_nodes
+        self.is_bye = bytearray(num_nodes)
+        self.result_id = array('i', [-1]) * num_nodes
+        self.results = []
+        for i, team in enumerate(teams):
+            node = num_nodes - 1 - i
+            if team is None:
+                self.is_bye[node] = 1
+            else:
+                self.team[node] = i
+        # resolve byes
+        for node in range(num_nodes - 1, num_nodes - self.num_teams, -2):
+            if self.is_bye[node] or self.is_bye[node - 1]:
+                self._child_changed(node)
+
+    def __len__(self):
+        return len(self.team)
+
+    def get_team(self, node_id):
+        """Returns the team identifier of a node or None."""
+        i = self.team[node_id]
+        return None if i < 0 else self.teams[i]
+
+    def get_result(self, node_id):
+        """Returns the result of the match a node took part in or None."""
+        i = self.result_id[node_id]
+        return None if i < 0 else self.results[i]
+
+    def set_match(self, first_node_id, second_node_id, result):
+        """Sets the result of a match and moves the winner into the parent node, see KOTree.set_match.
+
+        Returns:
+            A list of all later matches (pairs of node ids as yielded by get_matches) whose teams changed, their
+            results have been removed.
+
+        Raises:
+            JoustException: If the nodes are not a valid match or if the result is a draw.
+        """
+        if first_node_id == second_node_id or self.parent(first_node_id) != self.parent(second_node_id):
+            raise JoustException('Invalid match: nodes %d and %d' % (first_node_id, second_node_id))
+        if self.team[first_node_id] < 0 or self.team[second_node_id] < 0:
+            raise JoustException('Invalid node id (no teams set yet)')
+        cmp = result.winner()
+        if cmp == 'draw':
+            raise JoustException('Result of a KO match must not be a draw')
+        i = self.result_id[first_node_id]
+        if i >= 0 and self.result_id[second_node_id] == i:
+            self.results[i] = result
+        else:
+            self.result_id[first_node_id] = self.result_id[second_node_id] = len(self.results)
+            self.results.append(result)
+        winner = first_node_id if cmp == 'one' else second_node_id
+        return self._set_node(self.parent(first_node_id), self.team[winner], False)
+
+    @classmethod
+    def seeded(cls, ranking):
+        """Creates a tree from a ranked list of teams of any length, see seeded_leaves."""
+        return cls(seeded_leaves(ranking))
+
+    def _set_node(self, node_id, team, is_bye):
+        # sets the team index of a node (-1 and not is_bye means unknown), returns the changed matches
+        if self.team[node_id] == team and self.is_bye[node_id] == is_bye:
+            return []
+        self.team[node_id] = team
+        self.is_bye[node_id] = is_bye
+        return self._child_changed(node_id)
+
+    def _child_changed(self, node_id):
+        # the team of node_id changed: remove the result of its match and recompute the parent
+        if node_id == 0:
+            return []
+        sibling = node_id - 1 if node_id % 2 == 0 else node_id + 1
+        self.result_id[node_id] = self.result_id[sibling] = -1
+        changed = [(max(node_id, sibling), min(node_id, sibling))]
+        parent = self.parent(node_id)
+        known = (self.team[node_id] >= 0 or self.is_bye[node_id]) and (self.team[sibling] >= 0 or self.is_bye[sibling])
+        if known and (self.is_bye[node_id] or self.is_bye[sibling]):
+            winner = sibling if self.is_bye[node_id] else node_id
+            changed.extend(self._set_node(parent, self.team[winner], self.is_bye[winner]))
+        else:
+            changed.extend(self._set_node(parent, -1, False))
+        return changed
+
+    def get_match_result(self, first_node_id, second_node_id):
+        i = self.result_id[first_node_id]
+        if i < 0 or self.result_id[second_node_id] != i:
+            return None
+        return self.results[i]
+
+    def get_rows(self):
+        return [self.get_row(row) for row in range(self.num_rows)]
+
+    def get_row(self, row_id):
+        """Returns the node ids of a row as a range (row 0 are the leaves)."""
+        return _row_range(self.num_teams, row_id)
+
+    @staticmethod
+    def row_of(node_id):
+        """Returns the depth of a node (0 for the root), the row is num_rows - 1 - depth."""
+        return (node_id + 1).bit_length() - 1
+
+    @staticmethod
+    def to_root(node_id):
+        """Yields the node ids on the path from node_id to the root (including both)."""
+        while node_id > 0:
+            yield node_id
+            node_id = (node_id - 1) // 2
+        if node_id == 0:
+            yield 0
+
+    children = staticmethod(KOTree.children)
+    parent = staticmethod(KOTree.parent)
+
+    def get_matches(self, row):
+        if type(row) == int:
+            row = self.get_row(row)
+        for i in range(0, len(row) - 1, 2):
+            yield row[i], row[i + 1]
+
+
+class DoubleEliminationTree(object):
+    """A double elimination bracket: teams are eliminated after their second loss.
+
+    The winners' bracket uses the node ids of KOTree: the match between the nodes 2i + 1 and 2i + 2 has the id i (thus
+    match 0 is the final of the winners' bracket). The losers of the first round of the winners' bracket play each
+    other in the first round of the losers' bracket, afterwards the losers of each round of the winners' bracket drop
+    into every second round of the losers' bracket (in reversed order in every other round to avoid early rematches).
+    The winner of the winners' bracket plays the winner of the losers' bracket in the grand final. If reset is True
+    and the team from the losers' bracket wins the grand final a second final (the reset match) is played.
+
+    For each match the destination (match and slot) of its winner and loser are computed when the bracket is created,
+    setting a result moves both teams forward. Byes (None in teams) are resolved automatically. Changing a result
+    removes the results of all later matches that depend on it.
+
+    Each match has two slots (team one and team two), a slot contains the index of a team in teams, BYE or EMPTY
+    (not known yet).
+
+    Args:
+        teams: A list of team identifiers (None for a bye), its length must be a power of two >= 2. teams[0] plays
+            against teams[1], teams[2] against teams[3] and so on.
+        reset: True if a reset match should be played.
+
+    Attributes:
+        wb_rounds: A list of the match ids of each round in the winners' bracket.
+        lb_rounds: A list of the match ids of each round in the losers' bracket.
+        grand_final: The match id of the grand final.
+        reset_match: The match id of the reset match or None.
+        order: All match ids in an order in which they can be played.
+        slot_one: Array of the first slot of each match.
+        slot_two: Array of the second slot of each match.
+        winner_to: Array, the destination of the winner of each match (2 * match id + slot, -1 for none).
+        loser_to: Array, the destination of the loser of each match (2 * match id + slot, -1 for none).
+    """
+
+    EMPTY = -1
+    BYE = -2
+
+    def __init__(self, teams, reset=True):
+        n = len(teams)
+        if n < 2 or not is_power_of_two(n):
+            raise JoustException('Double elimination requires a power of two >= 2 pairings')
+        self.num_teams = n
+        self.teams = list(teams)
+        self.wb_rounds = [list(_row_range(n, row)) for row in range(1, n.bit_length())]
+        self.lb_rounds = []
+        next_id = n - 1
+        winner_to, loser_to = dict(), dict()
+        for p in range(n - 1):
+            if p > 0:
+                parent = KOTree.parent(p)
+                winner_to[p] = 2 * parent + (0 if p == 2 * parent + 2 else 1)
+        order = list(self.wb_rounds[0])
+        if n >= 4:
+            prev = list(range(next_id, next_id + n // 4))
+            next_id += len(prev)
+            self.lb_rounds.append(prev)
+            first = self.wb_rounds[0]
+            for j, m in enumerate(prev):
+                loser_to[first[2 * j]] = 2 * m
+                loser_to[first[2 * j + 1]] = 2 * m + 1
+            order.extend(prev)
+            for i in range(1, len(self.wb_rounds)):
+                wb_round = self.wb_rounds[i]
+                major = list(range(next_id, next_id + len(wb_round)))
+                next_id += len(major)
+                self.lb_rounds.append(major)
+                drops = list(reversed(wb_round)) if i % 2 != 0 else wb_round
+                for j, m in enumerate(major):
+                    winner_to[prev[j]] = 2 * m
+                    loser_to[drops[j]] = 2 * m + 1
+                order.extend(wb_round)
+                order.extend(major)
+                prev = major
+                if i < len(self.wb_rounds) - 1:
+                    minor = list(range(next_id, next_id + len(major) // 2))
+                    next_id += len(minor)
+                    self.lb_rounds.append(minor)
+                    for j, m in enumerate(minor):
+                        winner_to[major[2 * j]] = 2 * m
+                        winner_to[major[2 * j + 1]] = 2 * m + 1
+                    order.extend(minor)
+                    prev = minor
+            lb_winner = prev[0]
+        self.grand_final = next_id
+        next_id += 1
+        winner_to[0] = 2 * self.grand_final
+        if n >= 4:
+            winner_to[lb_winner] = 2 * self.grand_final + 1
+        else:
+            loser_to[0] = 2 * self.grand_final + 1
+        order.append(self.grand_final)
+        self.reset_match = None
+        if reset:
+            self.reset_match = next_id
+            next_id += 1
+            order.append(self.reset_match)
+        self.order = order
+        self.winner_to = array('i', (winner_to.get(m, -1) for m in range(next_id)))
+        self.loser_to = array('i', (loser_to.get(m, -1) for m in range(next_id)))
+        self.slot_one = array('i', [self.EMPTY]) * next_id
+        self.slot_two = array('i', [self.EMPTY]) * next_id
+        self.result_id = array('i', [-1]) * next_id
+        self.results = []
+        for m in self.wb_rounds[0]:
+            for slot, child in ((self.slot_one, 2 * m + 2), (self.slot_two, 2 * m + 1)):
+                i = 2 * n - 2 - child
+                slot[m] = self.BYE if teams[i] is None else i
+        for m in self.wb_rounds[0]:
+            self._update(m, [])
+
+    def __len__(self):
+        return len(self.slot_one)
+
+    def _team(self, value):
+        return self.teams[value] if value >= 0 else None
+
+    def get_match(self, match_id):
+        """Returns a tuple (team_one, team_two, result) for a match.
+
+        Teams are None if they're not known yet or if the slot is a bye (see is_bye), result is None if no result is
+        set.
+        """
+        i = self.result_id[match_id]
+        return (self._team(self.slot_one[match_id]), self._team(self.slot_two[match_id]),
+                self.results[i] if i >= 0 else None)
+
+    def is_bye(self, match_id):
+        """Returns True if one of the slots of a match is a bye."""
+        return self.slot_one[match_id] == self.BYE or self.slot_two[match_id] == self.BYE
+
+    def set_match(self, match_id, result):
+        """Sets the result of a match and moves the winner and loser forward.
+
+        Args:
+            match_id: The id of the match.
+            result: The result, must implement MatchComparator and must not be a draw.
+
+        Returns:
+            A list of the ids of all later matches whose teams changed, their results have been removed.
+
+        Raises:
+            JoustException: If the teams of the match are not known yet or if the result is a draw.
+        """
+        if not 0 <= match_id < len(self):
+            raise JoustException('Invalid match id %d' % match_id)
+        if self.slot_one[match_id] < 0 or self.slot_two[match_id] < 0:
+            raise JoustException('Invalid match id (no teams set yet)')
+        if result.winner() == 'draw':
+            raise JoustException('Result of a KO match must not be a draw')
+        self.result_id[match_id] = len(self.results)
+        self.results.append(result)
+        changed = []
+        self._update(match_id, changed)
+        # a match can change twice (both slots)
+        return list(dict.fromkeys(changed))
+
+    def _outputs(self, match_id):
+        # returns (winner, loser) of a match, EMPTY if not known yet
+        a, b = self.slot_one[match_id], self.slot_two[match_id]
+        if a == self.EMPTY or b == self.EMPTY:
+            return self.EMPTY, self.EMPTY
+        if a == self.BYE:
+            return b, self.BYE
+        if b == self.BYE:
+            return a, self.BYE
+        i = self.result_id[match_id]
+        if i < 0:
+            return self.EMPTY, self.EMPTY
+        if self.results[i].winner() == 'one':
+            return a, b
+        return b, a
+
+    def _update(self, match_id, changed):
+        # moves the winner and loser of match_id forward, recursively
+        winner, loser = self._outputs(match_id)
+        if match_id == self.grand_final and self.reset_match is not None:
+            # the reset match is only played if the team from the losers' bracket wins
+            if winner != self.EMPTY and winner == self.slot_two[match_id] and loser != self.BYE:
+                self._put(self.reset_match, 0, self.slot_one[match_id], changed)
+                self._put(self.reset_match, 1, self.slot_two[match_id], changed)
+            else:
+                self._put(self.reset_match, 0, self.EMPTY, changed)
+                self._put(self.reset_match, 1, self.EMPTY, changed)
+        for dest, value in ((self.winner_to[match_id], winner), (self.loser_to[match_id], loser)):
+            if dest >= 0:
+                self._put(dest >> 1, dest & 1, value, changed)
+
+    def _put(self, match_id, slot, value, changed):
+        slots = self.slot_two if slot else self.slot_one
+        if slots[match_id] == value:
+            return
+        slots[match_id] = value
+        self.result_id[match_id] = -1
+        changed.append(match_id)
+        self._update(match_id, changed)
+
+    def champion(self):
+        """Returns the winner of the tournament or None if it's not decided yet."""
+        if self.reset_match is not None:
+            winner, _ = self._outputs(self.reset_match)
+            if winner != self.EMPTY:
+                return self._team(winner)
+            if self.slot_one[self.reset_match] != self.EMPTY:
+                return None
+        winner, _ = self._outputs(self.grand_final)
+        return None if winner == self.EMPTY else self._team(winner)
@@ -14,9 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .utils import MatchResult, JoustException
+from .utils import MatchResult, JoustException, ResultColumn, RankCriterion, tokenize_column, fill_int_columns
 
-import itertools
+from array import array
+from collections import defaultdict
 from operator import itemgetter
 import re
 
@@ -24,6 +25,8 @@ import re
 class KubbResult(MatchResult):
 
     rx = re.compile(r"^\s*(?P<timeout>timeout:)?\s*(?P<first>\d*):(?P<second>\d*)\s*$")
+    # matches every line of a column, the groups are empty for invalid lines (see tokenize_column)
+    column_rx = re.compile(r"^[^\S\n]*(?:(timeout:)?[^\S\n]*(\d*):(\d*)[^\S\n]*$|.*)", re.MULTILINE)
 
     def __init__(self, first, second, timeout=False):
         self.first = first
@@ -33,6 +36,10 @@ class KubbResult(MatchResult):
     def __str__(self):
         return 'KubbResult(timeout=%s, first=%s, second=%s)' % (self.timeout, self.first, self.second)
 
+    def scores(self):
+        # -1 for missing values, as in KubbResultColumn
+        return (-1 if self.first is None else self.first), (-1 if self.second is None else self.second)
+
     @staticmethod
     def parse(s):
         match = KubbResult.rx.match(s)
@@ -56,38 +63,89 @@ class KubbResult(MatchResult):
             raise JoustException('Invalid syntax for Kubb result in "%s": Invalid int' % s)
         return KubbResult(first, second, timeout)
 
+    @classmethod
+    def parse_many(cls, column):
+        """Parses a column of Kubb result strings, all rows are tokenized in a single pass.
+
+        Args:
+            column: Either a list of strings or a bytes-like object with one result per line.
+
+        Returns:
+            A KubbResultColumn, invalid rows are not parsed but reported in the invalid attribute.
+        """
+        rows = tokenize_column(column, cls.column_rx)
+        res = KubbResultColumn()
+        if rows:
+            timeouts, firsts, seconds = (list(map(itemgetter(i), rows)) for i in range(3))
+            # a row is invalid if both values are missing
+            invalid = [i for i, (a, b) in enumerate(zip(firsts, seconds)) if not (a or b)]
+            fill_int_columns(res, [a or -1 for a in firsts], [b or -1 for b in seconds], invalid)
+            res.timeout = array('B', map(bool, timeouts))
+            for i in res.invalid:
+                res.timeout[i] = 0
+        return res
+
     def winner(self):
-        if self.first == self.second:
+        # a missing value means no remaining kubbs
+        first, second = self.first or 0, self.second or 0
+        if first == second:
             return 'draw'
-        if self.first > self.second:
+        if first > second:
             return 'two'
         else:
             return 'one'
 
-    @staticmethod
-    def sort_ranking(match_table):
-        # TODO test
-        left_map = dict()
-        for team in match_table.points():
-            left_map[team] = 0
-        # iterate over each match
-        for (team_one, team_two), entry in match_table.matches:
-            assert isinstance(entry, KubbResult)
-            if entry.first is not None:
-                left_map[team_one] += entry.first
-            if entry.second is not None:
-                left_map[team_two] += entry.second
-        ranking = []
-        for team, points in match_table.points.items():
-            ranking.append((team, points, -left_map[team]))
-        ranking.sort(key=itemgetter(1, 2, 0))
-        return ranking
 
-    @staticmethod
-    def compute_ranks(match_table):
-        # TODO test
-        ranking = KubbResult.sort_ranking(match_table)
-        ranks = []
-        for (points, left), r in itertools.groupby(ranking, key=itemgetter(1, 2)):
-            ranks.append((points, left), [ e[0] for e in r ])
-        return ranks
+class KubbResultColumn(ResultColumn):
+    """A column of KubbResult results.
+
+    first and second are the remaining kubbs, -1 is stored for a missing value (None in KubbResult).
+
+    Attributes:
+        timeout: An array of 0 / 1 values, 1 if the match ended with a timeout.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.timeout = array('B')
+
+    def result(self, i):
+        first, second = self.first[i], self.second[i]
+        return KubbResult(first if first >= 0 else None, second if second >= 0 else None, bool(self.timeout[i]))
+
+    def winners(self):
+        res = array('b', (0 if a == b else (2 if a > b else 1)
+                          for a, b in zip((max(a, 0) for a in self.first), (max(b, 0) for b in self.second))))
+        for i in self.invalid:
+            res[i] = -1
+        return res
+
+
+class KubbsLeftCriterion(RankCriterion):
+    """The number of remaining kubbs of a team summed over all its matches, fewer remaining kubbs rank higher.
+
+    A missing value in a KubbResult means no remaining kubbs.
+
+    Attributes:
+        left: Dictionary mapping each team to its number of remaining kubbs.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def _change(self, team_one, team_two, result, by):
+        self.check_type(result, KubbResult)
+        self.left[team_one] += by * (result.first or 0)
+        self.left[team_two] += by * (result.second or 0)
+
+    def register_match(self, team_one, team_two, result):
+        self._change(team_one, team_two, result, 1)
+
+    def unregister_match(self, team_one, team_two, result):
+        self._change(team_one, team_two, result, -1)
+
+    def reset(self):
+        self.left = defaultdict(int)
+
+    def keys(self, team):
+        return self.left[team],
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Team ratings (Elo and Glicko) computed from match results.
+
+Ratings are updated in batches (rating periods): all matches of a batch are evaluated with the ratings from before the
+batch. Team identifiers are mapped to dense ints, the ratings are stored in arrays indexed by these ints.
+
+Ratings can be used as a seeding source (seeding returns the teams ordered by rating, see groups_by_size, SwissSystem
+and KOTree.seeded) and as win probabilities (probabilities can be passed to simulation.simulate_positions).
+"""
+
+import abc
+import math
+from array import array
+
+from .utils import JoustException
+
+_SCORES = {'one': 1.0, 'draw': 0.5, 'two': 0.0}
+
+
+def _score(result):
+    # the score of team one: 1 for a win, 0.5 for a draw and 0 for a loss
+    winner = result if isinstance(result, str) else result.winner()
+    try:
+        return _SCORES[winner]
+    except KeyError:
+        raise JoustException('Invalid winner "%s"' % str(winner))
+
+
+class Rating(abc.ABC):
+    """Base class for ratings.
+
+    Args:
+        initial: The rating of a team that hasn't played yet.
+        draw: The probability of a draw between two teams with the same rating, used by probabilities.
+
+    Attributes:
+        team_ids: List of all rated team identifiers, the int of a team is its position in this list.
+        team_index: Dictionary mapping team identifiers to ints.
+        ratings: Array of floats, the rating of each team.
+    """
+    def __init__(self, initial=1500.0, draw=0.0):
+        self.initial = initial
+        self.draw = draw
+        self.team_ids = []
+        self.team_index = dict()
+        self.ratings = array('d')
+
+    def _intern(self, team):
+        i = self.team_index.get(team)
+        if i is None:
+            i = len(self.team_ids)
+            self.team_index[team] = i
+            self.team_ids.append(team)
+            self._add_team()
+        return i
+
+    def _add_team(self):
+        # extends the arrays for a new team
+        self.ratings.append(self.initial)
+
+    def _intern_matches(self, matches):
+        result = []
+        for team_one, team_two, entry in matches:
+            result.append((self._intern(team_one), self._intern(team_two), _score(entry)))
+        return result
+
+    def rating(self, team):
+        """Returns the rating of a team (initial if the team hasn't played yet)."""
+        i = self.team_index.get(team)
+        return self.initial if i is None else self.ratings[i]
+
+    @abc.abstractmethod
+    def expected(self, team_one, team_two):
+        """Returns the expected score of team one (1 for a win, 0.5 for a draw) against team two."""
+        pass
+
+    @abc.abstractmethod
+    def update(self, matches):
+        """Updates the ratings with a batch of matches (a rating period).
+
+        Args:
+            matches: An iterable of tuples (team_one, team_two, result) where result implements MatchComparator or is a
+                winner string ('one', 'two' or 'draw').
+
+        Raises:
+            JoustException: If a winner is invalid.
+        """
+        pass
+
+    def update_many(self, periods):
+        """Calls update for each batch of matches in periods (in this order)."""
+        for matches in periods:
+            self.update(matches)
+
+    def probabilities(self, team_one, team_two):
+        """Returns the probabilities (p_one, p_draw, p_two) that team one wins, that the match is a draw and that team
+        two wins.
+
+        The probability of a draw is draw for teams with the same rating and decreases linearly with the expected
+        score, the expected score of team one is p_one + p_draw / 2. This function can be used as probabilities in
+        simulation.simulate_positions.
+        """
+        e = self.expected(team_one, team_two)
+        p_draw = self.draw * (1.0 - abs(2.0 * e - 1.0))
+        return e - p_draw / 2, p_draw, 1.0 - e - p_draw / 2
+
+    def seeding(self, teams):
+        """Returns the teams ordered by rating (highest first), teams with the same rating keep their order.
+
+        Examples:
+            groups_by_size(4, teams, seeding=rating.seeding)
+            SwissSystem(teams, seeding=rating.seeding)
+            KOTree.seeded(rating.seeding(teams))
+        """
+        return sorted(teams, key=self.rating, reverse=True)
+
+
+class EloRating(Rating):
+    """Elo ratings.
+
+    The expected score of team one is 1 / (1 + 10 ** ((r_two - r_one) / scale)), after a batch each team gets
+    k * (score - expected score) for each match.
+
+    Args:
+        k: The K-factor.
+        initial: The rating of a team that hasn't played yet.
+        scale: The rating difference at which the expected score of the stronger team is 10 / 11.
+        draw: See Rating.
+    """
+    def __init__(self, k=32.0, initial=1500.0, scale=400.0, draw=0.0):
+        super().__init__(initial, draw)
+        self.k = k
+        self.scale = scale
+
+    def expected(self, team_one, team_two):
+        return 1.0 / (1.0 + 10.0 ** ((self.rating(team_two) - self.rating(team_one)) / self.scale))
+
+    def update(self, matches):
+        matches = self._intern_matches(matches)
+        ratings, k, scale = self.ratings, self.k, self.scale
+        deltas = array('d', bytes(8 * len(ratings)))
+        for i, j, s in matches:
+            d = k * (s - 1.0 / (1.0 + 10.0 ** ((ratings[j] - ratings[i]) / scale)))
+            deltas[i] += d
+            deltas[j] -= d
+        for i, d in enumerate(deltas):
+            ratings[i] += d
+
+
+_Q = math.log(10) / 400
+
+
+class GlickoRating(Rating):
+    """Glicko ratings: each team has a rating and a rating deviation (RD) describing the uncertainty of the rating.
+
+    This is the Glicko system as described by Mark E. Glickman, "Parameter estimation in large dynamic paired comparison
+    experiments" (1999). At the beginning of each batch the RD of all rated teams increases to
+    min(sqrt(RD**2 + c**2), initial_rd).
+
+    Args:
+        initial: The rating of a team that hasn't played yet.
+        initial_rd: The RD of a team that hasn't played yet and the maximum RD.
+        c: Controls the increase of the RD between batches.
+        draw: See Rating.
+
+    Attributes:
+        rds: Array of floats, the RD of each team.
+    """
+    def __init__(self, initial=1500.0, initial_rd=350.0, c=0.0, draw=0.0):
+        super().__init__(initial, draw)
+        self.initial_rd = initial_rd
+        self.c = c
+        self.rds = array('d')
+
+    def _add_team(self):
+        super()._add_team()
+        self.rds.append(self.initial_rd)
+
+    def rd(self, team):
+        """Returns the rating deviation of a team (initial_rd if the team hasn't played yet)."""
+        i = self.team_index.get(team)
+        return self.initial_rd if i is None else self.rds[i]
+
+    @staticmethod
+    def _g(rd):
+        return 1.0 / math.sqrt(1.0 + 3.0 * _Q * _Q * rd * rd / (math.pi * math.pi))
+
+    def expected(self, team_one, team_two):
+        g = self._g(math.sqrt(self.rd(team_one) ** 2 + self.rd(team_two) ** 2))
+        return 1.0 / (1.0 + 10.0 ** (-g * (self.rating(team_one) - self.rating(team_two)) / 400))
+
+    def update(self, matches):
+        rds = self.rds
+        if self.c:
+            c2, max_rd = self.c * self.c, self.initial_rd
+            for i, rd in enumerate(rds):
+                rds[i] = min(math.sqrt(rd * rd + c2), max_rd)
+        matches = self._intern_matches(matches)
+        ratings, g = self.ratings, self._g
+        n = len(ratings)
+        # sums of g^2 * E * (1 - E) and g * (s - E) over all matches of each team
+        information = array('d', bytes(8 * n))
+        improvement = array('d', bytes(8 * n))
+        g_values = [g(rd) for rd in rds]
+        for i, j, s in matches:
+            for a, b, score in ((i, j, s), (j, i, 1.0 - s)):
+                g_b = g_values[b]
+                e = 1.0 / (1.0 + 10.0 ** (-g_b * (ratings[a] - ratings[b]) / 400))
+                information[a] += g_b * g_b * e * (1.0 - e)
+                improvement[a] += g_b * (score - e)
+        for a in range(n):
+            if information[a] == 0.0:
+                continue
+            denominator = 1.0 / (rds[a] * rds[a]) + _Q * _Q * information[a]
+            ratings[a] += _Q / denominator * improvement[a]
+            rds[a] = math.sqrt(1.0 / denominator)
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Replication of a tournament from a primary to read-only replicas over TCP or Unix sockets.
+
+The primary (a TournamentRecorder) numbers all events and sends them to all connected replicas, the replicas apply them
+to their own copy of the tournament (see journal.apply_event).
+
+Each message consists of a header (message type, sequence number and payload length) and the payload. A replica
+starts with a HELLO message containing the epoch of the primary it last received events from and the sequence number
+of its last event. If the primary still has all later events in its history it sends them, otherwise (or if the epoch
+differs) it sends a snapshot of the tournament first. Afterwards all new events are sent as they are recorded. A replica
+that falls too far behind (see Primary) is disconnected, it catches up after reconnecting.
+
+Addresses are tuples (host, port) for TCP and strings (a path) for Unix sockets.
+"""
+
+import collections
+import queue
+import socket
+import struct
+import threading
+import uuid
+
+from . import snapshot
+from .journal import TournamentRecorder, apply_event, decode_event
+from .utils import JoustException
+
+# message types
+HELLO, SNAPSHOT, EVENT = range(1, 4)
+
+_HEADER = struct.Struct('<BQI')
+_NO_STATE = 2 ** 64 - 1
+
+
+def _family(address):
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+def _send(sock, kind, seq, payload=b''):
+    sock.sendall(_HEADER.pack(kind, seq, len(payload)) + payload)
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv(sock):
+    # returns a tuple (kind, seq, payload) or None if the connection was closed
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    kind, seq, length = _HEADER.unpack(header)
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        return None
+    return kind, seq, payload
+
+
+class Primary(TournamentRecorder):
+    """A TournamentRecorder that sends all events to connected replicas.
+
+    All changes must be done through the methods of the recorder (set_match, add_tie_breaker, add_phase), they're
+    protected by lock. Other threads reading the tournament should hold lock as well.
+
+    Args:
+        tournament: The tournament.
+        journal: An optional Journal for the same tournament, events are also recorded there and the sequence numbers
+            of the journal are used.
+        history: The number of events kept in memory, replicas that are further behind receive a snapshot.
+        epoch: A UUID identifying the history of events. Replicas with a different epoch always receive a snapshot.
+            By default a new UUID is created, pass a stable one (together with a journal) if replicas should catch up
+            after a restart of the primary.
+        max_pending: The maximum number of messages waiting to be sent to a replica. If a replica doesn't keep up its
+            connection is closed, it catches up (possibly with a snapshot) after reconnecting.
+
+    Attributes:
+        seq: The sequence number of the last event.
+        lock: The lock protecting the tournament.
+    """
+    def __init__(self, tournament, journal=None, history=4096, epoch=None, max_pending=4096):
+        if max_pending < 1:
+            raise ValueError('max_pending must be at least 1')
+        super().__init__(tournament)
+        self.journal = journal
+        self.seq = 0 if journal is None else journal.seq
+        self.history = collections.deque(maxlen=history)
+        self.epoch = uuid.uuid4() if epoch is None else epoch
+        self.max_pending = max_pending
+        self.lock = threading.RLock()
+        # maps the queue of each connected replica to its connection
+        self._subscribers = {}
+        self._server = None
+        self._accept_thread = None
+
+    def apply(self, event):
+        with self.lock:
+            if self.journal is not None and self.journal.write_error is not None:
+                raise JoustException('Journal is inconsistent after a failed write, restore it with open')
+            return super().apply(event)
+
+    def record(self, event, payload):
+        if self.journal is not None:
+            self.journal.record(event, payload)
+            self.seq = self.journal.seq
+        else:
+            self.seq += 1
+        self.history.append((self.seq, payload))
+        for q, conn in list(self._subscribers.items()):
+            try:
+                q.put_nowait((EVENT, self.seq, payload))
+            except queue.Full:
+                self._drop(q, conn)
+
+    def _drop(self, q, conn):
+        # disconnects a replica, lock must be held
+        del self._subscribers[q]
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        q.put_nowait(None)
+
+    def serve(self, address, backlog=16):
+        """Starts accepting replicas in a background thread.
+
+        Args:
+            address: A tuple (host, port) for TCP (port 0 chooses a free port) or the path of a Unix socket.
+            backlog: Passed to listen.
+
+        Returns:
+            The address the server is bound to.
+        """
+        server = socket.socket(_family(address), socket.SOCK_STREAM)
+        if server.family == socket.AF_INET:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen(backlog)
+        self._server = server
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+        return server.getsockname()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        q = queue.Queue(maxsize=self.max_pending)
+        try:
+            message = _recv(conn)
+            if message is None or message[0] != HELLO:
+                return
+            _, seq, payload = message
+            with self.lock:
+                oldest = self.history[0][0] if self.history else self.seq + 1
+                if (payload != self.epoch.bytes or seq == _NO_STATE or seq > self.seq or seq + 1 < oldest or
+                        self.seq - seq > self.max_pending):
+                    q.put_nowait((SNAPSHOT, self.seq, self.epoch.bytes + snapshot.dumps(self.tournament)))
+                    seq = self.seq
+                for event_seq, event in self.history:
+                    if event_seq > seq:
+                        q.put_nowait((EVENT, event_seq, event))
+                self._subscribers[q] = conn
+            while True:
+                item = q.get()
+                if item is None:
+                    return
+                _send(conn, *item)
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self._subscribers.pop(q, None)
+            conn.close()
+
+    def close(self):
+        """Stops accepting replicas and closes all connections."""
+        if self._server is not None:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+            self._accept_thread.join()
+            self._server = None
+        with self.lock:
+            for q, conn in list(self._subscribers.items()):
+                self._drop(q, conn)
+
+
+class Replica(object):
+    """A read-only copy of a tournament that receives all changes from a Primary.
+
+    start connects to the primary in a background thread and applies all events it receives. If the connection is
+    lost the replica reconnects and continues with the next event it is missing.
+
+    Args:
+        address: The address of the primary, see Primary.serve.
+        on_event: An optional function called with each event after it has been applied (and with None after a
+            snapshot has been loaded), lock is held during the call. Exceptions raised by it are stored in error, the
+            replica keeps receiving events.
+        retry_interval: Seconds to wait before reconnecting.
+
+    Attributes:
+        tournament: The tournament, None until the first snapshot has been received.
+        seq: The sequence number of the last applied event.
+        lock: Hold this lock while reading tournament.
+        error: The last error (connection problems, inconsistent events or an exception raised by on_event) or None.
+    """
+    def __init__(self, address, on_event=None, retry_interval=1.0):
+        self.address = address
+        self.on_event = on_event
+        self.retry_interval = retry_interval
+        self.tournament = None
+        self.seq = None
+        self.epoch = None
+        self.error = None
+        self.lock = threading.RLock()
+        self._changed = threading.Condition(self.lock)
+        self._stop = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        """Starts receiving events in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._sock = socket.socket(_family(self.address), socket.SOCK_STREAM)
+                self._sock.connect(self.address)
+                with self.lock:
+                    seq = _NO_STATE if self.tournament is None else self.seq
+                    epoch = bytes(16) if self.epoch is None else self.epoch.bytes
+                _send(self._sock, HELLO, seq, epoch)
+                while True:
+                    message = _recv(self._sock)
+                    if message is None:
+                        break
+                    self._receive(*message)
+            except Exception as e:
+                # keep the thread alive, the replica reconnects and requests a snapshot if its state is unknown
+                self.error = e
+            finally:
+                self._sock.close()
+            self._stop.wait(self.retry_interval)
+
+    def _receive(self, kind, seq, payload):
+        with self.lock:
+            if kind == SNAPSHOT:
+                tournament = snapshot.loads(payload[16:])
+                self.epoch = uuid.UUID(bytes=payload[:16])
+                self.tournament = tournament
+                self.seq = seq
+                event = None
+            elif kind == EVENT:
+                try:
+                    if self.tournament is None or seq != self.seq + 1:
+                        raise JoustException('Unexpected event %d' % seq)
+                    event = decode_event(payload)
+                    apply_event(self.tournament, event)
+                except Exception:
+                    # the state is unknown now, request a snapshot on the next connection
+                    self.tournament = None
+                    raise
+                self.seq = seq
+            else:
+                raise JoustException('Invalid message type %d' % kind)
+            self._changed.notify_all()
+            if self.on_event is not None:
+                try:
+                    self.on_event(event)
+                except Exception as e:
+                    self.error = e
+
+    def wait_for(self, seq, timeout=None):
+        """Waits until the event with sequence number seq has been applied.
+
+        Returns:
+            True if the event has been applied, False on timeout.
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.seq is not None and self.seq >= seq, timeout)
+
+    def disconnect(self):
+        """Closes the current connection, the replica reconnects after retry_interval."""
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        """Closes the connection and stops the background thread."""
+        self._stop.set()
+        self.disconnect()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
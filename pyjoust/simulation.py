@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Monte Carlo simulation of the final positions in a table.
+
+The points of a table are encoded as ints (see encode_points) so that a trial only adds ints and sorts a list. Only if
+the table has tie-breakers (criteria or head to head, see MatchTable) and a trial ends with teams on the same points the
+sampled results are registered with copies of the criteria (one copy per shard, only results that differ from the
+previous such trial are registered) and the teams are ordered by their ranking keys (see MatchTable.ranking_keys). For
+head to head (or criteria without unregister_match) the results are set in a copy of the table instead. Teams that are
+still equal are ordered randomly in each trial.
+"""
+
+import copy
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from .compact import CompactMatchTable
+from .group import MatchTable
+from .utils import TwoPoints, JoustException
+
+_TWO_POINTS_FACTOR = 2 ** 32
+
+
+def encode_points(points):
+    """Encodes points as an int (or float) such that the order of the encoded values is the order of the points.
+
+    Ints and floats are returned unchanged, TwoPoints p are encoded as p.plus * 2**32 - p.minus. Thus sums of
+    encoded points are the encoded sums as long as the minus points stay below 2**32.
+    """
+    if isinstance(points, TwoPoints):
+        return points.plus * _TWO_POINTS_FACTOR - points.minus
+    return points
+
+
+def equal_probabilities(team_one, team_two):
+    """The default for simulate_positions: Win, draw and loss are equally likely."""
+    return 1 / 3, 1 / 3, 1 / 3
+
+
+def table_state(table):
+    """Returns the teams, their encoded points and the unplayed fixtures of a MatchTable or CompactMatchTable.
+
+    Returns:
+        A tuple (teams, points, fixtures) where points[i] is the encoded points of teams[i] and fixtures is a list of
+        tuples (team_one, team_two) of all matches without a result.
+    """
+    if isinstance(table, CompactMatchTable):
+        teams = list(table.team_ids)
+        points = [encode_points(p) for p in table.point_values()]
+        fixtures = [(teams[i], teams[j]) for i, j, code in zip(table.fixture_one, table.fixture_two, table.results)
+                    if code < 0]
+    else:
+        teams = list(table.group)
+        points = [encode_points(table.points[team]) for team in teams]
+        fixtures = [pair for pair, entry in table.matches.items() if entry is None]
+    return teams, points, fixtures
+
+
+def has_tie_breakers(table):
+    """Returns True if table ranks teams with the same points by criteria or head to head results (see MatchTable)."""
+    return isinstance(table, MatchTable) and bool(table.criteria or table.head_to_head)
+
+
+def _outcome_results(table, results):
+    # the results set in the table for a simulated win of team one, a draw and a win of team two
+    if results is None:
+        by_winner = dict()
+        for s in ('1:0', '0:0', '0:1'):
+            try:
+                entry = table.cmp_class.parse(s)
+            except JoustException:
+                continue
+            by_winner.setdefault(entry.winner(), entry)
+        if len(by_winner) != 3:
+            raise JoustException("Can't create simulated results for %s, results must be given" %
+                                 table.cmp_class.__name__)
+        return by_winner['one'], by_winner['draw'], by_winner['two']
+    if len(results) != 3:
+        raise JoustException('Expected three results (win of team one, draw, win of team two)')
+    return tuple(results)
+
+
+def _head_to_head_order(table, index, shuffle):
+    # the ranks of table as indices of teams, teams in the same rank are ordered randomly
+    order = []
+    for _, rank in table.compute_ranks():
+        rank = [index[team] for team in rank]
+        shuffle(rank)
+        order.extend(rank)
+    return order
+
+
+def _simulate(args):
+    # runs trials with a fixed seed, returns a flat list of counts: counts[team * n + position]
+    points, fixtures, win, draw, lose, trials, seed, tie_breaking = args
+    n = len(points)
+    rnd = random.Random(seed)
+    uniform, shuffle = rnd.random, rnd.shuffle
+    counts = [0] * (n * n)
+    order = list(range(n))
+    # the outcome of each fixture: 0 if team one wins, 1 on a draw and 2 if team two wins
+    outcomes = [0] * len(fixtures)
+    if tie_breaking is not None:
+        table, teams, pairs, results = tie_breaking
+        index = {team: i for i, team in enumerate(teams)}
+        if table.head_to_head or not all(criterion.can_unregister() for criterion in table.criteria):
+            # the ranks depend on the mutual matches (or criteria must be rebuilt), so the results are set in a copy of
+            # the table
+            table = copy.deepcopy(table)
+            criteria = None
+        else:
+            # only copies of the criteria are updated, the keys are formed with the simulated points
+            criteria = copy.deepcopy(table.criteria)
+        # the outcome currently registered for each fixture, -1 for no result
+        registered = [-1] * len(fixtures)
+    for _ in range(trials):
+        current = points[:]
+        for f, (i, j, p_one, p_not_two) in enumerate(fixtures):
+            r = uniform()
+            if r < p_one:
+                current[i] += win
+                current[j] += lose
+                outcomes[f] = 0
+            elif r < p_not_two:
+                current[i] += draw
+                current[j] += draw
+                outcomes[f] = 1
+            else:
+                current[i] += lose
+                current[j] += win
+                outcomes[f] = 2
+        # shuffling first breaks ties randomly (sort is stable)
+        shuffle(order)
+        order.sort(key=current.__getitem__, reverse=True)
+        if tie_breaking is not None and any(current[order[k]] == current[order[k + 1]] for k in range(n - 1)):
+            # only the results that differ from the last tie-breaking trial are registered
+            for f, outcome in enumerate(outcomes):
+                old = registered[f]
+                if old == outcome:
+                    continue
+                team_one, team_two = pairs[f]
+                if criteria is None:
+                    table.set_match(team_one, team_two, results[outcome])
+                else:
+                    for criterion in criteria:
+                        if old >= 0:
+                            criterion.unregister_match(team_one, team_two, results[old])
+                        criterion.register_match(team_one, team_two, results[outcome])
+                registered[f] = outcome
+            if criteria is None and table.head_to_head:
+                order = _head_to_head_order(table, index, shuffle)
+            else:
+                # as MatchTable.ranking_keys, teams equal in all keys keep their random order
+                if criteria is None:
+                    keys = [k[1:] for k in map(table.ranking_keys().__getitem__, teams)]
+                else:
+                    keys = [tuple(-k for criterion in criteria for k in criterion.keys(team)) for team in teams]
+                keys = [(current[i],) + key for i, key in enumerate(keys)]
+                order.sort(key=keys.__getitem__, reverse=True)
+        for position, team in enumerate(order):
+            counts[team * n + position] += 1
+    return counts
+
+
+def simulate_positions(table, trials=100000, probabilities=None, seed=None, shard_size=10000, parallel=False,
+                       max_workers=None, results=None):
+    """Estimates for each team the probability to finish in each position of a table.
+
+    All matches without a result are sampled according to probabilities, the points are awarded with the win, draw
+    and lose values of the table. If the table has tie-breakers (see has_tie_breakers) teams with the same points are
+    ordered by them: The sampled outcomes are registered as results (see the results argument) with copies of the
+    criteria and the ranking keys are used, for head to head they're set in a copy of the table and its ranks are
+    used. Teams that are equal according to points and all tie-breakers are ordered randomly in each trial (and not
+    by their identifiers as in sort_ranking).
+
+    The trials are split into shards of shard_size trials, each shard uses its own random generator seeded from seed.
+    Thus the result only depends on seed (not on parallel or max_workers).
+
+    Args:
+        table: A MatchTable or CompactMatchTable.
+        trials: The number of simulated outcomes.
+        probabilities: A function (team_one, team_two) -> (p_one, p_draw, p_two) returning the probabilities that team
+            one wins, that the match is a draw and that team two wins. Defaults to equal_probabilities.
+        seed: The seed for the random generators, None for a random seed.
+        shard_size: The number of trials per shard.
+        parallel: If True the shards are simulated in a process pool.
+        max_workers: The maximum number of processes, see concurrent.futures.ProcessPoolExecutor.
+        results: A tuple (result_one, result_draw, result_two) of the results that are set for a sampled win of team
+            one, a draw and a win of team two when ties are broken by the table. Criteria that depend on the scores
+            (for example GoalDifferenceCriterion) see these scores. By default the strings '1:0', '0:0' and '0:1' are
+            parsed with the cmp_class of the table.
+
+    Returns:
+        A tuple (teams, matrix) where matrix[i][k] is the probability that teams[i] finishes in position k (starting
+        with 0 for the first position).
+
+    Raises:
+        JoustException: If probabilities returns invalid probabilities or if no results for tie-breaking can be created.
+    """
+    if probabilities is None:
+        probabilities = equal_probabilities
+    teams, points, fixtures = table_state(table)
+    index = {team: i for i, team in enumerate(teams)}
+    encoded = []
+    for team_one, team_two in fixtures:
+        p_one, p_draw, p_two = probabilities(team_one, team_two)
+        total = p_one + p_draw + p_two
+        if min(p_one, p_draw, p_two) < 0 or not total > 0:
+            raise JoustException('Invalid probabilities for "%s vs %s": %s' %
+                                 (str(team_one), str(team_two), str((p_one, p_draw, p_two))))
+        encoded.append((index[team_one], index[team_two], p_one / total, (p_one + p_draw) / total))
+    win, draw, lose = encode_points(table.win), encode_points(table.draw), encode_points(table.lose)
+    tie_breaking = None
+    if has_tie_breakers(table):
+        tie_breaking = (table, teams, fixtures, _outcome_results(table, results))
+    seeds = random.Random(seed)
+    jobs = []
+    for start in range(0, trials, shard_size):
+        jobs.append((points, encoded, win, draw, lose, min(shard_size, trials - start), seeds.getrandbits(64),
+                     tie_breaking))
+    if parallel and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_simulate, jobs))
+    else:
+        results = [_simulate(job) for job in jobs]
+    n = len(teams)
+    counts = [0] * (n * n)
+    for result in results:
+        for i, count in enumerate(result):
+            counts[i] += count
+    matrix = [[count / trials if trials else 0.0 for count in counts[i * n:(i + 1) * n]] for i in range(n)]
+    return teams, matrix
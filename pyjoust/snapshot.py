@@ -0,0 +1,877 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Saving and loading tournaments in a compact versioned binary format.
+
+A snapshot starts with a fixed size header (magic bytes, format version and the offsets of the sections at the end of
+the file), followed by one blob for each phase in Tournament.rounds. After the phases follow the team table (each team
+identifier is stored exactly once, everything else refers to teams by their position in this table), the tournament
+section (class and attributes of the tournament) and the phase index (key, offset and length of each phase blob).
+
+load memory-maps the file and only decodes the header, the team table, the tournament section and the index, phases
+are decoded on first access (see LazyPhases). Saving a tournament that was loaded this way copies the blobs of phases
+that have not been accessed without decoding them.
+
+Supported are GroupPhase (with MatchTable or CompactMatchTable tables), KOPhase, DoubleEliminationPhase and
+TournamentPhase wrapping one of them. Results must be GoalScore or KubbResult objects with scores that fit into 64 bits.
+Criteria of tables must either be OpponentCriterion objects or have a constructor without arguments. Other values
+(keys, attributes, team identifiers) may be None, bool, int, float, str, uuid.UUID, TwoPoints, classes and lists,
+tuples and dicts of these.
+"""
+
+import inspect
+import json
+import mmap
+import struct
+import sys
+import uuid
+from array import array
+from collections.abc import MutableMapping
+
+from .utils import JoustException, TwoPoints, GoalScore, RankCriterion, OpponentCriterion
+from .kubb import KubbResult
+from .group import MatchTable
+from .compact import CompactMatchTable
+from .tournament import (GroupPhase, KOPhase, DoubleEliminationPhase, TournamentPhase, Tournament, RematchBreaker,
+                         CoinTieBreaker, AdditionalMatch)
+
+MAGIC = b'PYJOUST\x00'
+VERSION = 3
+
+_HEADER = struct.Struct('<8sHHQQQ')
+_BYTE = struct.Struct('<B')
+_UINT = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_TEAM = struct.Struct('<i')
+_OFFSET = struct.Struct('<QQ')
+_GOAL_SCORE = struct.Struct('<qq')
+_KUBB_RESULT = struct.Struct('<qqB')
+
+# value tags
+(_NONE, _FALSE, _TRUE, _SMALL_INT, _BIG_INT, _FLOAT_TAG, _STR, _UUID, _TWO_POINTS, _LIST, _TUPLE, _DICT, _TEAM_TAG,
+ _RESULT, _CLASS) = range(15)
+
+# result tags
+_NO_RESULT, _GOAL_SCORE_TAG, _KUBB_RESULT_TAG = range(3)
+
+# phase tags
+_GROUP_PHASE, _KO_PHASE, _DOUBLE_ELIMINATION_PHASE, _TOURNAMENT_PHASE = range(1, 5)
+
+# table tags
+_MATCH_TABLE, _COMPACT_TABLE = range(1, 3)
+
+# tie breaker tags
+_REMATCH_BREAKER, _COIN_BREAKER = range(1, 3)
+
+# tournament attribute tags: a plain value, a phase in rounds or the phase wrapped by a TournamentPhase in rounds
+_ATTR_VALUE, _ATTR_ROUND, _ATTR_INNER_PHASE = range(3)
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def _array_bytes(typecode, values):
+    a = array(typecode, values)
+    if _BIG_ENDIAN:
+        a.byteswap()
+    return a.tobytes()
+
+
+def _class_path(cls):
+    return '%s:%s' % (cls.__module__, cls.__qualname__)
+
+
+def _resolve_class(path, base):
+    """Returns the class for a path created by _class_path.
+
+    Only modules that have already been imported are considered (loading a snapshot never imports code) and the class
+    must be a subclass of base.
+    """
+    module_name, _, qualname = path.partition(':')
+    obj = sys.modules.get(module_name)
+    if obj is None:
+        raise JoustException('Unknown module "%s" in snapshot' % module_name)
+    for attr in qualname.split('.'):
+        obj = getattr(obj, attr, None)
+    if not isinstance(obj, type) or not issubclass(obj, base):
+        raise JoustException('Invalid class "%s" in snapshot' % path)
+    return obj
+
+
+class _Writer(object):
+    """Encodes values into a bytearray.
+
+    Args:
+        teams: A dictionary mapping team identifiers to their position in the team table, new teams are added to it.
+            If None teams are stored as values.
+    """
+    def __init__(self, teams=None):
+        self.buf = bytearray()
+        self.teams = teams
+
+    def byte(self, value):
+        self.buf += _BYTE.pack(value)
+
+    def uint(self, value):
+        self.buf += _UINT.pack(value)
+
+    def string(self, s):
+        data = s.encode('utf-8')
+        self.uint(len(data))
+        self.buf += data
+
+    def array(self, typecode, values):
+        values = array(typecode, values)
+        self.uint(len(values))
+        self.buf += _array_bytes(typecode, values)
+
+    def team_id(self, team):
+        if team is None:
+            return -1
+        team_id = self.teams.get(team)
+        if team_id is None:
+            team_id = len(self.teams)
+            self.teams[team] = team_id
+        return team_id
+
+    def team(self, team):
+        if self.teams is None:
+            self.value(team)
+        else:
+            self.byte(_TEAM_TAG)
+            self.buf += _TEAM.pack(self.team_id(team))
+
+    def team_array(self, teams):
+        self.array('i', (self.team_id(team) for team in teams))
+
+    def result(self, result):
+        if result is None:
+            self.byte(_NO_RESULT)
+            return
+        try:
+            if type(result) is GoalScore:
+                data = _GOAL_SCORE_TAG, _GOAL_SCORE.pack(result.goals_one, result.goals_two)
+            elif type(result) is KubbResult:
+                first, second = result.scores()
+                data = _KUBB_RESULT_TAG, _KUBB_RESULT.pack(first, second, bool(result.timeout))
+            else:
+                raise JoustException('Can not store result of type %s' % type(result).__name__)
+        except struct.error:
+            raise JoustException('Can not store result %s: scores must be ints that fit into 64 bits' % str(result))
+        self.byte(data[0])
+        self.buf += data[1]
+
+    def value(self, v):
+        if v is None:
+            self.byte(_NONE)
+        elif v is True:
+            self.byte(_TRUE)
+        elif v is False:
+            self.byte(_FALSE)
+        elif type(v) is int:
+            if -2 ** 63 <= v < 2 ** 63:
+                self.byte(_SMALL_INT)
+                self.buf += _INT.pack(v)
+            else:
+                self.byte(_BIG_INT)
+                self.string(str(v))
+        elif type(v) is float:
+            self.byte(_FLOAT_TAG)
+            self.buf += _FLOAT.pack(v)
+        elif type(v) is str:
+            self.byte(_STR)
+            self.string(v)
+        elif type(v) is uuid.UUID:
+            self.byte(_UUID)
+            self.buf += v.bytes
+        elif type(v) is TwoPoints:
+            self.byte(_TWO_POINTS)
+            self.value(v.plus)
+            self.value(v.minus)
+        elif type(v) in (GoalScore, KubbResult):
+            self.byte(_RESULT)
+            self.result(v)
+        elif type(v) in (list, tuple):
+            self.byte(_LIST if type(v) is list else _TUPLE)
+            self.uint(len(v))
+            for element in v:
+                self.value(element)
+        elif type(v) is dict:
+            self.byte(_DICT)
+            self.uint(len(v))
+            for key, element in v.items():
+                self.value(key)
+                self.value(element)
+        elif isinstance(v, type):
+            self.byte(_CLASS)
+            self.string(_class_path(v))
+        else:
+            raise JoustException('Can not store value of type %s' % type(v).__name__)
+
+
+class _Reader(object):
+    """Decodes values written by _Writer from a buffer (bytes, memoryview or mmap).
+
+    Args:
+        data: The buffer.
+        offset: The position to start reading.
+        teams: The team table (a list) or None if teams are stored as values.
+    """
+    def __init__(self, data, offset=0, teams=None):
+        self.data = data
+        self.offset = offset
+        self.teams = teams
+
+    def unpack(self, st):
+        try:
+            values = st.unpack_from(self.data, self.offset)
+        except struct.error:
+            raise JoustException('Unexpected end of data')
+        self.offset += st.size
+        return values
+
+    def byte(self):
+        return self.unpack(_BYTE)[0]
+
+    def uint(self):
+        return self.unpack(_UINT)[0]
+
+    def raw(self, n):
+        if self.offset + n > len(self.data):
+            raise JoustException('Unexpected end of data')
+        data = bytes(self.data[self.offset:self.offset + n])
+        self.offset += n
+        return data
+
+    def string(self):
+        try:
+            return self.raw(self.uint()).decode('utf-8')
+        except UnicodeDecodeError:
+            raise JoustException('Invalid string in snapshot')
+
+    def array(self, typecode):
+        result = array(typecode)
+        n = self.uint()
+        result.frombytes(self.raw(n * result.itemsize))
+        if _BIG_ENDIAN:
+            result.byteswap()
+        return result
+
+    def team_of(self, team_id):
+        if team_id == -1:
+            return None
+        try:
+            return self.teams[team_id]
+        except IndexError:
+            raise JoustException('Invalid team reference %d' % team_id)
+
+    def team(self):
+        return self.value()
+
+    def team_array(self):
+        return [self.team_of(team_id) for team_id in self.array('i')]
+
+    def result(self):
+        tag = self.byte()
+        if tag == _NO_RESULT:
+            return None
+        elif tag == _GOAL_SCORE_TAG:
+            return GoalScore(*self.unpack(_GOAL_SCORE))
+        elif tag == _KUBB_RESULT_TAG:
+            first, second, timeout = self.unpack(_KUBB_RESULT)
+            return KubbResult(None if first < 0 else first, None if second < 0 else second, bool(timeout))
+        raise JoustException('Invalid result tag %d' % tag)
+
+    def value(self):
+        tag = self.byte()
+        if tag == _NONE:
+            return None
+        elif tag == _TRUE:
+            return True
+        elif tag == _FALSE:
+            return False
+        elif tag == _SMALL_INT:
+            return self.unpack(_INT)[0]
+        elif tag == _BIG_INT:
+            return int(self.string())
+        elif tag == _FLOAT_TAG:
+            return self.unpack(_FLOAT)[0]
+        elif tag == _STR:
+            return self.string()
+        elif tag == _UUID:
+            return uuid.UUID(bytes=self.raw(16))
+        elif tag == _TWO_POINTS:
+            return TwoPoints(self.value(), self.value())
+        elif tag == _RESULT:
+            return self.result()
+        elif tag == _LIST or tag == _TUPLE:
+            values = [self.value() for _ in range(self.uint())]
+            return values if tag == _LIST else tuple(values)
+        elif tag == _DICT:
+            return {self.value(): self.value() for _ in range(self.uint())}
+        elif tag == _TEAM_TAG:
+            if self.teams is None:
+                raise JoustException('Team reference without a team table')
+            return self.team_of(self.unpack(_TEAM)[0])
+        elif tag == _CLASS:
+            return _resolve_class(self.string(), object)
+        raise JoustException('Invalid value tag %d' % tag)
+
+
+def _write_table(w, table):
+    if isinstance(table, CompactMatchTable):
+        w.byte(_COMPACT_TABLE)
+    elif isinstance(table, MatchTable):
+        w.byte(_MATCH_TABLE)
+    else:
+        raise JoustException('Can not store table of type %s' % type(table).__name__)
+    w.string(_class_path(type(table)))
+    w.string(_class_path(table.cmp_class))
+    w.value(table.win)
+    w.value(table.draw)
+    w.value(table.lose)
+    w.team_array(table.group)
+    if isinstance(table, CompactMatchTable):
+        w.array('i', table.fixture_one)
+        w.array('i', table.fixture_two)
+        w.array('b', table.results)
+        w.array('q', table.score_one)
+        w.array('q', table.score_two)
+    else:
+        w.team_array(first for first, _ in table.matches)
+        w.team_array(second for _, second in table.matches)
+        for result in table.matches.values():
+            w.result(result)
+        _write_criteria(w, table.criteria)
+        w.value(table.head_to_head)
+
+
+def _criterion_args(criterion):
+    # the constructor arguments of a criterion, only known for OpponentCriterion and constructors without arguments
+    init = type(criterion).__init__
+    if init is OpponentCriterion.__init__:
+        return [criterion.win, criterion.draw, criterion.lose]
+    if init is object.__init__ or list(inspect.signature(init).parameters) == ['self']:
+        return []
+    raise JoustException("Can not store criterion of type %s: its constructor arguments are unknown" %
+                         type(criterion).__name__)
+
+
+def _write_criteria(w, criteria):
+    # criteria are stored as class and constructor arguments, their values are recomputed with compute_ranking
+    w.uint(len(criteria))
+    for criterion in criteria:
+        args = _criterion_args(criterion)
+        w.string(_class_path(type(criterion)))
+        w.value(args)
+
+
+def _read_criteria(r):
+    return [_resolve_class(r.string(), RankCriterion)(*r.value()) for _ in range(r.uint())]
+
+
+def _read_table(r):
+    tag = r.byte()
+    if tag not in (_MATCH_TABLE, _COMPACT_TABLE):
+        raise JoustException('Invalid table tag %d' % tag)
+    base = MatchTable if tag == _MATCH_TABLE else CompactMatchTable
+    cls = _resolve_class(r.string(), base)
+    cmp_class = _resolve_class(r.string(), object)
+    win, draw, lose = r.value(), r.value(), r.value()
+    group = r.team_array()
+    # subclasses only provide default values for win, draw and lose, so the constructor of the base is used
+    table = cls.__new__(cls)
+    if tag == _COMPACT_TABLE:
+        CompactMatchTable.__init__(table, group, [], win, draw, lose, cmp_class=cmp_class)
+        table.fixture_one = array('l', r.array('i'))
+        table.fixture_two = array('l', r.array('i'))
+        table.results = r.array('b')
+        table.score_one = r.array('q')
+        table.score_two = r.array('q')
+        n = len(table.team_ids)
+        table.fixture_index = {i * n + j: fixture for fixture, (i, j) in
+                               enumerate(zip(table.fixture_one, table.fixture_two))}
+    else:
+        pairs = list(zip(r.team_array(), r.team_array()))
+        MatchTable.__init__(table, group, pairs, win, draw, lose, cmp_class=cmp_class)
+        for pair in pairs:
+            table.matches[pair] = r.result()
+        table.criteria = _read_criteria(r)
+        table.head_to_head = r.value()
+    table.compute_ranking()
+    return table
+
+
+def _write_group_phase(w, phase):
+    w.uint(len(phase.groups))
+    for group, rounds, table in zip(phase.groups, phase.rounds, phase.tables):
+        w.team_array(group)
+        ends = []
+        pairs = []
+        for matches in rounds:
+            for pair in matches:
+                pairs.extend(pair)
+            ends.append(len(pairs) // 2)
+        w.array('i', ends)
+        w.team_array(pairs)
+        _write_table(w, table)
+
+
+def _read_group_phase(r):
+    groups, rounds, tables = [], [], []
+    for _ in range(r.uint()):
+        groups.append(r.team_array())
+        ends = r.array('i')
+        teams = r.team_array()
+        pairs = list(zip(teams[::2], teams[1::2]))
+        start = 0
+        group_rounds = []
+        for end in ends:
+            group_rounds.append(pairs[start:end])
+            start = end
+        rounds.append(group_rounds)
+        tables.append(_read_table(r))
+    return GroupPhase.from_parts(groups, rounds, tables)
+
+
+def _write_ko_phase(w, phase):
+    w.team_array(phase.teams)
+    matches = phase.tree.matches
+    w.array('i', (first for first, _ in matches))
+    w.array('i', (second for _, second in matches))
+    for result in matches.values():
+        w.result(result)
+
+
+def _read_ko_phase(r):
+    phase = KOPhase(r.team_array())
+    matches = list(zip(r.array('i'), r.array('i')))
+    results = [r.result() for _ in matches]
+    # children have higher ids than their parents, so this replays the bracket round by round
+    for (first, second), result in sorted(zip(matches, results), key=lambda e: e[0][0], reverse=True):
+        phase.tree.set_match(first, second, result)
+    return phase
+
+
+def _write_double_elimination_phase(w, phase):
+    tree = phase.tree
+    w.team_array(phase.teams)
+    w.byte(tree.reset_match is not None)
+    played = [m for m in tree.order if tree.result_id[m] >= 0]
+    w.array('i', played)
+    for m in played:
+        w.result(tree.results[tree.result_id[m]])
+
+
+def _read_double_elimination_phase(r):
+    phase = DoubleEliminationPhase(r.team_array(), reset=bool(r.byte()))
+    played = r.array('i')
+    for m in played:
+        phase.tree.set_match(m, r.result())
+    return phase
+
+
+def _write_tie_breaker(w, breaker):
+    if type(breaker) is RematchBreaker:
+        w.byte(_REMATCH_BREAKER)
+        w.team(breaker.team_one)
+        w.team(breaker.team_two)
+        w.result(breaker.result)
+    elif type(breaker) is CoinTieBreaker:
+        w.byte(_COIN_BREAKER)
+        w.team(breaker.team_one)
+        w.team(breaker.team_two)
+        w.value(breaker.result)
+    else:
+        raise JoustException('Can not store tie breaker of type %s' % type(breaker).__name__)
+
+
+def _read_tie_breaker(r):
+    tag = r.byte()
+    if tag == _REMATCH_BREAKER:
+        return RematchBreaker(r.team(), r.team(), r.result())
+    elif tag == _COIN_BREAKER:
+        # don't toss a coin again
+        breaker = CoinTieBreaker.__new__(CoinTieBreaker)
+        breaker.team_one, breaker.team_two, breaker.result = r.team(), r.team(), r.value()
+        return breaker
+    raise JoustException('Invalid tie breaker tag %d' % tag)
+
+
+def _write_tournament_phase(w, phase):
+    _write_phase(w, phase.phase)
+    w.value(phase.final_result)
+    w.uint(len(phase.tie_breakers))
+    for key, breaker in phase.tie_breakers.items():
+        w.value(key)
+        _write_tie_breaker(w, breaker)
+    w.uint(len(phase.additional_matches))
+    for key, match in phase.additional_matches.items():
+        w.value(key)
+        w.team(match.team_one)
+        w.team(match.team_two)
+        w.result(match.result)
+
+
+def _read_tournament_phase(r):
+    phase = TournamentPhase(_read_phase(r))
+    phase.final_result = r.value()
+    for _ in range(r.uint()):
+        key = r.value()
+        phase.tie_breakers[key] = _read_tie_breaker(r)
+    for _ in range(r.uint()):
+        key = r.value()
+        phase.additional_matches[key] = AdditionalMatch(r.team(), r.team(), r.result())
+    return phase
+
+
+_PHASE_CODECS = (
+    (_TOURNAMENT_PHASE, TournamentPhase, _write_tournament_phase, _read_tournament_phase),
+    (_GROUP_PHASE, GroupPhase, _write_group_phase, _read_group_phase),
+    (_KO_PHASE, KOPhase, _write_ko_phase, _read_ko_phase),
+    (_DOUBLE_ELIMINATION_PHASE, DoubleEliminationPhase, _write_double_elimination_phase,
+     _read_double_elimination_phase),
+)
+
+
+def _write_phase(w, phase):
+    for tag, cls, write, _ in _PHASE_CODECS:
+        if isinstance(phase, cls):
+            w.byte(tag)
+            write(w, phase)
+            return
+    raise JoustException('Can not store phase of type %s' % type(phase).__name__)
+
+
+def _read_phase(r):
+    tag = r.byte()
+    for phase_tag, _, _, read in _PHASE_CODECS:
+        if phase_tag == tag:
+            return read(r)
+    raise JoustException('Invalid phase tag %d' % tag)
+
+
+def encode_phase(phase, teams=None):
+    """Encodes a single phase (a GroupPhase, KOPhase, DoubleEliminationPhase or TournamentPhase).
+
+    Args:
+        phase: The phase to encode.
+        teams: A dictionary mapping team identifiers to ints that is extended by new teams, if None team identifiers
+            are stored in the blob.
+
+    Returns:
+        The encoded phase (bytes).
+
+    Raises:
+        JoustException: If the phase contains something that can't be stored.
+    """
+    w = _Writer(teams)
+    _write_phase(w, phase)
+    return bytes(w.buf)
+
+
+def decode_phase(data, teams=None):
+    """Decodes a phase encoded with encode_phase.
+
+    Args:
+        data: The encoded phase.
+        teams: The team table (list) if one was used for encoding.
+
+    Returns:
+        The decoded phase.
+
+    Raises:
+        JoustException: If data is not a valid phase.
+    """
+    return _read_phase(_Reader(data, teams=teams))
+
+
+_UNDECODED = object()
+
+
+class LazyPhases(MutableMapping):
+    """The rounds dictionary of a loaded tournament, phases are decoded from the snapshot on first access.
+
+    It behaves like a dict (keys are kept in insertion order), decoded phases are cached. Phases that have not been
+    accessed yet keep a reference to the underlying buffer (usually a memory-mapped file).
+
+    Args:
+        data: The buffer containing the snapshot.
+        teams: The team table of the snapshot.
+        index: A list of tuples (key, offset, length) for each phase.
+
+    Attributes:
+        teams: The team table of the snapshot.
+    """
+    def __init__(self, data, teams, index):
+        self.data = data
+        self.teams = teams
+        self._blobs = dict()
+        self._phases = dict()
+        for key, offset, length in index:
+            self._blobs[key] = (offset, length)
+            self._phases[key] = _UNDECODED
+
+    def __getitem__(self, key):
+        phase = self._phases[key]
+        if phase is _UNDECODED:
+            offset, length = self._blobs.pop(key)
+            phase = _read_phase(_Reader(memoryview(self.data)[offset:offset + length], teams=self.teams))
+            self._phases[key] = phase
+        return phase
+
+    def __setitem__(self, key, value):
+        self._blobs.pop(key, None)
+        self._phases[key] = value
+
+    def __delitem__(self, key):
+        del self._phases[key]
+        self._blobs.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._phases)
+
+    def __len__(self):
+        return len(self._phases)
+
+    def decoded_items(self):
+        """Returns a list of tuples (key, phase) of all phases that have already been decoded."""
+        return [(key, phase) for key, phase in self._phases.items() if phase is not _UNDECODED]
+
+    def is_decoded(self, key):
+        """Returns True if the phase with the given key has already been decoded."""
+        return self._phases[key] is not _UNDECODED
+
+    def raw_blob(self, key):
+        """Returns the encoded phase (a memoryview) if it has not been decoded yet, otherwise None."""
+        if key not in self._blobs:
+            return None
+        offset, length = self._blobs[key]
+        return memoryview(self.data)[offset:offset + length]
+
+
+def _find_phase(tournament, obj):
+    rounds = tournament.rounds
+    # a phase that has not been decoded can't be referenced
+    items = rounds.decoded_items() if isinstance(rounds, LazyPhases) else list(rounds.items())
+    for key, phase in items:
+        if phase is obj:
+            return _ATTR_ROUND, key
+    for key, phase in items:
+        if isinstance(phase, TournamentPhase) and phase.phase is obj:
+            return _ATTR_INNER_PHASE, key
+    return None
+
+
+def dumps(tournament):
+    """Encodes a tournament in the snapshot format.
+
+    The attributes of the tournament (besides rounds) are stored as well, they may either be values (see the module
+    documentation) or phases from rounds (or the phase wrapped by a TournamentPhase in rounds), these are stored as
+    references.
+
+    Args:
+        tournament: The Tournament to encode.
+
+    Returns:
+        The snapshot (bytes).
+
+    Raises:
+        JoustException: If the tournament contains something that can't be stored.
+    """
+    rounds = tournament.rounds
+    lazy = isinstance(rounds, LazyPhases)
+    # keep the team table of a loaded snapshot, so blobs that have not been decoded can be copied
+    teams = {team: i for i, team in enumerate(rounds.teams)} if lazy else dict()
+    w = _Writer(teams)
+    w.buf += bytes(_HEADER.size)
+    index = []
+    for key in rounds:
+        offset = len(w.buf)
+        blob = rounds.raw_blob(key) if lazy else None
+        if blob is None:
+            _write_phase(w, rounds[key])
+        else:
+            w.buf += blob
+        index.append((key, offset, len(w.buf) - offset))
+    # attributes are written first (they may contain teams), the team table has to be complete before it's written
+    attrs = _Writer(teams)
+    attrs.string(_class_path(type(tournament)))
+    names = [name for name in vars(tournament) if name != 'rounds']
+    attrs.uint(len(names))
+    for name in names:
+        attrs.string(name)
+        value = getattr(tournament, name)
+        ref = None if value is None else _find_phase(tournament, value)
+        if ref is None:
+            attrs.byte(_ATTR_VALUE)
+            attrs.value(value)
+        else:
+            attrs.byte(ref[0])
+            attrs.value(ref[1])
+    teams_offset = len(w.buf)
+    team_table = _Writer()
+    team_table.uint(len(teams))
+    for team in teams:
+        team_table.value(team)
+    w.buf += team_table.buf
+    meta_offset = len(w.buf)
+    w.buf += attrs.buf
+    index_offset = len(w.buf)
+    w.uint(len(index))
+    for key, offset, length in index:
+        w.value(key)
+        w.buf += _OFFSET.pack(offset, length)
+    _HEADER.pack_into(w.buf, 0, MAGIC, VERSION, 0, teams_offset, meta_offset, index_offset)
+    return bytes(w.buf)
+
+
+def loads(data):
+    """Decodes a snapshot created by dumps.
+
+    The tournament is created without calling its constructor, its rounds attribute is a LazyPhases object that
+    decodes phases on first access. Phases referenced by attributes of the tournament are decoded immediately.
+
+    Args:
+        data: The snapshot (bytes, memoryview or mmap), it must not be modified while the tournament is used.
+
+    Returns:
+        The decoded Tournament.
+
+    Raises:
+        JoustException: If data is not a valid snapshot.
+    """
+    if len(data) < _HEADER.size:
+        raise JoustException('Not a snapshot: data too short')
+    magic, version, _, teams_offset, meta_offset, index_offset = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise JoustException('Not a snapshot: invalid magic bytes')
+    if version != VERSION:
+        raise JoustException('Unsupported snapshot version %d' % version)
+    r = _Reader(data, teams_offset)
+    teams = [r.value() for _ in range(r.uint())]
+    r = _Reader(data, index_offset, teams)
+    index = []
+    for _ in range(r.uint()):
+        key = r.value()
+        offset, length = r.unpack(_OFFSET)
+        if offset + length > len(data):
+            raise JoustException('Invalid phase offset in snapshot')
+        index.append((key, offset, length))
+    rounds = LazyPhases(data, teams, index)
+    r = _Reader(data, meta_offset, teams)
+    cls = _resolve_class(r.string(), Tournament)
+    tournament = cls.__new__(cls)
+    for _ in range(r.uint()):
+        name = r.string()
+        tag = r.byte()
+        value = r.value()
+        if tag == _ATTR_ROUND:
+            value = rounds[value]
+        elif tag == _ATTR_INNER_PHASE:
+            value = rounds[value].phase
+        elif tag != _ATTR_VALUE:
+            raise JoustException('Invalid attribute tag %d' % tag)
+        setattr(tournament, name, value)
+    tournament.rounds = rounds
+    return tournament
+
+
+def save(tournament, path):
+    """Writes the snapshot of a tournament (see dumps) to a file."""
+    data = dumps(tournament)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def load(path):
+    """Loads a tournament from a file written by save.
+
+    The file is memory-mapped, only the parts needed to create the tournament are read, see loads.
+
+    Raises:
+        JoustException: If the file is not a valid snapshot.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise JoustException('Not a snapshot: empty file')
+    return loads(data)
+
+
+def _json_value(v):
+    if v is None or type(v) in (bool, int, float, str):
+        return v
+    if type(v) in (list, tuple):
+        return [_json_value(e) for e in v]
+    if type(v) is dict:
+        return {str(key): _json_value(e) for key, e in v.items()}
+    return str(v)
+
+
+def _json_table(table):
+    if isinstance(table, CompactMatchTable):
+        matches = []
+        for i, j, code, first, second in zip(table.fixture_one, table.fixture_two, table.results, table.score_one,
+                                              table.score_two):
+            matches.append([_json_value(table.team_ids[i]), _json_value(table.team_ids[j]),
+                            None if code < 0 else [first, second]])
+    else:
+        matches = [[_json_value(first), _json_value(second), _json_value(result)]
+                   for (first, second), result in table.matches.items()]
+    return {'class': type(table).__name__,
+            'points': [[_json_value(team), _json_value(points)] for team, points in table.points.items()],
+            'matches': matches}
+
+
+def _json_phase(phase):
+    if isinstance(phase, TournamentPhase):
+        return {'type': 'TournamentPhase', 'phase': _json_phase(phase.phase),
+                'final_result': _json_value(phase.final_result),
+                'tie_breakers': {str(key): [_json_value(b.team_one), _json_value(b.team_two), _json_value(b.result)]
+                                 for key, b in phase.tie_breakers.items()},
+                'additional_matches': {str(key): [_json_value(m.team_one), _json_value(m.team_two),
+                                                  _json_value(m.result)]
+                                       for key, m in phase.additional_matches.items()}}
+    if isinstance(phase, GroupPhase):
+        return {'type': 'GroupPhase', 'groups': _json_value(phase.groups), 'rounds': _json_value(phase.rounds),
+                'tables': [_json_table(table) for table in phase.tables]}
+    if isinstance(phase, KOPhase):
+        return {'type': 'KOPhase', 'teams': _json_value(phase.teams),
+                'matches': [[first, second, _json_value(result)]
+                            for (first, second), result in phase.tree.matches.items()]}
+    if isinstance(phase, DoubleEliminationPhase):
+        matches = []
+        for m in phase.tree.order:
+            team_one, team_two, result = phase.tree.get_match(m)
+            matches.append([m, _json_value(team_one), _json_value(team_two), _json_value(result)])
+        return {'type': 'DoubleEliminationPhase', 'teams': _json_value(phase.teams), 'matches': matches}
+    raise JoustException('Can not export phase of type %s' % type(phase).__name__)
+
+
+def to_json(tournament, **kwargs):
+    """Returns a JSON representation of a tournament for debugging, it can't be loaded again.
+
+    Teams, keys and results that are not JSON types are converted with str.
+
+    Args:
+        tournament: The Tournament to export.
+        kwargs: Passed to json.dumps (for example indent).
+    """
+    return json.dumps({'class': type(tournament).__name__,
+                       'rounds': {str(key): _json_phase(phase) for key, phase in tournament.rounds.items()}},
+                      **kwargs)
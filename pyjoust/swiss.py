@@ -14,11 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import abc
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 
-from .group import ThreePointsTable, all_matches_bidirect
+from .group import ThreePointsTable
+from .matching import max_weight_matching
 from .utils import JoustException
 
 
+# maps the digits of bin to bytes 0 and 1 (selectors for itertools.compress)
+_BITS = bytes.maketrans(b'01', b'\x00\x01')
+
+
 class NoMatchException(JoustException):
     pass
 
@@ -53,6 +62,103 @@ class SwissMatchSet(object):
         return repr(self.elements)
 
 
+class TeamMatchSet(object):
+    """A set of played matches with the same interface as SwissMatchSet, backed by one bitset per team.
+
+    Teams are mapped to dense ints when they're first added, so they don't have to be comparable. The matches of each
+    team are stored as an int where bit j is set if the team played against team j, thus the (il)legal opponents of a
+    team are computed with a few bit operations (see played_mask and legal_mask). Checking if two teams have played
+    uses a set of opponents per team instead: Shifting an n-bit int for each lookup would be slower than SwissMatchSet.
+    Additionally the number of times two teams have played is counted, len only counts each pair once (as
+    SwissMatchSet does).
+
+    Args:
+        teams: An optional iterable of team identifiers to register in advance (this fixes the order of the ints).
+    """
+
+    def __init__(self, teams=()):
+        self.team_ids = []
+        self.team_index = dict()
+        self.rows = []
+        # maps each team to the set of its opponents
+        self.played = dict()
+        # counts for pairs that played more than once, keyed by the sorted pair of ints
+        self.rematches = dict()
+        self.num_pairs = 0
+        for team in teams:
+            self._intern(team)
+
+    def _intern(self, team):
+        i = self.team_index.get(team)
+        if i is None:
+            i = len(self.team_ids)
+            self.team_index[team] = i
+            self.team_ids.append(team)
+            self.rows.append(0)
+            self.played[team] = set()
+        return i
+
+    def add(self, first, second):
+        i, j = self._intern(first), self._intern(second)
+        if second in self.played[first]:
+            key = (i, j) if i < j else (j, i)
+            self.rematches[key] = self.rematches.get(key, 1) + 1
+            return
+        self.rows[i] |= 1 << j
+        self.rows[j] |= 1 << i
+        self.played[first].add(second)
+        self.played[second].add(first)
+        self.num_pairs += 1
+
+    def count(self, first, second):
+        """Returns how many times the two teams have played against each other."""
+        if (first, second) not in self:
+            return 0
+        i, j = self.team_index[first], self.team_index[second]
+        return self.rematches.get((i, j) if i < j else (j, i), 1)
+
+    def played_mask(self, team):
+        """Returns an int where bit j is set if team played against the team with int j (see team_ids)."""
+        i = self.team_index.get(team)
+        return 0 if i is None else self.rows[i]
+
+    def legal_mask(self, team):
+        """Returns an int where bit j is set if team hasn't played against the team with int j (excluding team)."""
+        mask = (1 << len(self.team_ids)) - 1
+        i = self.team_index.get(team)
+        if i is not None:
+            mask &= ~(self.rows[i] | (1 << i))
+        return mask
+
+    def teams_in(self, mask):
+        """Returns the list of teams whose bits are set in mask, ordered by their ints."""
+        bits = bin(mask)[:1:-1].encode('ascii').translate(_BITS)
+        return list(itertools.compress(self.team_ids, bits))
+
+    def opponents(self, team):
+        """Returns a list of all teams that team played against."""
+        return self.teams_in(self.played_mask(team))
+
+    def legal_opponents(self, team):
+        """Returns a list of all registered teams that team hasn't played against (excluding team itself)."""
+        return self.teams_in(self.legal_mask(team))
+
+    def __len__(self):
+        return self.num_pairs
+
+    def __contains__(self, item):
+        first, second = item
+        played = self.played.get(first)
+        return played is not None and second in played
+
+    def __str__(self):
+        return str({(self.team_ids[i], other)
+                    for i, row in enumerate(self.rows) for other in self.teams_in((row >> (i + 1)) << (i + 1))})
+
+    def __repr__(self):
+        return str(self)
+
+
 class SwissRound(object):
     def __init__(self):
         self.results = dict()
@@ -62,71 +168,362 @@ class SwissRound(object):
         self.results[(team_two, team_one)] = result
 
 
-class SwissSystem(object):
-    def __init__(self, teams, table_class=ThreePointsTable):
-        self.teams = teams
-        self.rounds = []
-        self.by_count = dict()
-        # TODO check if this is correct
-        all_matches = all_matches_bidirect(teams)
-        self.table = table_class(teams, all_matches)
-        self.match_set = SwissMatchSet()
-        for team in teams:
-            self.by_count[team] = 0
+def select_bye(ranking, bye_count):
+    """Selects the team that gets a bye: the lowest ranked team among the teams with the fewest byes.
 
-    def next_round(self):
-        ranking = self.table.sort_ranking()
-        by = None
-        if len(self.teams) % 2 != 0:
-            by = self.select_by(ranking)
-        round = []
+    Args:
+        ranking: The ranking as returned by Table.sort_ranking (best team first).
+        bye_count: A dictionary mapping each team to the number of byes it already got.
+
+    Returns:
+        The team identifier.
+
+    Raises:
+        JoustException: If the ranking is empty.
+    """
+    if not ranking:
+        raise JoustException("Can't select by, no team given")
+    min_count = min(bye_count.get(team, 0) for team, _ in ranking)
+    for team, _ in reversed(ranking):
+        if bye_count.get(team, 0) == min_count:
+            return team
+
+
+class SwissPairing(abc.ABC):
+    """Abstract base class for the algorithms that compute the pairings of a Swiss round.
+    """
+
+    @abc.abstractmethod
+    def pair(self, ranking, match_set, bye_count):
+        """Computes the pairings of the next round.
+
+        Args:
+            ranking: The current ranking as returned by Table.sort_ranking (best team first).
+            match_set: The SwissMatchSet or TeamMatchSet of all matches played so far, these matches must not be
+                paired again.
+            bye_count: A dictionary mapping each team to the number of byes it already got.
+
+        Returns:
+            A tuple (pairs, bye) where pairs is a list of tuples (team_one, team_two) and bye is the team that gets a
+            bye (None if the number of teams is even).
+
+        Raises:
+            NoMatchException: If no pairing can be found.
+        """
+        pass
+
+
+class GreedyPairing(SwissPairing):
+    """Pairs the best unpaired team with the next team in the ranking it hasn't played yet.
+
+    This is fast and simple but can fail (in later rounds) even if a valid pairing exists.
+    """
+
+    def pair(self, ranking, match_set, bye_count):
+        bye = None
+        if len(ranking) % 2 != 0:
+            bye = select_bye(ranking, bye_count)
+        ranking = [team for team, _ in ranking if team != bye]
+        pairs = []
         while ranking:
             # get next best player
-            next = ranking.pop(0)
-            next_team = next[0]
-            if by is not None and by == next_team:
-                continue
-            # get candidate, that is the next player
+            next_team = ranking.pop(0)
             if not ranking:
-                raise JoustException("Something went wrong, can't compute competitor for %s" % next)
+                raise JoustException("Something went wrong, can't compute competitor for %s" % next_team)
             competitor_id = None
             for i, candidate in enumerate(ranking):
                 # test if match already took place
-                if (next, candidate) not in self.match_set:
+                if (next_team, candidate) not in match_set:
                     competitor_id = i
                     break
             if competitor_id is None:
-                raise NoMatchException("Can't find match for %s" % next)
+                raise NoMatchException("Can't find match for %s" % next_team)
             competitor = ranking.pop(competitor_id)
-            round.append((next, competitor))
-            self.match_set.add(next, competitor)
+            pairs.append((next_team, competitor))
+        return pairs, bye
+
+
+class MatchingPairing(SwissPairing):
+    """Computes the pairings with a maximum weight perfect matching (see pyjoust.matching).
+
+    Each pair of teams that hasn't played yet is an edge. The weight of an edge penalizes the difference between the
+    score groups (teams with equal points) of both teams quadratically and the difference in the ranking linearly, thus
+    teams with equal points that are close in the ranking are paired. If the number of teams is odd a dummy team is
+    added, playing against it means getting a bye. Only teams with the fewest byes are connected to the dummy, lower
+    ranked teams are preferred.
+
+    To make large fields feasible the ranking is divided into blocks of block_size teams and each block is matched on
+    its own. If a block has no perfect matching it is merged with the next block (the last block with the previous one)
+    until it has one. Thus the result is always a valid pairing if one exists, in the worst case the whole field is
+    matched at once. Set block_size to None to always match the whole field.
+
+    Args:
+        block_size: The (even) number of teams matched together, or None.
+    """
+
+    def __init__(self, block_size=64):
+        if block_size is not None and (block_size < 2 or block_size % 2 != 0):
+            raise JoustException('block_size must be a positive even number, got %s' % str(block_size))
+        self.block_size = block_size
+
+    def pair(self, ranking, match_set, bye_count):
+        n = len(ranking)
+        if n == 0:
+            return [], None
+        teams = [team for team, _ in ranking]
+        groups = []
+        for i, (_, r) in enumerate(itertools.groupby(ranking, key=itemgetter(1))):
+            groups.extend(i for _ in r)
+        bye_candidates = None
+        if n % 2 != 0:
+            min_count = min(bye_count.get(team, 0) for team in teams)
+            bye_candidates = {i for i, team in enumerate(teams) if bye_count.get(team, 0) == min_count}
+        # boundaries of the blocks, the bye dummy belongs to the last block
+        size = n + 1 if self.block_size is None else self.block_size
+        bounds = list(range(0, n, size)) + [n]
+        pairs, bye = [], None
+        i = 0
+        while i < len(bounds) - 1:
+            j = i + 1
+            while True:
+                res = self._match_block(teams, groups, bounds[i], bounds[j], j == len(bounds) - 1,
+                                        bye_candidates, match_set)
+                if res is not None:
+                    break
+                if j < len(bounds) - 1:
+                    j += 1
+                elif i > 0:
+                    # last block, merge with the previous one (its pairs must be computed again)
+                    i -= 1
+                    pairs = pairs[:-((bounds[i + 1] - bounds[i]) // 2)]
+                else:
+                    raise NoMatchException("Can't find a pairing without rematches")
+            block_pairs, block_bye = res
+            pairs.extend(block_pairs)
+            if block_bye is not None:
+                bye = block_bye
+            del bounds[i + 1:j]
+            i += 1
+        return pairs, bye
+
+    @staticmethod
+    def _match_block(teams, groups, start, end, last, bye_candidates, match_set):
+        # returns (pairs, bye) or None if there is no perfect matching
+        n = len(teams)
+        edges = []
+        for i in range(start, end):
+            for j in range(i + 1, end):
+                if (teams[i], teams[j]) in match_set:
+                    continue
+                diff = groups[j] - groups[i]
+                edges.append((i - start, j - start, diff * diff * n + (j - i)))
+        num = end - start
+        if last and bye_candidates is not None:
+            for i in range(start, end):
+                if i in bye_candidates:
+                    edges.append((i - start, num, n - 1 - i))
+            num += 1
+        if num % 2 != 0:
+            return None
+        if not edges:
+            return None if num else ([], None)
+        max_penalty = max(w for _, _, w in edges)
+        edges = [(i, j, max_penalty + 1 - w) for i, j, w in edges]
+        mate = max_weight_matching(edges, maxcardinality=True)
+        if len(mate) < num or any(m < 0 for m in mate):
+            return None
+        pairs, bye = [], None
+        for i, j in enumerate(mate):
+            if i > j:
+                continue
+            if j == end - start:
+                bye = teams[start + i]
+            else:
+                pairs.append((teams[start + i], teams[start + j]))
+        return pairs, bye
+
+
+class ScoreGroupPairing(SwissPairing):
+    """Pairs the teams score group by score group (a score group are all teams with the same points).
+
+    The score groups are processed from the highest to the lowest score. In each score group the best unpaired team
+    is paired with the next team in the group it hasn't played yet. Teams that can't be paired (for example the last
+    team of a group with an odd number of teams) float down into the next score group where they are paired first.
+    Thus only the current and the adjacent score group are searched and a round takes almost linear time.
+
+    If teams remain unpaired after the last score group the fallback pairing is used for the whole round.
+
+    Args:
+        fallback: The SwissPairing used if score group pairing fails, defaults to MatchingPairing.
+    """
+
+    def __init__(self, fallback=None):
+        if fallback is None:
+            fallback = MatchingPairing()
+        self.fallback = fallback
+
+    def pair(self, ranking, match_set, bye_count):
+        bye = None
+        if len(ranking) % 2 != 0:
+            bye = select_bye(ranking, bye_count)
+        pairs = []
+        floaters = []
+        for _, group in itertools.groupby(ranking, key=itemgetter(1)):
+            pool = floaters + [team for team, _ in group if team != bye]
+            floaters = []
+            paired = [False] * len(pool)
+            for i, team in enumerate(pool):
+                if paired[i]:
+                    continue
+                for j in range(i + 1, len(pool)):
+                    if not paired[j] and (team, pool[j]) not in match_set:
+                        paired[i] = paired[j] = True
+                        pairs.append((team, pool[j]))
+                        break
+                else:
+                    floaters.append(team)
+        if floaters:
+            return self.fallback.pair(ranking, match_set, bye_count)
+        return pairs, bye
+
+
+class SwissSystem(object):
+    """A Swiss system tournament: in each round teams are paired according to the current ranking.
+
+    Args:
+        teams: A list of unique team identifiers.
+        table_class: The MatchTable subclass used for the ranking.
+        pairing: The SwissPairing used to compute the pairings of each round, defaults to GreedyPairing.
+        criteria: A list of RankCriterion objects (for example BuchholzCriterion) used in this order to sort teams with
+            the same points, passed to the table (see MatchTable).
+        seeding: A function that returns the teams ordered by strength (strongest first), for example the seeding
+            method of a rating (see the rating module). Teams that are equal according to points and criteria
+            (in particular all teams before the first round) are ranked in this order. By default they're ranked by
+            their identifiers.
+    """
+    def __init__(self, teams, table_class=ThreePointsTable, pairing=None, criteria=None, seeding=None):
+        if pairing is None:
+            pairing = GreedyPairing()
+        self.teams = teams
+        self.pairing = pairing
+        self.seeds = None if seeding is None else {team: i for i, team in enumerate(seeding(teams))}
+        self.rounds = []
+        self.byes = []
+        self.by_count = dict()
+        # matches are added to the table when they're paired
+        if criteria:
+            self.table = table_class(teams, [], criteria=criteria)
+        else:
+            self.table = table_class(teams, [])
+        self.match_set = TeamMatchSet(teams)
+        for team in teams:
+            self.by_count[team] = 0
+
+    def set_result(self, team_one, team_two, result):
+        """Sets the result of a paired match in the table, the table updates its criteria.
+
+        Args:
+            team_one: Identifier of the first team of the match.
+            team_two: Identifier of the second team of the match.
+            result: The result, must implement MatchComparator.
+
+        Raises:
+            JoustException: If the match doesn't exist.
+        """
+        self.table.set_match(team_one, team_two, result)
+
+    @property
+    def criteria(self):
+        """The criteria of the table (an empty list for tables without criteria)."""
+        return getattr(self.table, 'criteria', [])
+
+    def recompute_criteria(self):
+        """Recomputes the points and criteria of the table from all results (see MatchTable.compute_ranking).
+        """
+        self.table.compute_ranking()
+
+    def sort_ranking(self):
+        """Returns the ranking of the table, teams with the same points are sorted according to the criteria.
+
+        Returns:
+            A list of tuples (team_identifier, team_points) sorted according to team_points (highest points first).
+        """
+        ranking = self.table.sort_ranking()
+        if self.seeds is not None:
+            ranking.sort(key=lambda entry: self.seeds[entry[0]])
+            # stable sort, so teams equal according to points and criteria remain sorted by their seeds
+            if self.criteria:
+                keys = self.table.ranking_keys()
+                ranking.sort(key=lambda entry: keys[entry[0]], reverse=True)
+            else:
+                ranking.sort(key=itemgetter(1), reverse=True)
+        return ranking
+
+    def next_round(self):
+        """Computes the pairings of the next round with the pairing algorithm and stores them.
+
+        Returns:
+            A list of tuples (team_one, team_two).
+
+        Raises:
+            NoMatchException: If no pairing can be found.
+        """
+        ranking = self.sort_ranking()
+        round, bye = self.pairing.pair(ranking, self.match_set, self.by_count)
+        return self.add_round(round, bye)
+
+    def add_round(self, round, bye=None):
+        """Stores the pairings of a round that have been computed already (see next_round and pair_sections).
+
+        Args:
+            round: A list of tuples (team_one, team_two).
+            bye: The team that gets a bye or None.
+
+        Returns:
+            round.
+        """
+        for team_one, team_two in round:
+            self.match_set.add(team_one, team_two)
+            self.table.add_match(team_one, team_two)
+        if bye is not None:
+            self.by_count[bye] += 1
         self.rounds.append(round)
+        self.byes.append(bye)
         return round
 
     def select_by(self, ranking=None):
         if ranking is None:
-            ranking = self.table.sort_ranking()
-        ranking_map = dict()
-        for i, entry in enumerate(ranking):
-            team = entry[0]
-            ranking[team] = i
-        min_by = []
-        current_min = None
-        for team, count in self.by_count:
-            if current_min is None or count < current_min:
-                current_min = count
-                min_by = [team]
-            elif count == current_min:
-                min_by.append(team)
-        if current_min is None:
-            raise JoustException("Can't select by, no team given")
-        assert len(min_by) > 0
-        highest_rank = None
-        selected = None
-        for team in min_by:
-            rank = ranking_map[team]
-            if highest_rank is None or selected > highest_rank:
-                highest_rank = team
-        assert highest_rank is not None
+            ranking = self.sort_ranking()
+        selected = select_bye(ranking, self.by_count)
         self.by_count[selected] += 1
         return selected
+
+
+def _pair_section(args):
+    pairing, ranking, match_set, bye_count = args
+    return pairing.pair(ranking, match_set, bye_count)
+
+
+def pair_sections(systems, max_workers=None):
+    """Computes the next round of several independent SwissSystem sections concurrently in a process pool.
+
+    Each worker only receives the state required for pairing (the ranking, the set of played matches and the bye
+    counts) and returns the pairings, which are then stored in the sections (see SwissSystem.add_round). The result
+    is the same as calling next_round on each section. If the pairing of a section fails no section is changed.
+
+    Args:
+        systems: A list of SwissSystem objects, their pairing algorithms and teams must be picklable.
+        max_workers: The maximum number of processes, see concurrent.futures.ProcessPoolExecutor.
+
+    Returns:
+        A list containing the round of each section, in the order of systems.
+
+    Raises:
+        NoMatchException: If no pairing can be found for a section.
+    """
+    jobs = [(system.pairing, system.sort_ranking(), system.match_set, system.by_count) for system in systems]
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_pair_section, jobs))
+    return [system.add_round(round, bye) for system, (round, bye) in zip(systems, results)]
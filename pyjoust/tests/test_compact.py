@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from .. import compact, group
+from ..utils import GoalScore
+
+RESULTS = ['1:0', '2:2', '0:3', '1:1', '4:2', '0:0', '3:1', '0:2', '1:2', '5:5']
+
+
+@pytest.mark.parametrize("table_class,compact_class", [
+    (group.ThreePointsTable, compact.CompactThreePointsTable),
+    (group.TwoPointsTable, compact.CompactTwoPointsTable),
+])
+def test_compact_table(table_class, compact_class):
+    teams = ['a', 'b', 'c', 'd', 'e']
+    matches = list(group.all_matches(teams))
+    table = table_class(teams, matches)
+    compact_table = compact_class(teams, matches)
+    for (team_one, team_two), s in zip(matches, RESULTS):
+        table.set_match_from_string(team_one, team_two, s)
+        compact_table.set_match_from_string(team_one, team_two, s)
+    table.set_match_from_string('a', 'b', '0:4')
+    compact_table.set_match_from_string('a', 'b', '0:4')
+    assert compact_table.points == table.points
+    assert compact_table.sort_ranking() == table.sort_ranking()
+    assert compact_table.compute_ranks() == table.compute_ranks()
+    assert compact_table.get_scores('a', 'b') == (0, 4)
+    compact_table.compute_ranking()
+    assert compact_table.points == table.points
+
+
+def test_compact_table_column():
+    teams = [1, 2, 3]
+    matches = list(group.all_matches(teams))
+    table = compact.CompactThreePointsTable(teams, matches)
+    table.set_matches_from_column(matches, GoalScore.parse_many(b'1:0\n2:2\n0:1\n'))
+    assert table.points == {1: 4, 2: 0, 3: 4}
+    assert table.get_scores(2, 3) == (0, 1)
+    with pytest.raises(group.InvalidResultsException):
+        table.set_matches_from_column([(1, 2), (3, 1)], GoalScore.parse_many(['0:1', '1:0']))
+    assert table.points == {1: 4, 2: 0, 3: 4}
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+from .. import courts
+from ..group import groups_by_size
+from ..tournament import GroupPhase
+from ..utils import JoustException
+
+
+def check_schedule(rounds, schedule, num_courts, durations, rest, round_barrier):
+    assert sorted((g, r, m) for g, r, m, _, _ in schedule.assignments) == \
+        [(g, r, m) for g, group_rounds in enumerate(rounds) for r, matches in enumerate(group_rounds)
+         for m in range(len(matches))]
+    court_usage = set()
+    team_matches = dict()
+    round_times = dict()
+    for g, r, m, slot, court in schedule.assignments:
+        assert 0 <= court < num_courts
+        end = slot + durations[g]
+        assert end <= schedule.makespan
+        for t in range(slot, end):
+            assert (court, t) not in court_usage
+            court_usage.add((court, t))
+        for team in rounds[g][r][m]:
+            team_matches.setdefault(team, []).append((r, slot, end))
+        start_min, end_max = round_times.get((g, r), (slot, end))
+        round_times[(g, r)] = min(start_min, slot), max(end_max, end)
+    for matches in team_matches.values():
+        matches.sort()
+        for (_, _, end), (_, next_slot, _) in zip(matches, matches[1:]):
+            assert next_slot >= end + rest
+    if round_barrier:
+        for (g, r), (start, _) in round_times.items():
+            if (g, r - 1) in round_times:
+                assert start >= round_times[(g, r - 1)][1]
+    assert schedule.makespan >= schedule.lower_bound
+
+
+@pytest.mark.parametrize("num_courts,rest,round_barrier", [(1, 0, True), (4, 1, True), (4, 2, False), (30, 0, False)])
+def test_schedule_courts(num_courts, rest, round_barrier):
+    rnd = random.Random(num_courts)
+    phase = GroupPhase(groups_by_size(5, list(range(37))))
+    durations = [rnd.randint(1, 3) for _ in phase.groups]
+    schedule = courts.schedule_courts(phase.rounds, num_courts, durations, rest, round_barrier, iterations=30, seed=1)
+    check_schedule(phase.rounds, schedule, num_courts, durations, rest, round_barrier)
+    greedy = courts.schedule_courts(phase.rounds, num_courts, durations, rest, round_barrier, iterations=0)
+    assert schedule.makespan <= greedy.makespan
+
+
+def test_schedule_courts_large():
+    phase = GroupPhase(groups_by_size(6, list(range(1200))))
+    schedule = courts.schedule_courts(phase.rounds, 100, rest=1, seed=3)
+    assert len(schedule) == 3000
+    assert schedule.makespan == schedule.lower_bound == 30
+    check_schedule(phase.rounds, schedule, 100, [1] * len(phase.groups), 1, True)
+
+
+def test_schedule_courts_invalid():
+    rounds = GroupPhase([[1, 2, 3]]).rounds
+    with pytest.raises(JoustException):
+        courts.schedule_courts(rounds, 0)
+    with pytest.raises(JoustException):
+        courts.schedule_courts(rounds, 1, duration=[1, 2])
+    with pytest.raises(JoustException):
+        courts.schedule_courts(rounds, 1, duration=0)
+    assert courts.schedule_courts([], 2).assignments == []
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+
+import pytest
+
+from .. import journal
+from ..description import RRTournament
+from ..ko import seeded_leaves
+from ..tournament import KOPhase, TournamentPhase, RematchBreaker
+from ..utils import GoalScore, JoustException, MatchResult
+from .test_snapshot import assert_same_phase
+
+
+def assert_same_tournament(tournament, other):
+    assert list(tournament.rounds) == list(other.rounds)
+    for key, phase in tournament.rounds.items():
+        assert_same_phase(phase, other.rounds[key])
+
+
+def play(recorder, rnd):
+    tournament = recorder.tournament
+    group_key = tournament.group_phase_key
+    for table in tournament.group_phase.tables:
+        for first, second in list(table.matches):
+            recorder.set_match(group_key, first, second, GoalScore(rnd.randint(0, 3), rnd.randint(0, 3)))
+    ranking = [team for team, _ in tournament.group_phase.tables[0].sort_ranking()]
+    ko_key = recorder.add_phase(TournamentPhase(KOPhase(seeded_leaves(ranking[:4]))))
+    tree = tournament.rounds[ko_key].phase.tree
+    for first, second in list(tree.get_matches(0)):
+        recorder.set_match(ko_key, first, second, GoalScore(2, 1))
+    recorder.add_tie_breaker(ko_key, RematchBreaker(ranking[0], ranking[1], GoalScore(0, 1)))
+    return ko_key
+
+
+def test_events():
+    event = journal.Event(journal.RESULT, 'key', ('a', 'b', GoalScore(1, 2)))
+    decoded = journal.decode_event(journal.encode_event(event))
+    assert decoded.kind == journal.RESULT and decoded.key == 'key'
+    assert decoded.args[:2] == ('a', 'b') and decoded.args[2].scores() == (1, 2)
+    phase = TournamentPhase(KOPhase(['a', 'b', None, 'd']))
+    decoded = journal.decode_event(journal.encode_event(journal.Event(journal.ADD_PHASE, 1, (phase,))))
+    assert_same_phase(phase, decoded.args[0])
+
+
+def test_recover(tmp_path):
+    directory = str(tmp_path / 'journal')
+    j = journal.Journal.create(directory, RRTournament([list('abcd'), list('efg')]), sync_every=3)
+    play(j, random.Random(3))
+    with pytest.raises(JoustException):
+        j.set_match(j.tournament.group_phase_key, 'a', 'e', GoalScore(1, 0))
+    seq = j.seq
+    j.close()
+    restored = journal.Journal.open(directory)
+    assert restored.seq == seq
+    assert_same_tournament(j.tournament, restored.tournament)
+    # events after recovery are appended to the journal
+    restored.set_match(j.tournament.group_phase_key, 'e', 'f', None)
+    j.tournament.group_phase.set_match('e', 'f', None)
+    restored.close()
+    assert_same_tournament(j.tournament, journal.Journal.open(directory).tournament)
+
+
+class OtherResult(MatchResult):
+    def winner(self):
+        return 'one'
+
+    @staticmethod
+    def parse(s):
+        return OtherResult()
+
+
+class FailingFile(object):
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data):
+        raise OSError('disk full')
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+def test_unrecordable_event(tmp_path):
+    directory = str(tmp_path / 'journal')
+    j = journal.Journal.create(directory, RRTournament([list('abcd'), list('efg')]))
+    key = j.tournament.group_phase_key
+    j.set_match(key, 'a', 'b', GoalScore(1, 0))
+    seq = j.seq
+    with pytest.raises(JoustException):
+        j.set_match(key, 'a', 'c', OtherResult())
+    assert j.seq == seq
+    assert j.tournament.group_phase.tables[0].matches[('a', 'c')] is None
+    # after a failed write no further events are accepted
+    j._file = FailingFile(j._file)
+    with pytest.raises(OSError):
+        j.set_match(key, 'a', 'c', GoalScore(1, 0))
+    with pytest.raises(JoustException):
+        j.set_match(key, 'a', 'd', GoalScore(1, 0))
+    assert j.tournament.group_phase.tables[0].matches[('a', 'd')] is None
+    j._file = j._file.f
+    j.close()
+    restored = journal.Journal.open(directory)
+    assert restored.seq == seq
+    assert restored.tournament.group_phase.tables[0].matches[('a', 'c')] is None
+
+
+def test_incomplete_record(tmp_path):
+    directory = str(tmp_path / 'journal')
+    j = journal.Journal.create(directory, RRTournament([list('abcd')]))
+    key = j.tournament.group_phase_key
+    j.set_match(key, 'a', 'd', GoalScore(1, 0))
+    j.set_match(key, 'b', 'c', GoalScore(1, 1))
+    j.close()
+    _, path = journal._list_files(directory, 'journal-', '.log')[-1]
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+    restored = journal.Journal.open(directory)
+    assert restored.seq == 1
+    assert restored.tournament.group_phase.tables[0].matches[('b', 'c')] is None
+    assert restored.tournament.group_phase.tables[0].matches[('a', 'd')].scores() == (1, 0)
+
+
+def test_compaction(tmp_path):
+    directory = str(tmp_path / 'journal')
+    j = journal.Journal.create(directory, RRTournament([list('abcdef'), list('ghijkl')]), sync_every=None,
+                               sync_interval=0.5, segment_size=200, compact_every=7)
+    play(j, random.Random(5))
+    j.compact(wait=True)
+    assert j.compaction_error is None
+    assert j.checkpoint_seq == j.seq
+    assert len(journal._list_files(directory, 'checkpoint-', '.snapshot')) == 1
+    assert len(journal._list_files(directory, 'journal-', '.log')) == 1
+    j.close()
+    restored = journal.Journal.open(directory)
+    assert restored.seq == j.seq
+    assert_same_tournament(j.tournament, restored.tournament)
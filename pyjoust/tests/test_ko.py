@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+from .. import ko
+from ..description import RRAndKO
+from ..utils import GoalScore, next_power_of_two
+
+
+@pytest.mark.parametrize("n", [1, 2, 4, 8, 32])
+def test_array_ko_tree_layout(n):
+    teams = ['team %d' % i for i in range(n)]
+    tree, array_tree = ko.KOTree(teams), ko.ArrayKOTree(teams)
+    assert [list(row) for row in array_tree.get_rows()] == tree.get_rows()
+    for row in range(len(tree.get_rows())):
+        assert list(array_tree.get_row(row)) == tree.get_row(row)
+        assert list(array_tree.get_matches(row)) == list(tree.get_matches(row))
+    for node_id in range(len(tree.nodes)):
+        assert list(array_tree.to_root(node_id)) == tree.to_root(node_id)
+        if tree.nodes[node_id] is not None:
+            assert array_tree.get_team(node_id) == tree.nodes[node_id].team
+
+
+def test_array_ko_tree_results():
+    tree = ko.ArrayKOTree([1, 2, None, 4])
+    assert tree.is_bye[4] == 1
+    first, second = next(tree.get_matches(0))
+    tree.set_match(first, second, GoalScore(1, 0))
+    tree.set_match(first, second, GoalScore(2, 0))
+    assert str(tree.get_match_result(first, second)) == '2:0'
+    assert len(tree.results) == 1
+    with pytest.raises(ko.JoustException):
+        tree.set_match(0, 1, GoalScore(1, 0))
+
+
+def test_ko_tree_to_root():
+    assert ko.KOTree.to_root(5) == [5, 2, 0]
+
+
+@pytest.mark.parametrize("tree_class", [ko.KOTree, ko.ArrayKOTree])
+def test_ko_winner_propagation(tree_class):
+    def team(tree, node_id):
+        if tree_class is ko.KOTree:
+            node = tree.nodes[node_id]
+            return None if node is None else node.team
+        return tree.get_team(node_id)
+
+    # leaves (from left to right): 6: a, 5: b, 4: c, 3: bye
+    tree = tree_class(['a', 'b', 'c', None])
+    # c advances because of the bye
+    assert team(tree, 1) == 'c'
+    assert tree.set_match(6, 5, GoalScore(0, 1)) == [(2, 1)]
+    assert team(tree, 2) == 'b'
+    assert tree.set_match(2, 1, GoalScore(3, 1)) == []
+    assert team(tree, 0) == 'b'
+    # same winner: nothing changes downstream
+    assert tree.set_match(6, 5, GoalScore(0, 2)) == []
+    assert team(tree, 0) == 'b'
+    # other winner: the final and the winner are invalidated
+    assert tree.set_match(6, 5, GoalScore(2, 0)) == [(2, 1)]
+    assert team(tree, 2) == 'a'
+    assert team(tree, 0) is None
+    assert tree.get_match_result(2, 1) is None
+    with pytest.raises(ko.JoustException):
+        tree.set_match(6, 4, GoalScore(1, 0))
+    with pytest.raises(ko.JoustException):
+        tree.set_match(2, 1, GoalScore(1, 1))
+
+
+@pytest.mark.parametrize("n,expected", [
+    (1, [1]),
+    (2, [1, 2]),
+    (4, [1, 4, 2, 3]),
+    (8, [1, 8, 4, 5, 2, 7, 3, 6]),
+])
+def test_seed_order(n, expected):
+    assert ko.seed_order(n) == expected
+
+
+def test_seeded_leaves():
+    ranking = ['s1', 's2', 's3', 's4', 's5', 's6']
+    leaves = ko.seeded_leaves(ranking)
+    assert leaves == ['s1', None, 's4', 's5', 's2', None, 's3', 's6']
+    tree = ko.ArrayKOTree.seeded(ranking)
+    # top seeds advance because of the byes
+    assert tree.get_team(ko.KOTree.parent(len(tree) - 1)) == 's1'
+    # seeds 1 and 2 can only meet in the final
+    for n in range(2, 40):
+        order = ko.seed_order(next_power_of_two(n))
+        half = len(order) // 2
+        assert 1 in order[:half] and 2 in order[half:]
+
+
+def test_rr_and_ko_make_ko():
+    tournament = RRAndKO([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+    phase = tournament.make_ko()
+    assert len(phase.tree.nodes) == 15
+    assert tournament.rounds[tournament.ko_phase_key].phase is phase
+
+
+@pytest.mark.parametrize("num_teams,reset", [(2, True), (6, True), (8, False), (13, True)])
+def test_double_elimination(num_teams, reset):
+    random.seed(num_teams)
+    teams = ['t%d' % i for i in range(num_teams)]
+    tree = ko.DoubleEliminationTree(ko.seeded_leaves(teams), reset=reset)
+    losses = {team: 0 for team in teams}
+    for match_id in tree.order:
+        team_one, team_two, _ = tree.get_match(match_id)
+        if tree.is_bye(match_id) or (match_id == tree.reset_match and team_one is None):
+            continue
+        result = GoalScore(1, 0) if random.random() < 0.5 else GoalScore(0, 1)
+        tree.set_match(match_id, result)
+        losses[team_two if result.winner() == 'one' else team_one] += 1
+    champion = tree.champion()
+    runner_up = tree.get_match(tree.grand_final)[0]
+    for team, count in losses.items():
+        if team == champion:
+            assert count <= 1
+        elif not reset and team == runner_up:
+            assert count == 1
+        else:
+            assert count == 2
+
+
+def test_double_elimination_changes():
+    tree = ko.DoubleEliminationTree(['a', 'b', 'c', 'd'])
+    # winners' bracket: 2 (a vs b), 1 (c vs d), 0 (final); losers' bracket: 3, 4; grand final 5, reset 6
+    assert tree.wb_rounds == [[2, 1], [0]]
+    assert tree.lb_rounds == [[3], [4]]
+    assert tree.set_match(2, GoalScore(1, 0)) == [0, 3]
+    assert tree.set_match(1, GoalScore(1, 0)) == [0, 3]
+    assert tree.get_match(0)[:2] == ('a', 'c')
+    assert tree.get_match(3)[:2] == ('b', 'd')
+    tree.set_match(3, GoalScore(1, 0))
+    tree.set_match(0, GoalScore(0, 1))
+    tree.set_match(4, GoalScore(0, 1))
+    assert tree.get_match(5)[:2] == ('c', 'a')
+    tree.set_match(5, GoalScore(0, 1))
+    assert tree.get_match(6)[:2] == ('c', 'a')
+    assert tree.champion() is None
+    tree.set_match(6, GoalScore(0, 1))
+    assert tree.champion() == 'a'
+    # b wins the first match: everything except match 1 changes
+    assert sorted(tree.set_match(2, GoalScore(0, 1))) == [0, 3, 4, 5, 6]
+    assert tree.get_match(0) == ('b', 'c', None)
+    assert tree.get_match(3) == ('a', 'd', None)
+    assert tree.champion() is None
@@ -14,9 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+
 import pytest
 
 from .. import group
+from ..compact import CompactTwoPointsTable
+from ..kubb import KubbResult, KubbsLeftCriterion
+from ..tournament import GroupPhase
+from ..utils import (GoalScore, GoalsCriterion, GoalDifferenceCriterion, WinsCriterion, JoustException,
+                     ResultColumn, RankCriterion, BuchholzCriterion)
 
 
 @pytest.mark.parametrize("teams,expected", [
@@ -84,3 +91,355 @@ def test_round_robin_circle():
 def test_berger_table(teams, expected):
     # compare with: https://fr.wikipedia.org/wiki/Table_de_Berger
     assert list(group.berger_table(teams)) == expected
+
+
+@pytest.mark.parametrize("table_class", [group.ThreePointsTable, group.TwoPointsTable])
+def test_set_match_incremental(table_class):
+    teams = [1, 2, 3, 4]
+    table = table_class(teams, group.all_matches(teams))
+    for (team_one, team_two), s in zip(group.all_matches(teams), ['1:0', '2:2', '0:3', '1:1', '4:2', '0:0']):
+        table.set_match_from_string(team_one, team_two, s)
+    # change some results again
+    table.set_match_from_string(1, 2, '0:1')
+    table.set_match_from_string(3, 4, '2:2')
+    table.set_match_from_string(3, 4, '5:2')
+    points = dict(table.points)
+    table.compute_ranking()
+    assert points == table.points
+
+
+class _BrokenResult(GoalScore):
+    def winner(self):
+        raise JoustException('no winner')
+
+
+@pytest.mark.parametrize("criteria", [[], [WinsCriterion()]])
+def test_set_match_invalid_entry(criteria):
+    teams = [1, 2]
+    table = group.ThreePointsTable(teams, group.all_matches(teams), criteria=criteria)
+    table.set_match(1, 2, GoalScore(1, 0))
+    with pytest.raises(JoustException):
+        table.set_match(1, 2, _BrokenResult(0, 1))
+    assert table.points == {1: 3, 2: 0}
+    assert [dict(c.wins) for c in criteria] == [{1: 1} for _ in criteria]
+    assert str(table.matches[(1, 2)]) == '1:0'
+
+
+def test_set_matches():
+    teams = [1, 2, 3]
+    table = group.ThreePointsTable(teams, group.all_matches(teams))
+    table.set_matches([(1, 2, '1:0'), (1, 3, '2:2'), (2, 3, GoalScore(0, 1))])
+    assert table.points == {1: 4, 2: 0, 3: 4}
+    with pytest.raises(group.InvalidResultsException) as e:
+        table.set_matches([(1, 2, '0:1'), (2, 1, '1:0'), (2, 3, 'x'), (1, 4, '1:1')])
+    assert [i for i, _ in e.value.errors] == [1, 2, 3]
+    # nothing changed
+    assert table.points == {1: 4, 2: 0, 3: 4}
+    assert str(table.matches[(1, 2)]) == '1:0'
+
+
+def test_group_phase_set_matches():
+    phase = GroupPhase([[1, 2, 3, 4], [5, 6]])
+    phase.set_matches([(1, 4, '1:0'), (5, 6, '0:2'), (2, 3, '1:1')])
+    assert phase.tables[0].points == {1: 3, 2: 1, 3: 1, 4: 0}
+    assert phase.tables[1].points == {5: 0, 6: 3}
+    with pytest.raises(group.InvalidResultsException) as e:
+        phase.set_matches([(5, 6, '2:0'), (1, 5, '1:0'), (7, 8, '1:0')])
+    assert [i for i, _ in e.value.errors] == [1, 2]
+    assert phase.tables[1].points == {5: 0, 6: 3}
+    with pytest.raises(group.InvalidResultsException) as e:
+        phase.set_matches([(5, 6, '2:0'), (1, 2, object())])
+    assert [i for i, _ in e.value.errors] == [1]
+    # a criterion of the second table rejects the result, the first table is restored
+    phase.tables[1].criteria = [GoalsCriterion()]
+    phase.tables[1].compute_ranking()
+    with pytest.raises(JoustException):
+        phase.set_matches([(1, 4, '0:1'), (1, 2, '2:0'), (5, 6, KubbResult(1, None))])
+    assert phase.tables[0].points == {1: 3, 2: 1, 3: 1, 4: 0}
+    assert phase.tables[0].matches[(1, 4)].scores() == (1, 0) and phase.tables[0].matches[(1, 2)] is None
+    assert phase.tables[1].points == {5: 0, 6: 3}
+
+
+@pytest.mark.parametrize("column", [
+    ['1:0', ' 2 : 2 ', 'x', '0:3', '1:'],
+    b'1:0\n 2 : 2 \nx\n0:3\n1:\n',
+])
+def test_goal_score_parse_many(column):
+    res = GoalScore.parse_many(column)
+    assert len(res) == 5
+    assert res.invalid == [2, 4]
+    assert list(res.first) == [1, 2, 0, 0, 0]
+    assert list(res.second) == [0, 2, 0, 3, 0]
+    assert list(res.winners()) == [1, 0, -1, 2, -1]
+    assert res[2] is None
+    assert str(res[3]) == '0:3'
+
+
+@pytest.mark.parametrize("column,first,invalid", [
+    (b'1:0\r\n\n 2 : 2\r\n', [1, 0, 2], [1]),
+    (b'3:1\n\n', [3, 0], [1]),
+    (['1:0', '1\n:0', '', ' 4:2 '], [1, 0, 0, 4], [1, 2]),
+    (b'', [], []),
+])
+def test_parse_many_lines(column, first, invalid):
+    res = GoalScore.parse_many(column)
+    assert list(res.first) == first
+    assert res.invalid == invalid
+
+
+def test_parse_many_overflow():
+    big = str(2 ** 63)
+    res = GoalScore.parse_many(['1:' + big, big + ':1', '2:1'])
+    assert res.invalid == [0, 1]
+    assert list(res.first) == [0, 0, 2] and list(res.second) == [0, 0, 1]
+    res = KubbResult.parse_many(('timeout: 1:%s\n%s:\n:2\n' % (big, big)).encode())
+    assert res.invalid == [0, 1]
+    assert list(res.timeout) == [0, 0, 0] and list(res.second) == [0, 0, 2]
+    with pytest.raises(TypeError):
+        ResultColumn()
+
+
+def test_kubb_parse_many():
+    res = KubbResult.parse_many(b'timeout: 2:\n:3\n1:1\n:\n')
+    assert res.invalid == [3]
+    assert list(res.timeout) == [1, 0, 0, 0]
+    assert [res[i].winner() for i in range(3)] == ['two', 'one', 'draw']
+    assert list(res.winners())[:3] == [2, 1, 0]
+
+
+def test_set_matches_from_column():
+    teams = [1, 2, 3]
+    table = group.ThreePointsTable(teams, group.all_matches(teams))
+    column = GoalScore.parse_many(['1:0', '2:2', '0:1'])
+    table.set_matches_from_column([(1, 2), (1, 3), (2, 3)], column)
+    assert table.points == {1: 4, 2: 0, 3: 4}
+    with pytest.raises(group.InvalidResultsException) as e:
+        table.set_matches_from_column([(1, 2), (2, 1)], GoalScore.parse_many(['x', '1:0']))
+    assert [i for i, _ in e.value.errors] == [0, 1]
+    assert table.points == {1: 4, 2: 0, 3: 4}
+
+
+@pytest.mark.parametrize("table_class", [group.ThreePointsTable, group.TwoPointsTable])
+def test_criteria(table_class):
+    teams = [1, 2, 3, 4]
+    criteria = [GoalDifferenceCriterion(), GoalsCriterion(), WinsCriterion()]
+    table = table_class(teams, group.all_matches(teams), criteria=criteria)
+    table.set_matches([(1, 2, '3:0'), (1, 3, '0:1')])
+    table.set_match_from_string(2, 3, '1:0')
+    table.set_matches_from_column([(2, 3), (2, 3)], GoalScore.parse_many(['0:0', '2:0']))
+    # 1, 2 and 3 have the same points
+    assert [team for team, _ in table.sort_ranking()] == [1, 2, 3, 4]
+    ranks = table.compute_ranks()
+    assert [teams for _, teams in ranks] == [[1], [2], [3], [4]]
+    assert ranks[0][0] == ranks[2][0]
+    assert criteria[0].difference[1] == 2 and criteria[1].goal_count[2] == 2 and criteria[2].wins[3] == 1
+    keys = table.ranking_keys()
+    table.compute_ranking()
+    assert keys == table.ranking_keys()
+    # teams equal in all criteria are in the same rank
+    table.set_match(1, 2, None)
+    table.set_match(1, 3, None)
+    table.set_match(2, 3, GoalScore(1, 1))
+    assert [teams for _, teams in table.compute_ranks()] == [[3, 2], [4, 1]]
+
+
+def test_criteria_rejected():
+    teams = ['a', 'b', 'c']
+    table = group.ThreePointsTable(teams, group.all_matches(teams), cmp_class=KubbResult,
+                                   criteria=[WinsCriterion(), GoalsCriterion()])
+    table.set_match('a', 'b', GoalScore(2, 0))
+    with pytest.raises(JoustException):
+        table.set_match('a', 'c', KubbResult(3, 0))
+    with pytest.raises(JoustException):
+        table.set_matches([('a', 'b', 'timeout: 1:0')])
+    assert table.points == {'a': 3, 'b': 0, 'c': 0}
+    assert dict(table.criteria[0].wins) == {'a': 1}
+    assert table.matches[('a', 'c')] is None
+
+
+def test_kubbs_left():
+    teams = ['a', 'b', 'c']
+    table = group.ThreePointsTable(teams, group.all_matches(teams), cmp_class=KubbResult,
+                                   criteria=[KubbsLeftCriterion()])
+    table.set_matches_from_column([('a', 'b'), ('a', 'c'), ('b', 'c')], KubbResult.parse_many(b':2\n3:\n0:1\n'))
+    assert table.points == {'a': 3, 'b': 3, 'c': 3}
+    assert [team for team, _ in table.sort_ranking()] == ['c', 'b', 'a']
+    assert table.compute_ranks() == [(3, ['c']), (3, ['b']), (3, ['a'])]
+
+
+def test_compute_ranks_criteria():
+    teams = ['a', 'b', 'c']
+    table = group.ThreePointsTable(teams, group.all_matches(teams))
+    table.set_matches([('a', 'b', '3:0'), ('b', 'c', '3:0'), ('a', 'c', '0:1')])
+    # without criteria the ranks are divided by points only
+    assert table.compute_ranks() == [(3, ['c', 'b', 'a'])]
+    # with criteria teams with the same points can be in consecutive ranks
+    table.criteria = [GoalDifferenceCriterion()]
+    table.compute_ranking()
+    assert table.compute_ranks() == [(3, ['a']), (3, ['b']), (3, ['c'])]
+
+
+class LegacyWinsCriterion(RankCriterion):
+    # implements only register_match and keys
+    def __init__(self):
+        self.wins = dict()
+
+    def register_match(self, team_one, team_two, result):
+        winner = {'one': team_one, 'two': team_two}.get(result.winner())
+        if winner is not None:
+            self.wins[winner] = self.wins.get(winner, 0) + 1
+
+    def keys(self, team):
+        return -self.wins.get(team, 0),
+
+
+def test_criterion_without_unregister():
+    teams = ['a', 'b', 'c']
+    criterion = LegacyWinsCriterion()
+    table = group.ThreePointsTable(teams, group.all_matches(teams), criteria=[criterion])
+    table.set_match('a', 'b', GoalScore(1, 0))
+    table.set_matches([('a', 'b', '0:1'), ('a', 'c', '1:1')])
+    assert criterion.wins == {'b': 1}
+    table.compute_ranking()
+    assert criterion.wins == {'b': 1}
+    assert table.compute_ranks() == [(3, ['b']), (1, ['c', 'a'])]
+
+
+def test_head_to_head():
+    teams = ['a', 'b', 'c', 'd']
+    table = group.ThreePointsTable(teams, group.all_matches(teams), criteria=[GoalDifferenceCriterion()])
+    table.set_matches([('a', 'b', '2:1'), ('c', 'd', '0:0'), ('b', 'c', '3:0'), ('a', 'd', '0:1')])
+    # a and b have the same points, b has the better goal difference but a won the match against b
+    assert [team for team, _ in table.sort_ranking()] == ['d', 'b', 'a', 'c']
+    table.head_to_head = True
+    assert [team for team, _ in table.sort_ranking()] == ['d', 'a', 'b', 'c']
+    assert table.compute_ranks() == [(4, ['d']), (3, ['a']), (3, ['b']), (1, ['c'])]
+
+
+class InPlaceGoalsCriterion(GoalsCriterion):
+    # reset clears the dictionary instead of replacing it
+    def reset(self):
+        self.goal_count.clear()
+
+
+def test_head_to_head_clone():
+    teams = ['a', 'b', 'c']
+    criterion = InPlaceGoalsCriterion()
+    table = group.ThreePointsTable(teams, group.all_matches(teams), criteria=[criterion], head_to_head=True)
+    table.set_matches([('a', 'b', '2:1'), ('b', 'c', '3:1'), ('a', 'c', '1:2')])
+    goals = dict(criterion.goal_count)
+    assert [team for team, _ in table.sort_ranking()] == ['b', 'c', 'a']
+    # the tables of the mutual matches use fresh criteria
+    assert table.criteria[0] is criterion and dict(criterion.goal_count) == goals
+    clone = BuchholzCriterion(2, 1, 0).clone()
+    assert type(clone) is BuchholzCriterion and (clone.win, clone.draw, clone.lose) == (2, 1, 0)
+
+
+def test_head_to_head_recursive():
+    teams = ['e', 'w', 'x', 'y', 'z']
+    table = group.ThreePointsTable(teams, group.all_matches(teams), head_to_head=True)
+    table.set_matches([('e', 'w', '0:1'), ('e', 'x', '1:0'), ('e', 'y', '1:0'), ('e', 'z', '1:0'), ('w', 'x', '0:0'),
+                       ('w', 'y', '0:1'), ('x', 'y', '1:0'), ('x', 'z', '0:1'), ('y', 'z', '0:0')])
+    # w, x, y and z have the same points, w has the fewest points in their mutual matches (w vs z is missing), the
+    # matches between x, y and z rank them z, x, y
+    assert [teams for _, teams in table.compute_ranks()] == [['e'], ['z'], ['x'], ['y'], ['w']]
+    assert [team for team, _ in table.sort_ranking()] == ['e', 'z', 'x', 'y', 'w']
+
+
+def test_head_to_head_memoised(monkeypatch):
+    teams = list(range(20))
+    table = group.ThreePointsTable(teams, group.all_matches(teams), head_to_head=True)
+    # teams 0 to 9 all draw against each other
+    table.set_matches([(first, second, '1:1') for first, second in group.all_matches(list(range(10)))])
+    calls = []
+    keys = table._head_to_head_keys
+    monkeypatch.setattr(table, '_head_to_head_keys', lambda tied: calls.append(tied) or keys(tied))
+    ranks = table.compute_ranks()
+    assert ranks[0] == (9, list(range(9, -1, -1)))
+    assert len(calls) == 2
+    assert table.compute_ranks() == ranks and len(calls) == 2
+    # a result between other teams doesn't change the tables of the tied teams
+    version = table.version
+    table.set_match(10, 11, GoalScore(1, 1))
+    assert table.version == version + 1
+    table.compute_ranks()
+    assert frozenset(range(10)) not in calls[2:]
+    table.set_match(0, 1, GoalScore(1, 0))
+    assert table.compute_ranks()[:3] == [(11, [0]), (9, list(range(9, 1, -1))), (8, [1])]
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 7, 8, 14])
+def test_round_robin_circle_random_access(n):
+    teams = ['team %d' % i for i in range(n)]
+    rounds = list(group.round_robin_circle(teams))
+    assert [group.round_robin_circle_round(teams, k) for k in range(len(rounds))] == rounds
+    for team in teams:
+        expected = [(k, match) for k, r in enumerate(rounds) for match in r if team in match]
+        assert group.round_robin_circle_fixtures(teams, team) == expected
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 7, 8, 14])
+def test_berger_table_random_access(n):
+    teams = list(range(1, n + 1))
+    rounds = list(group.berger_table(teams))
+    # the input must not be changed
+    assert teams == list(range(1, n + 1))
+    assert [group.berger_table_round(teams, k) for k in range(len(rounds))] == rounds
+    for team in teams:
+        expected = [(k, match) for k, r in enumerate(rounds) for match in r if team in match]
+        assert group.berger_table_fixtures(teams, team) == expected
+
+
+@pytest.mark.parametrize("scheduler", [group.round_robin_circle, group.berger_table])
+def test_schedule_template(scheduler):
+    for n in range(7):
+        teams = list(range(1, n + 1))
+        assert group.schedule_template(scheduler, n).apply(teams) == list(scheduler(teams))
+
+
+def test_group_phase_cached_schedules():
+    groups = [['a', 'b', 'c', 'd'], ['h', 'g', 'f', 'e'], ['i', 'j', 'k']]
+    # round_robin_circle and berger_table are cached by default
+    assert group.is_size_only_scheduler(group.round_robin_circle) and group.is_size_only_scheduler(group.berger_table)
+    phase = GroupPhase(groups)
+    assert phase.rounds == [list(group.round_robin_circle(g)) for g in groups]
+    assert set(phase.tables[1].matches) == set(itertools.chain.from_iterable(phase.rounds[1]))
+    # berger_table itself only works with the teams 1, ..., n
+    assert GroupPhase(groups, scheduler=group.berger_table).rounds[2] == [[('j', 'k')], [('i', 'j')], [('k', 'i')]]
+    # the schedule of this scheduler depends on the identifiers, so it must not be cached (the default)
+    sorted_scheduler = lambda teams: group.round_robin_circle(sorted(teams))
+    assert not group.is_size_only_scheduler(sorted_scheduler)
+    assert GroupPhase(groups, scheduler=sorted_scheduler).rounds == [list(sorted_scheduler(g)) for g in groups]
+    assert GroupPhase(groups, scheduler=sorted_scheduler, cache_schedules=True).rounds[1] != \
+        list(sorted_scheduler(groups[1]))
+
+
+@pytest.mark.parametrize("table_class,scheduler,cache_schedules", [
+    (group.ThreePointsTable, group.berger_table, True),
+    (group.TwoPointsTable, group.round_robin_circle, False),
+    (CompactTwoPointsTable, group.round_robin_circle, False),
+])
+def test_group_phase_build_parallel(table_class, scheduler, cache_schedules):
+    groups = [['team %d-%d' % (i, j) for j in range(3 + i % 4)] for i in range(40)]
+    phase = GroupPhase(groups, table_class, scheduler, cache_schedules)
+    parallel = GroupPhase.build_parallel(groups, table_class, scheduler, cache_schedules, max_workers=2, chunk_size=7)
+    assert parallel.rounds == phase.rounds
+    assert parallel.team_groups == phase.team_groups
+    for table, other in zip(phase.tables, parallel.tables):
+        assert type(other) is table_class
+        assert other.group is table.group
+        assert vars(other).keys() == vars(table).keys()
+        assert other.points == table.points
+        if table_class is CompactTwoPointsTable:
+            assert list(other.fixture_one) == list(table.fixture_one)
+        else:
+            assert list(other.matches.items()) == list(table.matches.items())
+
+
+
+def test_group_phase_build_parallel_sequential():
+    # a single chunk is built without a process pool, so the scheduler doesn't have to be picklable
+    groups = [['a', 'b', 'c'], ['d', 'e']]
+    scheduler = lambda teams: group.round_robin_circle(teams)
+    phase = GroupPhase.build_parallel(groups, scheduler=scheduler)
+    assert phase.rounds == GroupPhase(groups, scheduler=scheduler).rounds
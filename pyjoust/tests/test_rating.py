@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from .. import rating
+from ..group import groups_by_size, groups_by_number
+from ..ko import KOTree
+from ..swiss import SwissSystem
+from ..utils import GoalScore, JoustException
+
+
+def test_elo():
+    elo = rating.EloRating(k=32)
+    elo.update([('a', 'b', GoalScore(2, 0)), ('c', 'd', 'draw')])
+    assert elo.rating('a') == pytest.approx(1516)
+    assert elo.rating('b') == pytest.approx(1484)
+    assert elo.rating('c') == elo.rating('d') == 1500
+    assert elo.rating('unknown') == 1500
+    # all matches of a batch use the ratings from before the batch
+    batch = rating.EloRating()
+    batch.update([('a', 'b', 'one'), ('a', 'b', 'one')])
+    assert batch.rating('a') == pytest.approx(1532)
+    assert sum(batch.ratings) == pytest.approx(3000)
+    with pytest.raises(JoustException):
+        batch.update([('a', 'b', 'nobody')])
+
+
+def test_glicko():
+    # example from Glickman's description of the Glicko system
+    glicko = rating.GlickoRating()
+    glicko.update([('player', 'x', 'one')])
+    for team, (value, rd) in {'player': (1500, 200), 'a': (1400, 30), 'b': (1550, 100), 'c': (1700, 300)}.items():
+        i = glicko._intern(team)
+        glicko.ratings[i], glicko.rds[i] = value, rd
+    glicko.update([('player', 'a', 'one'), ('b', 'player', 'one'), ('player', 'c', 'two')])
+    assert glicko.rating('player') == pytest.approx(1464.1, abs=0.1)
+    assert glicko.rd('player') == pytest.approx(151.4, abs=0.1)
+    assert glicko.rd('x') < 350
+
+
+@pytest.mark.parametrize("rating_class", [rating.EloRating, rating.GlickoRating])
+def test_seeding_and_probabilities(rating_class):
+    r = rating_class(draw=0.2)
+    r.update_many([[('a', 'b', 'one'), ('c', 'd', 'one')], [('a', 'c', 'one'), ('b', 'd', 'one')]])
+    seeding = r.seeding(['d', 'c', 'b', 'a', 'e'])
+    assert seeding[0] == 'a' and seeding[-1] == 'd'
+    p_one, p_draw, p_two = r.probabilities('a', 'd')
+    assert p_one + p_draw + p_two == pytest.approx(1)
+    assert p_one > p_two and 0 < p_draw < 0.2
+    assert r.probabilities('e', 'f') == pytest.approx((0.4, 0.2, 0.4))
+
+
+def test_seeded_groups():
+    strength = {team: i for i, team in enumerate('abcdefghij')}
+    seeding = lambda teams: sorted(teams, key=strength.get)
+    assert groups_by_size(3, list('jihgfedcba'), seeding=seeding) == [['a', 'g', 'h'], ['b', 'f', 'i'],
+                                                                      ['c', 'e', 'j'], ['d']]
+    assert groups_by_number(2, list('jihgfedcba'), seeding=seeding) == [['a', 'd', 'e', 'h', 'i'],
+                                                                        ['b', 'c', 'f', 'g', 'j']]
+
+
+def test_seeded_swiss_and_ko():
+    elo = rating.EloRating()
+    elo.update([('s1', 's4', 'one'), ('s2', 's3', 'one'), ('s1', 's2', 'one'), ('s3', 's4', 'one')])
+    teams = ['s4', 's2', 's3', 's1']
+    system = SwissSystem(teams, seeding=elo.seeding)
+    assert [team for team, _ in system.sort_ranking()] == ['s1', 's2', 's3', 's4']
+    tree = KOTree.seeded(elo.seeding(teams))
+    assert [node.team for node in tree.nodes[-4:]] == ['s3', 's2', 's4', 's1']
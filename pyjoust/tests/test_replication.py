@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import socket
+import threading
+
+import pytest
+
+from .. import replication
+from ..description import RRTournament
+from ..utils import GoalScore
+from .test_journal import assert_same_tournament, play
+
+
+def address(kind, tmp_path):
+    if kind == 'unix':
+        return str(tmp_path / 'primary.sock')
+    return '127.0.0.1', 0
+
+
+def group_results(primary, rnd, n):
+    key = primary.tournament.group_phase_key
+    table = primary.tournament.group_phase.tables[0]
+    for first, second in rnd.sample(list(table.matches), n):
+        primary.set_match(key, first, second, GoalScore(rnd.randint(0, 3), rnd.randint(0, 3)))
+
+
+@pytest.mark.parametrize('kind', ['tcp', 'unix'])
+def test_replication(kind, tmp_path):
+    if kind == 'unix' and not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('Unix sockets not supported')
+    rnd = random.Random(7)
+    primary = replication.Primary(RRTournament([list('abcdef'), list('ghijk')]))
+    group_results(primary, rnd, 3)
+    bound = primary.serve(address(kind, tmp_path))
+    snapshots = []
+    replica = replication.Replica(bound, on_event=lambda e: e is None and snapshots.append(replica.seq),
+                                  retry_interval=0.01)
+    replica.start()
+    try:
+        assert replica.wait_for(primary.seq, timeout=5)
+        play(primary, rnd)
+        assert replica.wait_for(primary.seq, timeout=5)
+        with replica.lock:
+            assert_same_tournament(primary.tournament, replica.tournament)
+        # a reconnecting replica catches up without a snapshot
+        replica.disconnect()
+        group_results(primary, rnd, 4)
+        assert replica.wait_for(primary.seq, timeout=5)
+        with replica.lock:
+            assert_same_tournament(primary.tournament, replica.tournament)
+        assert snapshots == [3]
+    finally:
+        replica.stop()
+        primary.close()
+
+
+def test_replica_too_far_behind():
+    rnd = random.Random(8)
+    primary = replication.Primary(RRTournament([list('abcdef')]), history=2)
+    bound = primary.serve(('127.0.0.1', 0))
+    snapshots = []
+    replica = replication.Replica(bound, on_event=lambda e: e is None and snapshots.append(replica.seq),
+                                  retry_interval=0.01)
+    replica.start()
+    try:
+        assert replica.wait_for(0, timeout=5)
+        replica.stop()
+        group_results(primary, rnd, 5)
+        replica.start()
+        assert replica.wait_for(primary.seq, timeout=5)
+        with replica.lock:
+            assert_same_tournament(primary.tournament, replica.tournament)
+        assert snapshots == [0, 5]
+    finally:
+        replica.stop()
+        primary.close()
+
+
+def test_lagging_replica(monkeypatch):
+    rnd = random.Random(9)
+    primary = replication.Primary(RRTournament([list('abcdef')]), max_pending=2)
+    bound = primary.serve(('127.0.0.1', 0))
+    errors = []
+
+    def on_event(event):
+        if event is not None and not errors:
+            errors.append(event)
+            raise ValueError('callback failed')
+
+    replica = replication.Replica(bound, on_event=on_event, retry_interval=0.01)
+    replica.start()
+    send = replication._send
+    blocked = threading.Event()
+
+    def slow_send(sock, kind, seq, payload=b''):
+        if kind == replication.EVENT:
+            blocked.wait()
+        send(sock, kind, seq, payload)
+
+    try:
+        assert replica.wait_for(0, timeout=5)
+        monkeypatch.setattr(replication, '_send', slow_send)
+        group_results(primary, rnd, 5)
+        # the replica couldn't keep up and has been disconnected
+        with primary.lock:
+            assert not primary._subscribers
+        blocked.set()
+        group_results(primary, rnd, 1)
+        assert replica.wait_for(primary.seq, timeout=5)
+        # an exception in on_event is reported but doesn't stop the replica
+        group_results(primary, rnd, 2)
+        assert replica.wait_for(primary.seq, timeout=5)
+        with replica.lock:
+            assert_same_tournament(primary.tournament, replica.tournament)
+        assert len(errors) == 1 and isinstance(replica.error, ValueError)
+    finally:
+        replica.stop()
+        primary.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+
+import pytest
+
+from .. import simulation
+from ..compact import CompactTwoPointsTable
+from ..group import ThreePointsTable, TwoPointsTable, all_matches
+from ..kubb import KubbResult, KubbsLeftCriterion
+from ..utils import GoalScore, TwoPoints, GoalDifferenceCriterion, JoustException
+
+
+def test_encode_points():
+    values = [TwoPoints(2, 0), TwoPoints(2, 3), TwoPoints(1, 0), TwoPoints(0, 4)]
+    assert sorted(values, key=simulation.encode_points) == list(reversed(values))
+    assert simulation.encode_points(TwoPoints(3, 1) + TwoPoints(1, 2)) == \
+        simulation.encode_points(TwoPoints(3, 1)) + simulation.encode_points(TwoPoints(1, 2))
+    assert simulation.encode_points(7) == 7
+
+
+@pytest.mark.parametrize("table_class", [ThreePointsTable, TwoPointsTable, CompactTwoPointsTable])
+def test_simulate_decided(table_class):
+    table = table_class(['a', 'b', 'c'], all_matches(['a', 'b', 'c']))
+    table.set_match('a', 'b', GoalScore(2, 0))
+    table.set_match('a', 'c', GoalScore(2, 0))
+    # the only open match is certainly won by c
+    teams, matrix = simulation.simulate_positions(table, trials=100, probabilities=lambda t1, t2: (0, 0, 1), seed=1)
+    assert teams == ['a', 'b', 'c']
+    assert matrix == [[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]]
+
+
+def test_simulate_positions():
+    teams = list(range(6))
+    table = ThreePointsTable(teams, all_matches(teams))
+    for first, second in itertools.islice(all_matches(teams), 10):
+        table.set_match(first, second, GoalScore(first % 3, second % 2))
+    _, matrix = simulation.simulate_positions(table, trials=2000, seed=42, shard_size=300)
+    for row in matrix:
+        assert sum(row) == pytest.approx(1)
+    for column in zip(*matrix):
+        assert sum(column) == pytest.approx(1)
+    _, same = simulation.simulate_positions(table, trials=2000, seed=42, shard_size=300, parallel=True,
+                                            max_workers=2)
+    assert same == matrix
+    _, other = simulation.simulate_positions(table, trials=2000, seed=43, shard_size=300)
+    assert other != matrix
+
+
+def test_simulate_tie_breakers():
+    teams = ['a', 'b', 'c']
+    table = ThreePointsTable(teams, all_matches(teams), criteria=[GoalDifferenceCriterion()])
+    table.set_match('a', 'c', GoalScore(5, 0))
+    # b beats a and c beats b, all teams have three points and are ranked by goal difference
+    probabilities = lambda team_one, team_two: (0, 0, 1)
+    _, matrix = simulation.simulate_positions(table, trials=50, probabilities=probabilities, seed=1)
+    assert matrix == [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    # the table itself is not changed
+    assert table.matches[('a', 'b')] is None and table.matches[('b', 'c')] is None
+    # with higher scores for the sampled results the order is reversed
+    results = (GoalScore(1, 0), GoalScore(0, 0), GoalScore(0, 6))
+    _, matrix = simulation.simulate_positions(table, trials=50, probabilities=probabilities, seed=1, results=results,
+                                              parallel=True, shard_size=20)
+    assert matrix == [[0.0, 0.0, 1.0], [0.0, 1.0, 0.0], [1.0, 0.0, 0.0]]
+    # without tie-breakers ties are broken randomly
+    table.criteria = []
+    _, matrix = simulation.simulate_positions(table, trials=3000, probabilities=probabilities, seed=1)
+    assert all(0.25 < p < 0.42 for row in matrix for p in row)
+
+
+def test_simulate_full_ties_random():
+    teams = ['a', 'b', 'c']
+    table = ThreePointsTable(teams, all_matches(teams), criteria=[GoalDifferenceCriterion()])
+    # all matches are draws, the teams are equal in points and goal difference
+    _, matrix = simulation.simulate_positions(table, trials=3000, probabilities=lambda t1, t2: (0, 1, 0), seed=3)
+    assert all(0.25 < p < 0.42 for row in matrix for p in row)
+
+
+def test_simulate_kubb_head_to_head():
+    teams = ['a', 'b', 'c', 'd']
+    table = ThreePointsTable(teams, all_matches(teams), cmp_class=KubbResult, criteria=[KubbsLeftCriterion()],
+                             head_to_head=True)
+    table.set_matches([('a', 'b', '0:1'), ('c', 'd', '1:0'), ('a', 'c', '0:0'), ('b', 'd', '0:0')])
+    _, matrix = simulation.simulate_positions(table, trials=2000, probabilities=lambda t1, t2: (0, 0, 1), seed=2)
+    # the positions are the ranks of the table with the sampled results (team two wins, parsed from '1:0'), teams in
+    # the same rank share its positions
+    table.set_matches([('a', 'd', '1:0'), ('b', 'c', '1:0')])
+    expected = {team: [0.0] * len(teams) for team in teams}
+    position = 0
+    for _, rank in table.compute_ranks():
+        for team in rank:
+            for k in range(position, position + len(rank)):
+                expected[team][k] = 1 / len(rank)
+        position += len(rank)
+    assert any(len(rank) > 1 for _, rank in table.compute_ranks())
+    for team, row in zip(teams, matrix):
+        assert row == pytest.approx(expected[team], abs=0.05)
+
+
+def test_simulate_invalid_probabilities():
+    table = ThreePointsTable(['a', 'b'], all_matches(['a', 'b']))
+    with pytest.raises(JoustException):
+        simulation.simulate_positions(table, trials=10, probabilities=lambda t1, t2: (0, 0, 0))
+    with pytest.raises(JoustException):
+        simulation.simulate_positions(table, trials=10, probabilities=lambda t1, t2: (-1, 1, 1))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import random
+
+import pytest
+
+from .. import snapshot
+from ..compact import CompactTwoPointsTable
+from ..description import RRAndKO
+from ..group import TwoPointsTable
+from ..kubb import KubbResult, KubbsLeftCriterion
+from ..tournament import (Tournament, TournamentPhase, GroupPhase, DoubleEliminationPhase, RematchBreaker,
+                          CoinTieBreaker, AdditionalMatch)
+from ..utils import GoalScore, JoustException, TwoPoints, BuchholzCriterion, GoalsCriterion
+
+
+def play_groups(phase, rnd):
+    for table in phase.tables:
+        for first, second in list(table.matches):
+            table.set_match(first, second, GoalScore(rnd.randint(0, 3), rnd.randint(0, 3)))
+
+
+def make_tournament():
+    rnd = random.Random(42)
+    tournament = RRAndKO([['a', 'b', 'c', 'd'], ['e', 'f', 'g'], [1, 2, 3]])
+    play_groups(tournament.group_phase, rnd)
+    phase = tournament.make_ko()
+    for first, second in list(phase.tree.get_matches(0)):
+        if phase.tree.nodes[first].is_bye or phase.tree.nodes[second].is_bye:
+            continue
+        phase.tree.set_match(first, second, GoalScore(1, 0))
+    ko_phase = tournament.rounds[tournament.ko_phase_key]
+    ko_phase.add_tie_breaker(RematchBreaker('a', 'b', GoalScore(2, 1)))
+    ko_phase.add_tie_breaker(CoinTieBreaker(1, 'e'))
+    ko_phase.additional_matches['third place'] = AdditionalMatch('c', 2, GoalScore(0, 1))
+    ko_phase.final_result = ['a', 'e', 1]
+    return tournament
+
+
+def assert_same_phase(phase, other):
+    assert type(phase) is type(other)
+    if isinstance(phase, TournamentPhase):
+        assert_same_phase(phase.phase, other.phase)
+        assert phase.final_result == other.final_result
+        assert list(phase.tie_breakers) == list(other.tie_breakers)
+        for key, breaker in phase.tie_breakers.items():
+            assert type(other.tie_breakers[key]) is type(breaker)
+            assert other.tie_breakers[key].break_tie() == breaker.break_tie()
+        assert {key: (m.team_one, m.team_two, str(m.result)) for key, m in phase.additional_matches.items()} == \
+            {key: (m.team_one, m.team_two, str(m.result)) for key, m in other.additional_matches.items()}
+    elif isinstance(phase, GroupPhase):
+        assert phase.groups == other.groups
+        assert [list(map(list, rounds)) for rounds in phase.rounds] == \
+            [list(map(list, rounds)) for rounds in other.rounds]
+        for table, other_table in zip(phase.tables, other.tables):
+            assert type(table) is type(other_table)
+            assert table.points == other_table.points
+            assert table.sort_ranking() == other_table.sort_ranking()
+            assert [type(c) for c in getattr(table, 'criteria', [])] == \
+                [type(c) for c in getattr(other_table, 'criteria', [])]
+    elif isinstance(phase, DoubleEliminationPhase):
+        assert [phase.tree.get_match(m)[:2] for m in phase.tree.order] == \
+            [other.tree.get_match(m)[:2] for m in other.tree.order]
+        assert phase.tree.champion() == other.tree.champion()
+    else:
+        assert phase.teams == other.teams
+        assert [(node.team, node.is_bye) if node else None for node in phase.tree.nodes] == \
+            [(node.team, node.is_bye) if node else None for node in other.tree.nodes]
+        assert {key: str(result) for key, result in phase.tree.matches.items()} == \
+            {key: str(result) for key, result in other.tree.matches.items()}
+
+
+def test_round_trip():
+    tournament = make_tournament()
+    loaded = snapshot.loads(snapshot.dumps(tournament))
+    assert type(loaded) is RRAndKO
+    assert list(loaded.rounds) == list(tournament.rounds)
+    for key, phase in tournament.rounds.items():
+        assert_same_phase(phase, loaded.rounds[key])
+    assert loaded.group_phase_key == tournament.group_phase_key
+    assert loaded.group_phase is loaded.rounds[loaded.group_phase_key].phase
+    assert loaded.ko_phase is loaded.rounds[loaded.ko_phase_key].phase
+
+
+def test_lazy_load(tmp_path):
+    tournament = Tournament()
+    rnd = random.Random(1)
+    keys = []
+    for i in range(3):
+        phase = GroupPhase([['t%d' % j for j in range(6)]], table_class=TwoPointsTable)
+        play_groups(phase, rnd)
+        keys.append(tournament.add_phase(TournamentPhase(phase)))
+    path = str(tmp_path / 'tournament.snapshot')
+    snapshot.save(tournament, path)
+    loaded = snapshot.load(path)
+    assert list(loaded.rounds) == keys
+    assert not any(loaded.rounds.is_decoded(key) for key in keys)
+    assert_same_phase(tournament.rounds[keys[1]], loaded.rounds[keys[1]])
+    assert [loaded.rounds.is_decoded(key) for key in keys] == [False, True, False]
+    # undecoded phases are copied when saving again
+    assert snapshot.dumps(loaded) == snapshot.dumps(tournament)
+    assert not loaded.rounds.is_decoded(keys[0])
+    del loaded.rounds[keys[0]]
+    assert_same_phase(snapshot.loads(snapshot.dumps(loaded)).rounds[keys[2]], tournament.rounds[keys[2]])
+
+
+def test_other_phases():
+    tournament = Tournament()
+    teams = ['t%d' % i for i in range(6)] + [None, None]
+    de = DoubleEliminationPhase(teams)
+    for m in de.tree.order:
+        team_one, team_two, result = de.tree.get_match(m)
+        if team_one is not None and team_two is not None and result is None:
+            de.tree.set_match(m, GoalScore(2, 1) if m % 3 else GoalScore(0, 3))
+    tournament.add_phase(de)
+    groups = GroupPhase([[1, 2, 3, 4, 5]], table_class=CompactTwoPointsTable)
+    groups.tables[0].set_match_from_string(1, 5, '3:3')
+    tournament.add_phase(TournamentPhase(groups), key='groups')
+    kubb = GroupPhase([['x', 'y', 'z']], table_class=TwoPointsTable)
+    kubb.tables[0].cmp_class = KubbResult
+    kubb.tables[0].criteria = [KubbsLeftCriterion(), BuchholzCriterion(2, 1, 0)]
+    kubb.tables[0].head_to_head = True
+    for i, (first, second) in enumerate(kubb.tables[0].matches):
+        kubb.tables[0].set_match(first, second, KubbResult(None, i, timeout=True))
+    kubb_key = tournament.add_phase(kubb)
+    tournament.extra = {'points': TwoPoints(1, 2), 'big': 2 ** 70, 'class': TwoPointsTable}
+    loaded = snapshot.loads(snapshot.dumps(tournament))
+    for key, phase in tournament.rounds.items():
+        assert_same_phase(phase, loaded.rounds[key])
+    criterion = loaded.rounds[kubb_key].tables[0].criteria[1]
+    assert (criterion.win, criterion.values) == (2, kubb.tables[0].criteria[1].values)
+    assert loaded.rounds[kubb_key].tables[0].head_to_head
+    assert loaded.rounds['groups'].phase.tables[0].get_scores(1, 5) == (3, 3)
+    assert loaded.extra['points'] == TwoPoints(1, 2)
+    assert loaded.extra['big'] == 2 ** 70
+    assert loaded.extra['class'] is TwoPointsTable
+
+
+class WeightedCriterion(GoalsCriterion):
+    def __init__(self, weight):
+        super().__init__()
+        self.weight = weight
+
+
+def _tournament_with(phase):
+    tournament = Tournament()
+    tournament.add_phase(phase)
+    return tournament
+
+
+def test_invalid_snapshots():
+    data = snapshot.dumps(make_tournament())
+    with pytest.raises(JoustException):
+        snapshot.loads(b'')
+    with pytest.raises(JoustException):
+        snapshot.loads(b'X' + data[1:])
+    with pytest.raises(JoustException):
+        snapshot.loads(data[:8] + b'\xff\xff' + data[10:])
+    tournament = Tournament()
+    tournament.add_phase(object())
+    with pytest.raises(JoustException):
+        snapshot.dumps(tournament)
+    # scores that don't fit into 64 bits
+    phase = GroupPhase([['a', 'b']])
+    phase.set_match('a', 'b', GoalScore(2 ** 63, 0))
+    with pytest.raises(JoustException):
+        snapshot.dumps(_tournament_with(phase))
+    # criteria with unknown constructor arguments
+    phase = GroupPhase([['a', 'b']])
+    phase.tables[0].criteria = [WeightedCriterion(2)]
+    with pytest.raises(JoustException):
+        snapshot.dumps(_tournament_with(phase))
+
+
+def test_to_json():
+    tournament = make_tournament()
+    exported = json.loads(snapshot.to_json(tournament))
+    assert set(exported['rounds']) == {str(key) for key in tournament.rounds}
+    group_phase = exported['rounds'][str(tournament.group_phase_key)]['phase']
+    assert group_phase['groups'][0] == ['a', 'b', 'c', 'd']
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Fabian Wenzelmann <fabianwen@posteo.eu>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+from .. import swiss, utils
+from ..utils import GoalScore
+
+
+def _match_set(pairs):
+    match_set = swiss.SwissMatchSet()
+    for first, second in pairs:
+        match_set.add(first, second)
+    return match_set
+
+
+def test_matching_pairing_no_greedy_failure():
+    ranking = [('a', 3), ('b', 3), ('c', 0), ('d', 0)]
+    match_set = _match_set([('a', 'b'), ('b', 'd')])
+    with pytest.raises(swiss.NoMatchException):
+        swiss.GreedyPairing().pair(ranking, match_set, {})
+    pairs, bye = swiss.MatchingPairing().pair(ranking, match_set, {})
+    assert set(pairs) == {('a', 'd'), ('b', 'c')}
+    assert bye is None
+
+
+def test_matching_pairing_prefers_equal_scores():
+    ranking = [('a', 6), ('b', 3), ('c', 3), ('d', 3), ('e', 3), ('f', 0)]
+    pairs, bye = swiss.MatchingPairing().pair(ranking, _match_set([]), {})
+    assert set(pairs) == {('a', 'b'), ('c', 'd'), ('e', 'f')}
+    match_set = _match_set([('c', 'd')])
+    pairs, bye = swiss.MatchingPairing().pair(ranking, match_set, {})
+    assert set(pairs) == {('a', 'b'), ('c', 'e'), ('d', 'f')}
+
+
+def test_matching_pairing_bye():
+    ranking = [('a', 3), ('b', 3), ('c', 0), ('d', 0), ('e', 0)]
+    pairs, bye = swiss.MatchingPairing().pair(ranking, _match_set([]), {'e': 1})
+    assert bye == 'd'
+    assert set(pairs) == {('a', 'b'), ('c', 'e')}
+
+
+@pytest.mark.parametrize("n,block_size", [(8, 2), (9, 4), (10, None), (11, 64), (31, 8)])
+def test_swiss_system_matching(n, block_size):
+    random.seed(n)
+    system = swiss.SwissSystem(list(range(n)), pairing=swiss.MatchingPairing(block_size))
+    seen = set()
+    for _ in range(n // 2):
+        pairs = system.next_round()
+        assert len(pairs) == n // 2
+        for team_one, team_two in pairs:
+            assert frozenset((team_one, team_two)) not in seen
+            seen.add(frozenset((team_one, team_two)))
+            system.table.set_match(team_one, team_two, GoalScore(random.randint(0, 3), random.randint(0, 3)))
+    if n % 2 != 0:
+        # no team gets a second bye
+        assert len(set(system.byes)) == n // 2
+
+
+def test_swiss_system_sparse_table():
+    system = swiss.SwissSystem(list(range(6)))
+    assert len(system.table.matches) == 0
+    pairs = system.next_round()
+    assert set(system.table.matches) == set(pairs)
+    team_one, team_two = pairs[0]
+    system.table.set_match(team_one, team_two, GoalScore(1, 0))
+    assert system.table.sort_ranking()[0] == (team_one, 3)
+
+
+def test_score_group_pairing():
+    ranking = [('a', 6), ('b', 3), ('c', 3), ('d', 3), ('e', 0), ('f', 0), ('g', 0)]
+    pairs, bye = swiss.ScoreGroupPairing().pair(ranking, _match_set([('b', 'c')]), {})
+    assert bye == 'g'
+    # a floats down into the group with three points
+    assert pairs == [('a', 'b'), ('c', 'd'), ('e', 'f')]
+    # no valid pairing in score groups: fallback
+    ranking = [('a', 3), ('b', 3), ('c', 0), ('d', 0)]
+    pairs, bye = swiss.ScoreGroupPairing().pair(ranking, _match_set([('a', 'b'), ('b', 'd')]), {})
+    assert set(pairs) == {('a', 'd'), ('b', 'c')}
+
+
+def test_swiss_system_score_groups():
+    random.seed(42)
+    system = swiss.SwissSystem(list(range(101)), pairing=swiss.ScoreGroupPairing())
+    seen = set()
+    for _ in range(7):
+        for team_one, team_two in system.next_round():
+            assert frozenset((team_one, team_two)) not in seen
+            seen.add(frozenset((team_one, team_two)))
+            system.table.set_match(team_one, team_two, GoalScore(random.randint(0, 3), random.randint(0, 3)))
+
+
+def test_team_match_set():
+    match_set = swiss.TeamMatchSet(['a', 'b'])
+    match_set.add('a', 'b')
+    match_set.add('c', 'a')
+    match_set.add('b', 'a')
+    assert len(match_set) == 2
+    assert ('b', 'a') in match_set and ('a', 'c') in match_set
+    assert ('b', 'c') not in match_set and ('x', 'a') not in match_set
+    assert match_set.count('a', 'b') == 2 and match_set.count('c', 'a') == 1 and match_set.count('b', 'c') == 0
+    assert match_set.opponents('a') == ['b', 'c']
+    assert match_set.legal_opponents('b') == ['c']
+    assert match_set.played_mask('a') == 0b110 and match_set.legal_mask('a') == 0
+    assert match_set.teams_in(match_set.legal_mask('c')) == ['b']
+    # teams don't have to be comparable
+    match_set.add(1, 'a')
+    assert (1, 'a') in match_set
+
+
+def _naive_tiebreaks(matches):
+    score, opponents = {}, {}
+    for (team_one, team_two), result in matches.items():
+        res_one = {'one': 1, 'draw': 0.5, 'two': 0}[result.winner()]
+        for team, opponent, res in ((team_one, team_two, res_one), (team_two, team_one, 1 - res_one)):
+            score[team] = score.get(team, 0) + res
+            opponents.setdefault(team, []).append((opponent, res))
+    buchholz = {team: sum(score[o] for o, _ in opp) for team, opp in opponents.items()}
+    sonneborn_berger = {team: sum(r * score[o] for o, r in opp) for team, opp in opponents.items()}
+    return buchholz, sonneborn_berger
+
+
+def test_swiss_criteria_incremental():
+    random.seed(7)
+    criteria = [utils.BuchholzCriterion(), utils.SonnebornBergerCriterion(), utils.MedianBuchholzCriterion()]
+    system = swiss.SwissSystem(list(range(12)), pairing=swiss.MatchingPairing(), criteria=criteria)
+    played = {}
+    for _ in range(5):
+        for team_one, team_two in system.next_round():
+            system.set_result(team_one, team_two, GoalScore(random.randint(0, 2), random.randint(0, 2)))
+            played[(team_one, team_two)] = system.table.matches[(team_one, team_two)]
+    # change a result
+    (team_one, team_two), _ = next(iter(played.items()))
+    system.set_result(team_one, team_two, GoalScore(5, 0))
+    played[(team_one, team_two)] = system.table.matches[(team_one, team_two)]
+    buchholz, sonneborn_berger = _naive_tiebreaks(played)
+    assert dict(criteria[0].values) == buchholz
+    assert dict(criteria[1].values) == sonneborn_berger
+    keys = {team: [c.keys(team) for c in criteria] for team in system.teams}
+    system.recompute_criteria()
+    assert keys == {team: [c.keys(team) for c in criteria] for team in system.teams}
+    ranking = system.sort_ranking()
+    for (team_a, points_a), (team_b, points_b) in zip(ranking, ranking[1:]):
+        assert points_a > points_b or (points_a == points_b and buchholz[team_a] >= buchholz[team_b])
+
+
+def test_pair_sections():
+    random.seed(3)
+
+    def make_sections():
+        return [swiss.SwissSystem(list(range(n)), pairing=swiss.MatchingPairing(8)) for n in (9, 16, 21)]
+
+    sequential, parallel = make_sections(), make_sections()
+    for _ in range(3):
+        expected = [system.next_round() for system in sequential]
+        assert swiss.pair_sections(parallel, max_workers=2) == expected
+        for system_a, system_b, round in zip(sequential, parallel, expected):
+            for team_one, team_two in round:
+                result = GoalScore(random.randint(0, 3), random.randint(0, 3))
+                system_a.set_result(team_one, team_two, result)
+                system_b.set_result(team_one, team_two, result)
+    assert [s.byes for s in sequential] == [s.byes for s in parallel]
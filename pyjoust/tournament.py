@@ -16,11 +16,14 @@
 
 import abc
 import itertools
+import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 
 from .utils import JoustException, toss_coin
-from .group import ThreePointsTable, round_robin_circle
-from .ko import KOTree
+from .group import (ThreePointsTable, round_robin_circle, schedule_template, ScheduleTemplate, InvalidResultsException,
+                    is_size_only_scheduler)
+from .ko import KOTree, DoubleEliminationTree
 
 class AdditionalMatch(object):
     def __init__(self, team_one, team_two, result=None):
@@ -64,17 +67,167 @@ class CoinTieBreaker(TieBreaker):
         return self.result
 
 
+def _build_templates(args):
+    # computes the schedules of some groups and returns them as templates (arrays of indices into each group)
+    scheduler, groups = args
+    result = []
+    for group in groups:
+        index = {team: i for i, team in enumerate(group)}
+        rounds = scheduler(group)
+        result.append(ScheduleTemplate([(index[first], index[second]) for first, second in r] for r in rounds))
+    return result
+
+
 class GroupPhase(object):
-    def __init__(self, groups, table_class=ThreePointsTable, scheduler=round_robin_circle):
+    """A phase in which teams play in groups, each group has its own schedule and table.
+
+    Args:
+        groups: A list of groups, each group a list of unique team identifiers.
+        table_class: The MatchTable subclass used for each group.
+        scheduler: A function that returns the rounds for a list of teams, for example round_robin_circle.
+        cache_schedules: If True the schedule is computed once for each group size (see schedule_template) and then
+            mapped onto the teams of each group. Only use it if the scheduler depends on nothing but the number of
+            teams, otherwise the groups get wrong schedules. The default None caches the schedules of schedulers
+            marked with size_only_scheduler (such as round_robin_circle and berger_table).
+    """
+    def __init__(self, groups, table_class=ThreePointsTable, scheduler=round_robin_circle, cache_schedules=None):
+        if cache_schedules is None:
+            cache_schedules = is_size_only_scheduler(scheduler)
         self.groups = groups
         self.tables = []
         self.rounds = []
-        for group in groups:
-            rounds = list(scheduler(group))
+        self.team_groups = dict()
+        for i, group in enumerate(groups):
+            if cache_schedules:
+                rounds = schedule_template(scheduler, len(group)).apply(group)
+            else:
+                rounds = list(scheduler(group))
             self.rounds.append(rounds)
             match_tuples = itertools.chain.from_iterable(rounds)
             next_table = table_class(group, match_tuples)
             self.tables.append(next_table)
+            for team in group:
+                self.team_groups[team] = i
+
+    @classmethod
+    def from_parts(cls, groups, rounds, tables):
+        """Creates a group phase from already computed rounds and tables (without calling the scheduler).
+
+        Args:
+            groups: A list of groups, each group a list of unique team identifiers.
+            rounds: The rounds of each group.
+            tables: The table of each group.
+        """
+        phase = cls.__new__(cls)
+        phase.groups = groups
+        phase.rounds = rounds
+        phase.tables = tables
+        phase.team_groups = {team: i for i, group in enumerate(groups) for team in group}
+        return phase
+
+    @classmethod
+    def build_parallel(cls, groups, table_class=ThreePointsTable, scheduler=round_robin_circle, cache_schedules=None,
+                       max_workers=None, chunk_size=256):
+        """Creates a group phase like the constructor but computes the schedules in a process pool.
+
+        The groups are split into chunks of chunk_size groups, each worker calls the scheduler for the groups of a
+        chunk. Only the schedules are sent back, as ScheduleTemplate objects (two int arrays per group), the tables are
+        built in the calling process: Sending table objects back costs more than building them. The result is the same
+        as GroupPhase(groups, table_class, scheduler, cache_schedules).
+
+        No process pool is used (the groups are built like in the constructor) if the schedules are cached (the
+        scheduler is called once per group size anyway, this is the default for round_robin_circle and berger_table),
+        if there is only one chunk or if only one process can be used. Thus the process pool is only used for
+        expensive schedulers that depend on the team identifiers.
+
+        Args:
+            groups: A list of groups, each group a list of unique team identifiers.
+            table_class: The MatchTable subclass used for each group.
+            scheduler: A function that returns the rounds for a list of teams, must be picklable (no lambda).
+            cache_schedules: See the constructor.
+            max_workers: The maximum number of processes, defaults to the number of processors.
+            chunk_size: The number of groups handled by a worker at once.
+
+        Returns:
+            The new GroupPhase.
+        """
+        if cache_schedules is None:
+            cache_schedules = is_size_only_scheduler(scheduler)
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if cache_schedules or len(groups) <= chunk_size or max_workers == 1:
+            return cls(groups, table_class, scheduler, cache_schedules)
+        chunks = [groups[i:i + chunk_size] for i in range(0, len(groups), chunk_size)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            templates = itertools.chain.from_iterable(
+                executor.map(_build_templates, [(scheduler, chunk) for chunk in chunks]))
+            rounds = [template.apply(group) for group, template in zip(groups, templates)]
+        tables = [table_class(group, itertools.chain.from_iterable(r)) for group, r in zip(groups, rounds)]
+        return cls.from_parts(groups, rounds, tables)
+
+    def get_table(self, team):
+        """Returns the table of the group the team belongs to.
+
+        Raises:
+            JoustException: If the team is not part of any group.
+        """
+        if team not in self.team_groups:
+            raise JoustException('Invalid team name "%s"' % str(team))
+        return self.tables[self.team_groups[team]]
+
+    def set_match(self, team_one, team_two, entry):
+        """Sets the result of a match in the table of the group both teams belong to, see MatchTable.set_match.
+
+        Raises:
+            JoustException: If a team doesn't exist or the teams are in different groups.
+        """
+        table = self.get_table(team_one)
+        if self.get_table(team_two) is not table:
+            raise JoustException('Teams "%s" and "%s" are not in the same group' % (str(team_one), str(team_two)))
+        table.set_match(team_one, team_two, entry)
+
+    def set_matches(self, rows):
+        """Sets many results at once, each result is routed to the table of the group both teams belong to.
+
+        All rows are validated first, if any row is invalid an InvalidResultsException is raised and no table is
+        changed. Otherwise each table applies its results once, see MatchTable.set_matches. If a table rejects its
+        results (for example because a criterion doesn't accept a result) the tables already changed are restored.
+
+        Args:
+            rows: An iterable of tuples (team_one, team_two, entry) where entry is either a score string or an entry
+                implementing MatchComparator.
+
+        Raises:
+            InvalidResultsException: If at least one row is invalid, its errors attribute contains all errors (with
+                the row indices from rows).
+            JoustException: If a table rejects its results, no table is changed.
+        """
+        updates = dict()
+        errors = []
+        for i, row in enumerate(rows):
+            try:
+                team_one, team_two, entry = row
+                table = self.get_table(team_one)
+                updates.setdefault(self.team_groups[team_one], []).append(
+                    table.prepare_match(team_one, team_two, entry))
+            except (TypeError, ValueError):
+                errors.append((i, JoustException('Invalid row "%s"' % str(row))))
+            except JoustException as e:
+                errors.append((i, e))
+        if errors:
+            raise InvalidResultsException(errors)
+        applied = []
+        try:
+            for group_id, group_updates in updates.items():
+                table = self.tables[group_id]
+                old = {key: table.matches[key] for key, _ in group_updates}
+                table.apply_matches(group_updates)
+                applied.append((table, old))
+        except Exception:
+            # restore the old results, they have been accepted before
+            for table, old in applied:
+                table.apply_matches(list(old.items()))
+            raise
 
 
 class KOPhase(object):
@@ -83,6 +236,12 @@ class KOPhase(object):
         self.tree = KOTree(teams)
 
 
+class DoubleEliminationPhase(object):
+    def __init__(self, teams, reset=True):
+        self.teams = teams
+        self.tree = DoubleEliminationTree(teams, reset=reset)
+
+
 class TournamentPhase(object):
     def __init__(self, phase):
         self.phase = phase
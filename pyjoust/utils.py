@@ -15,10 +15,14 @@
 # limitations under the License.
 
 import abc
+import bisect
+import copy
 import functools
 import re
 import random
+from array import array
 from collections import defaultdict
+from operator import itemgetter
 
 
 class JoustException(Exception):
@@ -102,6 +106,42 @@ class TwoPoints(object):
         """
         return self + other
 
+    def __sub__(self, other):
+        """Subtracts another point and returns the result.
+
+        Args:
+            other: The point to subtract from this point.
+
+        Returns:
+            The new point, that is the componentwise difference of self and other.
+        """
+        return TwoPoints(self.plus - other.plus, self.minus - other.minus)
+
+    def __isub__(self, other):
+        """Subtracts another point and returns the result.
+
+        Args:
+            other: The point to subtract from this point.
+
+        Returns:
+            The new point, that is the componentwise difference of self and other.
+        """
+        return self - other
+
+    def __mul__(self, other):
+        """Multiplies both components with an integer and returns the result.
+
+        Args:
+            other: An integer, for example the number of wins.
+
+        Returns:
+            The new point, that is the componentwise product of self and other.
+        """
+        return TwoPoints(self.plus * other, self.minus * other)
+
+    def __rmul__(self, other):
+        return self * other
+
     def __str__(self):
         return '%d:%d' % (self.plus, self.minus)
 
@@ -144,6 +184,162 @@ class MatchResult(abc.ABC):
     def parse(str):
         pass
 
+    def scores(self):
+        """Returns the result as a pair of ints if possible.
+
+        This is used by tables that store results in compact arrays (see pyjoust.compact). The default implementation
+        returns None, subclasses can overwrite it.
+
+        Returns:
+            A tuple (first, second) of ints or None.
+        """
+        return None
+
+    @classmethod
+    def parse_many(cls, column):
+        """Parses a whole column of result strings at once, see ResultColumn.
+
+        Subclasses that support bulk parsing overwrite this method.
+
+        Args:
+            column: Either a list of strings or a bytes-like object with one result per line.
+
+        Returns:
+            A ResultColumn.
+
+        Raises:
+            JoustException: If bulk parsing is not supported.
+        """
+        raise JoustException('%s does not support parse_many' % cls.__name__)
+
+
+WINNERS = ('draw', 'one', 'two')
+"""The winner strings as returned by MatchResult.winner, indexed by the winner codes used in ResultColumn."""
+
+
+def tokenize_column(column, rx):
+    """Tokenizes all rows of a column with a single findall over the whole buffer.
+
+    rx must be a multiline pattern that matches every line exactly once: Its groups are the tokens of a valid line and
+    it must fall back to matching the whole line (with all groups empty) for invalid lines, see GoalScore.column_rx.
+
+    Args:
+        column: Either a list of strings or a bytes-like object with one row per line (lines are separated by "\n" or
+            "\r\n").
+        rx: The compiled str pattern, a bytes version is used for bytes-like columns.
+
+    Returns:
+        A list containing the tuple of groups of rx for each row.
+    """
+    if isinstance(column, (bytes, bytearray, memoryview)):
+        data = bytes(column)
+        if not data:
+            return []
+        rows = re.compile(rx.pattern.encode('ascii'), rx.flags & ~re.UNICODE).findall(data)
+        if data.endswith(b'\n'):
+            # findall matches the empty "line" after the last newline
+            rows.pop()
+        return rows
+    if not column:
+        return []
+    rows = rx.findall('\n'.join(map(str.strip, column)))
+    if len(rows) != len(column):
+        # a row contains a newline, tokenize each row on its own (rows with a newline are invalid)
+        empty = ('', ) * rx.groups
+        rows = []
+        for line in column:
+            m = rx.fullmatch(line.strip())
+            rows.append(empty if m is None else m.groups(''))
+    return rows
+
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def fill_int_columns(res, firsts, seconds, invalid):
+    """Converts the rows of a column to ints and stores them in res.first, res.second and res.invalid.
+
+    Args:
+        res: The ResultColumn.
+        firsts: The values of the first team, an int or a str / bytes representing an int for each row.
+        seconds: The values of the second team.
+        invalid: A sorted list of the rows that could not be parsed, their values (must be valid ints as well) are
+            replaced by 0. Rows with a value that doesn't fit into 64 bits are added.
+    """
+    try:
+        first = array('q', map(int, firsts))
+        second = array('q', map(int, seconds))
+    except OverflowError:
+        first, second = array('q'), array('q')
+        overflows = []
+        for i, (a, b) in enumerate(zip(firsts, seconds)):
+            a, b = int(a), int(b)
+            if not (_INT64_MIN <= a <= _INT64_MAX and _INT64_MIN <= b <= _INT64_MAX):
+                a = b = 0
+                overflows.append(i)
+            first.append(a)
+            second.append(b)
+        invalid = sorted(set(invalid).union(overflows))
+    for i in invalid:
+        first[i] = second[i] = 0
+    res.first, res.second, res.invalid = first, second, invalid
+
+
+class ResultColumn(abc.ABC):
+    """A column of parsed results (as returned by MatchResult.parse_many) stored in compact arrays.
+
+    Each row stores two integers, depending on the result type (goals, remaining kubbs). Rows that could not be parsed
+    (including values that don't fit into 64 bits) are stored as 0 and their indices are listed in invalid.
+
+    Attributes:
+        first: An array of ints, the value for the first team of each row.
+        second: An array of ints, the value for the second team of each row.
+        invalid: A sorted list of the indices of all rows that could not be parsed.
+    """
+
+    def __init__(self):
+        self.first = array('q')
+        self.second = array('q')
+        self.invalid = []
+
+    def __len__(self):
+        return len(self.first)
+
+    def __getitem__(self, i):
+        """Returns the result object for row i or None if the row is invalid."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('column index out of range')
+        pos = bisect.bisect_left(self.invalid, i)
+        if pos < len(self.invalid) and self.invalid[pos] == i:
+            return None
+        return self.result(i)
+
+    def add_invalid(self, i):
+        """Appends an invalid row with index i (must be called in increasing order of i)."""
+        self.first.append(0)
+        self.second.append(0)
+        self.invalid.append(i)
+
+    @abc.abstractmethod
+    def result(self, i):
+        """Creates the result object for (valid) row i."""
+        pass
+
+    def winners(self):
+        """Computes the winner of each row without creating result objects.
+
+        Returns:
+            An array of winner codes, WINNERS[code] is the string MatchResult.winner would return for the row. Invalid
+            rows have code -1.
+        """
+        res = array('b', (0 if a == b else (1 if a > b else 2) for a, b in zip(self.first, self.second)))
+        for i in self.invalid:
+            res[i] = -1
+        return res
+
 
 class GoalScore(MatchResult):
     """An implementation of MatchComparator used for games in which teams have a score (for example goals in soccer).
@@ -154,6 +350,8 @@ class GoalScore(MatchResult):
         """
 
     rx = re.compile(r"^\s*(?P<first>\d+)\s*:\s*(?P<second>\d+)\s*$")
+    # matches every line of a column, the groups are empty for invalid lines (see tokenize_column)
+    column_rx = re.compile(r"^[^\S\n]*(?:(\d+)[^\S\n]*:[^\S\n]*(\d+)[^\S\n]*$|.*)", re.MULTILINE)
 
     def __init__(self, goals_one, goals_two):
         self.goals_one = goals_one
@@ -175,6 +373,9 @@ class GoalScore(MatchResult):
         else:
             return 'two'
 
+    def scores(self):
+        return self.goals_one, self.goals_two
+
     @staticmethod
     def parse(s):
         """Parse a score string of the form "a:b" where a and b are ints.
@@ -199,6 +400,34 @@ class GoalScore(MatchResult):
                 'Must be of form "a:b" with valid integers, got ' + str(s))
         return GoalScore(first, second)
 
+    @classmethod
+    def parse_many(cls, column):
+        """Parses a column of score strings of the form "a:b", all rows are tokenized in a single pass.
+
+        Args:
+            column: Either a list of strings or a bytes-like object with one score per line.
+
+        Returns:
+            A GoalScoreColumn, invalid rows are not parsed but reported in the invalid attribute.
+        """
+        rows = tokenize_column(column, cls.column_rx)
+        res = GoalScoreColumn()
+        if rows:
+            firsts, seconds = list(map(itemgetter(0), rows)), list(map(itemgetter(1), rows))
+            invalid = [] if all(firsts) else [i for i, a in enumerate(firsts) if not a]
+            if invalid:
+                firsts, seconds = [a or 0 for a in firsts], [b or 0 for b in seconds]
+            fill_int_columns(res, firsts, seconds, invalid)
+        return res
+
+
+class GoalScoreColumn(ResultColumn):
+    """A column of GoalScore results, first and second are the goals of team one and team two.
+    """
+
+    def result(self, i):
+        return GoalScore(self.first[i], self.second[i])
+
 
 class RankCriterion(abc.ABC):
     # TODO doc me
@@ -208,6 +437,39 @@ class RankCriterion(abc.ABC):
         #may raise
         pass
 
+    def unregister_match(self, team_one, team_two, result):
+        """Removes a result that was registered before, for example because the result was changed.
+
+        Subclasses that support changing results overwrite this method. Tables rebuild criteria that don't (see
+        can_unregister) with reset after each change.
+
+        Raises:
+            JoustException: If removing results is not supported.
+        """
+        raise JoustException("%s doesn't support removing results" % type(self).__name__)
+
+    def can_unregister(self):
+        """Returns True if the criterion overwrites unregister_match."""
+        return type(self).unregister_match is not RankCriterion.unregister_match
+
+    def reset(self):
+        """Removes all registered results.
+
+        The default implementation calls __init__ again (without arguments), subclasses whose constructor requires
+        arguments overwrite this method.
+        """
+        self.__init__()
+
+    def clone(self):
+        """Returns a new criterion of the same kind without any registered results, this criterion is not changed.
+
+        Used for example for the tables of mutual matches (see MatchTable.compute_ranks). The default implementation
+        resets a deep copy.
+        """
+        criterion = copy.deepcopy(self)
+        criterion.reset()
+        return criterion
+
     def keys(self, team):
         return ()
 
@@ -222,9 +484,200 @@ class GoalsCriterion(RankCriterion):
         self.goal_count = defaultdict(int)
 
     def register_match(self, team_one, team_two, result):
-        self.check_type(result, MatchResult)
+        self.check_type(result, GoalScore)
         self.goal_count[team_one] += result.goals_one
         self.goal_count[team_two] += result.goals_two
 
+    def unregister_match(self, team_one, team_two, result):
+        self.check_type(result, GoalScore)
+        self.goal_count[team_one] -= result.goals_one
+        self.goal_count[team_two] -= result.goals_two
+
+    def reset(self):
+        self.goal_count = defaultdict(int)
+
     def keys(self, team):
         return -self.goal_count[team],
+
+
+class GoalDifferenceCriterion(RankCriterion):
+    """The goal difference: The sum of the own scores minus the sum of the opponents' scores (see MatchResult.scores).
+
+    Attributes:
+        difference: Dictionary mapping each team to its goal difference.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    @classmethod
+    def _scores(cls, result):
+        cls.check_type(result, MatchResult)
+        scores = result.scores()
+        if scores is None:
+            raise JoustException("Can't register result: %s has no scores" % type(result).__name__)
+        return scores
+
+    def register_match(self, team_one, team_two, result):
+        first, second = self._scores(result)
+        self.difference[team_one] += first - second
+        self.difference[team_two] += second - first
+
+    def unregister_match(self, team_one, team_two, result):
+        first, second = self._scores(result)
+        self.difference[team_one] -= first - second
+        self.difference[team_two] -= second - first
+
+    def reset(self):
+        self.difference = defaultdict(int)
+
+    def keys(self, team):
+        return -self.difference[team],
+
+
+class WinsCriterion(RankCriterion):
+    """The number of wins of a team.
+
+    Attributes:
+        wins: Dictionary mapping each team to its number of wins.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def _change(self, team_one, team_two, result, by):
+        self.check_type(result, MatchResult)
+        cmp = result.winner()
+        if cmp == 'one':
+            self.wins[team_one] += by
+        elif cmp == 'two':
+            self.wins[team_two] += by
+
+    def register_match(self, team_one, team_two, result):
+        self._change(team_one, team_two, result, 1)
+
+    def unregister_match(self, team_one, team_two, result):
+        self._change(team_one, team_two, result, -1)
+
+    def reset(self):
+        self.wins = defaultdict(int)
+
+    def keys(self, team):
+        return -self.wins[team],
+
+
+class OpponentCriterion(RankCriterion):
+    """Base class for criteria that depend on the scores of the opponents of a team (Swiss system tiebreaks).
+
+    Each team has a score computed from its results (win, draw and lose, by default 1, 0.5 and 0 as in chess). The
+    criterion stores all games of each team, when a result is registered only the two teams and their opponents are
+    updated: Subclasses implement _add_game (called when a game is added, before the scores change) and _add_score
+    (called for each opponent of a team whose score changes by delta).
+
+    Args:
+        win: The score for a win.
+        draw: The score for a draw.
+        lose: The score for a loss.
+
+    Attributes:
+        score: Dictionary mapping each team to its score.
+        games: Dictionary mapping each team to a list of tuples (opponent, own result, opponent result).
+        values: Dictionary mapping each team to the value of the criterion.
+    """
+
+    def __init__(self, win=1, draw=0.5, lose=0):
+        self.win, self.draw, self.lose = win, draw, lose
+        self.reset()
+
+    def reset(self):
+        self.score = defaultdict(int)
+        self.games = defaultdict(list)
+        self.values = defaultdict(int)
+
+    def clone(self):
+        return type(self)(self.win, self.draw, self.lose)
+
+    def _results(self, result):
+        self.check_type(result, MatchResult)
+        cmp = result.winner()
+        if cmp == 'draw':
+            return self.draw, self.draw
+        elif cmp == 'one':
+            return self.win, self.lose
+        else:
+            return self.lose, self.win
+
+    def register_match(self, team_one, team_two, result):
+        res_one, res_two = self._results(result)
+        self.games[team_one].append((team_two, res_one, res_two))
+        self.games[team_two].append((team_one, res_two, res_one))
+        self._add_game(team_one, team_two, res_one, res_two, 1)
+        self._change_score(team_one, res_one)
+        self._change_score(team_two, res_two)
+
+    def unregister_match(self, team_one, team_two, result):
+        res_one, res_two = self._results(result)
+        # exact reverse of register_match
+        self._change_score(team_two, -res_two)
+        self._change_score(team_one, -res_one)
+        self._add_game(team_one, team_two, res_one, res_two, -1)
+        self.games[team_one].remove((team_two, res_one, res_two))
+        self.games[team_two].remove((team_one, res_two, res_one))
+
+    def _change_score(self, team, delta):
+        self.score[team] += delta
+        for opponent, _, opponent_result in self.games[team]:
+            self._add_score(opponent, opponent_result, delta)
+
+    @abc.abstractmethod
+    def _add_game(self, team_one, team_two, res_one, res_two, sign):
+        pass
+
+    @abc.abstractmethod
+    def _add_score(self, team, result, delta):
+        pass
+
+    def keys(self, team):
+        return -self.values[team],
+
+
+class BuchholzCriterion(OpponentCriterion):
+    """The Buchholz score: The sum of the scores of all opponents of a team.
+    """
+
+    def _add_game(self, team_one, team_two, res_one, res_two, sign):
+        self.values[team_one] += sign * self.score[team_two]
+        self.values[team_two] += sign * self.score[team_one]
+
+    def _add_score(self, team, result, delta):
+        self.values[team] += delta
+
+
+class MedianBuchholzCriterion(BuchholzCriterion):
+    """The median Buchholz score: The Buchholz score without the highest and the lowest opponent score.
+
+    The highest and lowest score are only removed if a team has played at least three games.
+    """
+
+    def keys(self, team):
+        value = self.values[team]
+        games = self.games[team]
+        if len(games) >= 3:
+            scores = [self.score[opponent] for opponent, _, _ in games]
+            value -= max(scores) + min(scores)
+        return -value,
+
+
+class SonnebornBergerCriterion(OpponentCriterion):
+    """The Sonneborn-Berger score: The sum of the scores of the opponents weighted with the result against them.
+
+    That is the score of each defeated opponent is added and (with the default values) half of the score of each
+    opponent with a draw.
+    """
+
+    def _add_game(self, team_one, team_two, res_one, res_two, sign):
+        self.values[team_one] += sign * res_one * self.score[team_two]
+        self.values[team_two] += sign * res_two * self.score[team_one]
+
+    def _add_score(self, team, result, delta):
+        self.values[team] += result * delta